@@ -0,0 +1,141 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import collections
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import tensorflow as tf
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def list_image_files(image_path):
+  """Lists the image files in the directory, in sorted order.
+
+  Only the files with the image extensions are listed, the directories and
+  the other files such as `.DS_Store` or `README` are ignored.
+
+  Args:
+    image_path: path to the directory storing image files.
+
+  Returns:
+    a list of filenames.
+  """
+  return sorted(
+      filename for filename in os.listdir(image_path)
+      if filename.lower().endswith(IMAGE_EXTENSIONS) and
+      not os.path.isdir(os.path.join(image_path, filename)))
+
+
+def _iterate_batches(pool, items, load_fn, batch_size, max_pending_batches):
+  """Loads the items in the thread pool and groups them into batches.
+
+  At most `max_pending_batches` batches are loaded ahead of the consumer, so
+  the memory does not grow with the number of items.
+
+  Args:
+    pool: a ThreadPool instance.
+    items: a list of items to be loaded.
+    load_fn: a callable that takes an item and returns an (inputs, context)
+      tuple, `inputs` is a numpy array of the same shape for all the items.
+      The items for which it returns None are skipped.
+    batch_size: batch size.
+    max_pending_batches: maximum number of batches to load ahead.
+
+  Yields:
+    items: a list of items in the batch.
+    inputs: a [batch, ...] numpy array, the stacked inputs.
+    contexts: a list of contexts of the items.
+  """
+  max_pending_items = batch_size * max_pending_batches
+  pending = collections.deque()
+  item_iter = iter(items)
+  end_of_items = object()
+
+  def _submit():
+    while len(pending) < max_pending_items:
+      item = next(item_iter, end_of_items)
+      if item is end_of_items:
+        break
+      pending.append((item, pool.apply_async(load_fn, (item,))))
+
+  _submit()
+  while pending:
+    batch_items, batch_inputs, batch_contexts = [], [], []
+    while pending and len(batch_items) < batch_size:
+      item, result = pending.popleft()
+      loaded = result.get()
+      if loaded is None:
+        tf.logging.warn('Failed to load %s, skipped.', item)
+        continue
+      inputs, context = loaded
+      batch_items.append(item)
+      batch_inputs.append(inputs)
+      batch_contexts.append(context)
+    _submit()
+    if batch_items:
+      yield batch_items, np.stack(batch_inputs, axis=0), batch_contexts
+
+
+def run_batched_inference(items,
+                          load_fn,
+                          predict_fn,
+                          write_fn,
+                          batch_size=32,
+                          num_reader_threads=4,
+                          num_writer_threads=4,
+                          max_pending_batches=2):
+  """Runs the inference in batches, with the I/O in thread pools.
+
+  The reader pool decodes the items into fixed-size inputs, `predict_fn` runs
+  once per batch in the calling thread, and the writer pool post-processes
+  and saves the results of each item. Both the loaded and the unwritten
+  batches are bounded by `max_pending_batches`.
+
+  Args:
+    items: a list of items, e.g. image paths.
+    load_fn: a callable that takes an item and returns an (inputs, context)
+      tuple, `inputs` is a numpy array of the same shape for all the items and
+      `context` is passed through to the `write_fn`. The items for which it
+      returns None, e.g. unreadable images, are skipped with a warning.
+    predict_fn: a callable that takes a [batch, ...] numpy array and returns a
+      list of [batch, ...] numpy arrays, e.g. a `sess.run` call.
+    write_fn: a callable that takes the item, its context, and a list of its
+      outputs sliced from the results of the `predict_fn`.
+    batch_size: batch size.
+    num_reader_threads: number of threads to load the items.
+    num_writer_threads: number of threads to write the results.
+    max_pending_batches: maximum number of batches to load ahead, or to wait
+      for writing.
+
+  Returns:
+    number of processed items, excluding the skipped ones.
+  """
+  reader_pool = ThreadPool(num_reader_threads)
+  writer_pool = ThreadPool(num_writer_threads)
+  pending = collections.deque()
+  count = 0
+  try:
+    for batch_items, batch_inputs, batch_contexts in _iterate_batches(
+        reader_pool, items, load_fn, batch_size, max_pending_batches):
+      outputs = predict_fn(batch_inputs)
+
+      for i, (item, context) in enumerate(zip(batch_items, batch_contexts)):
+        pending.append(
+            writer_pool.apply_async(write_fn,
+                                    (item, context, [x[i] for x in outputs])))
+      while len(pending) > batch_size * max_pending_batches:
+        pending.popleft().get()
+
+      count += len(batch_items)
+      tf.logging.info('Processed %i/%i items.', count, len(items))
+
+    while pending:
+      pending.popleft().get()
+  finally:
+    reader_pool.terminate()
+    writer_pool.terminate()
+  return count
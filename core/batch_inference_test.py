@@ -0,0 +1,113 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import threading
+import numpy as np
+import tensorflow as tf
+
+from core import batch_inference
+
+
+class BatchInferenceTest(tf.test.TestCase):
+
+  def test_run_batched_inference(self):
+    batch_sizes = []
+    results = {}
+    lock = threading.Lock()
+
+    def _load_fn(item):
+      return np.full([2, 3], item, dtype=np.float32), item * 10
+
+    def _predict_fn(inputs):
+      batch_sizes.append(inputs.shape[0])
+      return [inputs.sum(axis=(1, 2)), inputs[:, 0, 0] + 1]
+
+    def _write_fn(item, context, outputs):
+      with lock:
+        results[item] = (context, outputs[0], outputs[1])
+
+    count = batch_inference.run_batched_inference(
+        list(range(10)),
+        _load_fn,
+        _predict_fn,
+        _write_fn,
+        batch_size=4,
+        num_reader_threads=3,
+        num_writer_threads=2,
+        max_pending_batches=1)
+
+    self.assertEqual(count, 10)
+    self.assertAllEqual(batch_sizes, [4, 4, 2])
+    self.assertEqual(len(results), 10)
+    for item in range(10):
+      context, total, first = results[item]
+      self.assertEqual(context, item * 10)
+      self.assertAllClose(total, item * 6)
+      self.assertAllClose(first, item + 1)
+
+  def test_run_batched_inference_raises(self):
+
+    def _load_fn(item):
+      if item == 5:
+        raise IOError('Failed to load %i.' % item)
+      return np.zeros([2]), None
+
+    with self.assertRaises(IOError):
+      batch_inference.run_batched_inference(
+          list(range(10)),
+          _load_fn,
+          lambda inputs: [inputs],
+          lambda item, context, outputs: None,
+          batch_size=4)
+
+  def test_list_image_files(self):
+    image_path = os.path.join(self.get_temp_dir(), 'images')
+    os.makedirs(os.path.join(image_path, 'subdir.jpg'))
+    for filename in ['b.jpg', 'a.PNG', 'c.jpeg', '.DS_Store', 'README']:
+      with open(os.path.join(image_path, filename), 'w') as fid:
+        fid.write('data')
+
+    self.assertAllEqual(
+        batch_inference.list_image_files(image_path),
+        ['a.PNG', 'b.jpg', 'c.jpeg'])
+
+  def test_run_batched_inference_skips_unreadable_items(self):
+    batch_sizes = []
+    written = []
+    lock = threading.Lock()
+
+    def _load_fn(item):
+      if item in [1, 4, 5, 6, 7]:
+        return None
+      return np.full([2], item, dtype=np.float32), None
+
+    def _predict_fn(inputs):
+      batch_sizes.append(inputs.shape[0])
+      return [inputs[:, 0]]
+
+    def _write_fn(item, context, outputs):
+      with lock:
+        written.append((item, float(outputs[0])))
+
+    with tf.test.mock.patch.object(tf.logging, 'warn') as mock_warn:
+      count = batch_inference.run_batched_inference(
+          list(range(10)),
+          _load_fn,
+          _predict_fn,
+          _write_fn,
+          batch_size=4,
+          max_pending_batches=1)
+      self.assertEqual(mock_warn.call_count, 5)
+
+    # The batch of items 4-7 is entirely skipped.
+
+    self.assertEqual(count, 5)
+    self.assertAllEqual(batch_sizes, [3, 2])
+    self.assertAllEqual(
+        sorted(written), [(0, 0.0), (2, 2.0), (3, 3.0), (8, 8.0), (9, 9.0)])
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -5,6 +5,11 @@ from __future__ import print_function
 import numpy as np
 import tensorflow as tf
 
+# Normalized coordinates are quantized to uint16, the maximum rounding error
+# is 0.5 / _QUANTIZATION_SCALE (7.6e-6, or 0.008 pixel on a 1000-pixel side).
+
+_QUANTIZATION_SCALE = 65535.0
+
 
 def scale_to_new_size(box, img_shape, pad_shape):
   """Scales to new image size.
@@ -41,6 +46,21 @@ def flip_left_right(box):
   return box
 
 
+def decode_quantized_boxes(encoded_box):
+  """Decodes the boxes encoded by `py_encode_quantized_boxes`.
+
+  Args:
+    encoded_box: A scalar string tensor.
+
+  Returns:
+    A [num_boxes, 4] float tensor.
+  """
+  with tf.name_scope('decode_quantized_boxes'):
+    box = tf.decode_raw(encoded_box, out_type=tf.uint16, little_endian=True)
+    box = tf.reshape(box, [-1, 4])
+    return tf.to_float(box) / _QUANTIZATION_SCALE
+
+
 def area(box):
   """Compute the area of the box.
 
@@ -97,6 +117,70 @@ def iou(box1, box2):
   return iou_v
 
 
+def _pairwise_iou(box1, box2):
+  """Computes the pairwise IoU, see `pairwise_iou`."""
+  ymin1, xmin1, ymax1, xmax1 = tf.unstack(tf.expand_dims(box1, -2), axis=-1)
+  ymin2, xmin2, ymax2, xmax2 = tf.unstack(tf.expand_dims(box2, -3), axis=-1)
+
+  inter = tf.multiply(
+      tf.maximum(tf.minimum(xmax1, xmax2) - tf.maximum(xmin1, xmin2), 0.0),
+      tf.maximum(tf.minimum(ymax1, ymax2) - tf.maximum(ymin1, ymin2), 0.0))
+  area1 = tf.multiply(
+      tf.maximum(xmax1 - xmin1, 0.0), tf.maximum(ymax1 - ymin1, 0.0))
+  area2 = tf.multiply(
+      tf.maximum(xmax2 - xmin2, 0.0), tf.maximum(ymax2 - ymin2, 0.0))
+  return inter / (area1 + area2 - inter)
+
+
+def pairwise_iou(box1, box2, block_size=None):
+  """Computes the pairwise Intersection-over-Union between box1 and box2.
+
+  The leading dimensions are broadcasted, e.g., [batch, N, 4] and [1, M, 4]
+  give [batch, N, M].
+
+  Args:
+    box1: A [..., N, 4] float tensor.
+    box2: A [..., M, 4] float tensor.
+    block_size: if set, process box1 in blocks of `block_size` boxes
+      sequentially, so that the peak memory of the intermediate tensors is
+      bounded by [..., block_size, M]. Only rank 2 or 3 inputs are supported.
+
+  Returns:
+    iou: A [..., N, M] float tensor.
+
+  Raises:
+    ValueError: if block_size is set and the inputs are of unsupported rank.
+  """
+  with tf.name_scope('box_pairwise_iou'):
+    if block_size is None:
+      return _pairwise_iou(box1, box2)
+
+    rank = box1.get_shape().ndims
+    if rank not in [2, 3] or box2.get_shape().ndims != rank:
+      raise ValueError('Block mode requires inputs of the same rank 2 or 3.')
+
+    num_boxes = tf.shape(box1)[-2]
+    num_blocks = (num_boxes + block_size - 1) // block_size
+
+    # The blocks are concatenated along the first axis of the TensorArray.
+
+    perm = [1, 0, 2] if rank == 3 else [0, 1]
+
+    def _body(i, iou_array):
+      block = box1[..., i * block_size:(i + 1) * block_size, :]
+      return i + 1, iou_array.write(
+          i, tf.transpose(_pairwise_iou(block, box2), perm))
+
+    _, iou_array = tf.while_loop(
+        lambda i, _: i < num_blocks,
+        _body, [
+            tf.constant(0),
+            tf.TensorArray(box1.dtype, size=num_blocks, infer_shape=False)
+        ],
+        parallel_iterations=1)
+    return tf.transpose(iou_array.concat(), perm)
+
+
 def py_area(box):
   """Compute the area of the box.
 
@@ -149,6 +233,54 @@ def py_iou(box1, box2):
   return iou_v
 
 
+def _py_pairwise_iou(box1, box2):
+  """Computes the pairwise IoU, see `py_pairwise_iou`."""
+  ymin1, xmin1, ymax1, xmax1 = [box1[..., :, None, i] for i in range(4)]
+  ymin2, xmin2, ymax2, xmax2 = [box2[..., None, :, i] for i in range(4)]
+
+  inter = np.multiply(
+      np.maximum(np.minimum(xmax1, xmax2) - np.maximum(xmin1, xmin2), 0.0),
+      np.maximum(np.minimum(ymax1, ymax2) - np.maximum(ymin1, ymin2), 0.0))
+  area1 = np.multiply(
+      np.maximum(xmax1 - xmin1, 0.0), np.maximum(ymax1 - ymin1, 0.0))
+  area2 = np.multiply(
+      np.maximum(xmax2 - xmin2, 0.0), np.maximum(ymax2 - ymin2, 0.0))
+  with np.errstate(divide='ignore', invalid='ignore'):
+    iou_v = inter / (area1 + area2 - inter)
+  return iou_v
+
+
+def py_pairwise_iou(box1, box2, block_size=None):
+  """Computes the pairwise Intersection-over-Union between box1 and box2.
+
+  The leading dimensions are broadcasted, e.g., [batch, N, 4] and [M, 4] give
+  [batch, N, M].
+
+  Args:
+    box1: A [..., N, 4] float np array.
+    box2: A [..., M, 4] float np array.
+    block_size: if set, process box1 in blocks of `block_size` boxes, so that
+      the peak memory of the intermediate arrays is bounded by
+      [..., block_size, M].
+
+  Returns:
+    iou: A [..., N, M] float np array.
+  """
+  box1, box2 = np.asarray(box1), np.asarray(box2)
+  if block_size is None or box1.shape[-2] <= block_size:
+    return _py_pairwise_iou(box1, box2)
+
+  iou_v = None
+  for i in range(0, box1.shape[-2], block_size):
+    block = _py_pairwise_iou(box1[..., i:i + block_size, :], box2)
+    if iou_v is None:
+      shape = list(block.shape)
+      shape[-2] = box1.shape[-2]
+      iou_v = np.empty(shape, dtype=block.dtype)
+    iou_v[..., i:i + block_size, :] = block
+  return iou_v
+
+
 def py_evaluate_precision_and_recall(num_gt_boxes,
                                      gt_boxes,
                                      gt_labels,
@@ -158,6 +290,10 @@ def py_evaluate_precision_and_recall(num_gt_boxes,
                                      iou_threshold=0.5):
   """Evaluates the detection precision.
 
+  Detections are matched greedily in the given order (e.g., score order), a
+  detection claims every unclaimed ground-truth box having the same label and
+  IoU larger than the threshold.
+
   Args:
     num_gt_boxes: Number of ground-truth boxes.
     gt_boxes: Ground-truth boxes.
@@ -170,17 +306,27 @@ def py_evaluate_precision_and_recall(num_gt_boxes,
     recall_mask: Boolean list of length len(dt_boxes).
     precision_mask: Boolean list of length len(dt_boxes).
   """
-  recall_mask = np.zeros((len(gt_boxes)), dtype=np.bool)
-  precision_mask = np.zeros((len(dt_boxes)), dtype=np.bool)
-
-  for i in range(num_dt_boxes):
-    for j in range(num_gt_boxes):
-      iou_v = py_iou(
-          np.expand_dims(dt_boxes[i], 0), np.expand_dims(gt_boxes[j], 0))
-      if not recall_mask[j] and (
-          dt_labels[i] == gt_labels[j]) and iou_v[0] > iou_threshold:
-        recall_mask[j] = True
-        precision_mask[i] = True
+  recall_mask = np.zeros((len(gt_boxes)), dtype=bool)
+  precision_mask = np.zeros((len(dt_boxes)), dtype=bool)
+
+  if num_dt_boxes <= 0 or num_gt_boxes <= 0:
+    return recall_mask, precision_mask
+
+  # Compute the [num_dt_boxes, num_gt_boxes] candidate matches at once.
+
+  iou_v = py_pairwise_iou(
+      np.asarray(dt_boxes[:num_dt_boxes]), np.asarray(gt_boxes[:num_gt_boxes]))
+  candidates = np.logical_and(
+      np.expand_dims(np.asarray(dt_labels[:num_dt_boxes]), 1) == np.asarray(
+          gt_labels[:num_gt_boxes]), iou_v > iou_threshold)
+
+  # Only the detections having candidates need the sequential greedy pass.
+
+  for i in np.flatnonzero(candidates.any(axis=1)):
+    matches = np.logical_and(candidates[i], ~recall_mask[:num_gt_boxes])
+    if matches.any():
+      recall_mask[:num_gt_boxes] |= matches
+      precision_mask[i] = True
 
   return recall_mask, precision_mask
 
@@ -197,3 +343,30 @@ def py_coord_norm_to_abs(box, height, width):
   ymin, xmin, ymax, xmax = [box[:, i] for i in range(4)]
   box = np.stack([ymin * height, xmin * width, ymax * height, xmax * width], axis=-1)
   return box
+
+
+def py_encode_quantized_boxes(box):
+  """Encodes normalized boxes to the bytes of uint16 coordinates.
+
+  Args:
+    box: A [batch, 4] float np array, coordinates are clipped to [0, 1].
+
+  Returns:
+    A bytes object of length 8 * batch.
+  """
+  box = np.clip(np.asarray(box, dtype=np.float64).reshape([-1, 4]), 0.0, 1.0)
+  box = np.round(box * _QUANTIZATION_SCALE).astype('<u2')
+  return box.tobytes()
+
+
+def py_decode_quantized_boxes(encoded_box):
+  """Decodes the boxes encoded by `py_encode_quantized_boxes`.
+
+  Args:
+    encoded_box: A bytes object.
+
+  Returns:
+    A [batch, 4] float32 np array.
+  """
+  box = np.frombuffer(encoded_box, dtype='<u2').reshape([-1, 4])
+  return box.astype(np.float32) / _QUANTIZATION_SCALE
@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
+import numpy as np
 import tensorflow as tf
 
 import box_utils
@@ -106,6 +107,99 @@ class BoxUtilsTest(tf.test.TestCase):
           })
       self.assertAllClose(iou, [0.25, 1.0 / 6, 1.0 / 6, 0.0, 0.0])
 
+  def testDecodeQuantizedBoxes(self):
+    """Test decode_quantized_boxes."""
+    tf.reset_default_graph()
+    boxes = np.random.uniform(size=[100, 4])
+    encoded = box_utils.py_encode_quantized_boxes(boxes)
+    self.assertEqual(len(encoded), 100 * 8)
+
+    encoded_box = tf.placeholder(dtype=tf.string, shape=[])
+    decoded = box_utils.decode_quantized_boxes(encoded_box)
+
+    with self.test_session() as sess:
+      decoded = sess.run(decoded, feed_dict={encoded_box: encoded})
+      self.assertAllClose(decoded, boxes, atol=0.5 / 65535 + 1e-7)
+      self.assertAllClose(
+          decoded, box_utils.py_decode_quantized_boxes(encoded), atol=1e-7)
+
+    # Coordinates are clipped to [0, 1].
+
+    self.assertAllClose(
+        box_utils.py_decode_quantized_boxes(
+            box_utils.py_encode_quantized_boxes([[-0.5, 0.0, 1.0, 1.5]])),
+        [[0.0, 0.0, 1.0, 1.0]])
+
+  def testPyPairwiseIoU(self):
+    """Test py_pairwise_iou."""
+    box1 = np.array([[0.0, 0.0, 2.0, 2.0], [1.0, 1.0, 2.0, 2.0]])
+    box2 = np.array([[1.0, 1.0, 2.0, 2.0], [0.0, 0.0, 2.0, 3.0],
+                     [3.0, 3.0, 4.0, 4.0]])
+    self.assertAllClose(
+        box_utils.py_pairwise_iou(box1, box2),
+        [[0.25, 4.0 / 6, 0.0], [1.0, 1.0 / 6, 0.0]])
+
+  def testPyPairwiseIoUBroadcastAndBlock(self):
+    """Test py_pairwise_iou with broadcasting and the block-tiled mode."""
+    box1 = np.random.uniform(size=[2, 7, 4])
+    box1[..., 2:] += box1[..., :2]
+    box2 = np.random.uniform(size=[5, 4])
+    box2[..., 2:] += box2[..., :2]
+
+    iou_v = box_utils.py_pairwise_iou(box1, box2)
+    self.assertEqual(iou_v.shape, (2, 7, 5))
+    self.assertAllClose(iou_v[1], box_utils.py_pairwise_iou(box1[1], box2))
+    self.assertAllClose(
+        box_utils.py_pairwise_iou(box1, box2, block_size=3), iou_v)
+
+  def testPairwiseIoU(self):
+    """Test pairwise_iou."""
+    tf.reset_default_graph()
+    box1 = np.random.uniform(size=[2, 7, 4]).astype(np.float32)
+    box1[..., 2:] += box1[..., :2]
+    box2 = np.random.uniform(size=[2, 5, 4]).astype(np.float32)
+    box2[..., 2:] += box2[..., :2]
+
+    box1_placeholder = tf.placeholder(tf.float32, shape=[None, None, 4])
+    box2_placeholder = tf.placeholder(tf.float32, shape=[None, None, 4])
+    iou = box_utils.pairwise_iou(box1_placeholder, box2_placeholder)
+    iou_block = box_utils.pairwise_iou(
+        box1_placeholder, box2_placeholder, block_size=3)
+    iou_broadcast = box_utils.pairwise_iou(box1_placeholder,
+                                           box2_placeholder[:1])
+
+    with self.test_session() as sess:
+      feed_dict = {box1_placeholder: box1, box2_placeholder: box2}
+      iou_v, iou_block_v, iou_broadcast_v = sess.run(
+          [iou, iou_block, iou_broadcast], feed_dict=feed_dict)
+
+    self.assertAllClose(iou_v[0], box_utils.py_pairwise_iou(box1[0], box2[0]))
+    self.assertAllClose(iou_v[1], box_utils.py_pairwise_iou(box1[1], box2[1]))
+    self.assertAllClose(iou_block_v, iou_v)
+    self.assertAllClose(iou_broadcast_v,
+                        box_utils.py_pairwise_iou(box1, box2[0]))
+
+  def testPyEvaluatePrecisionAndRecall(self):
+    """Test py_evaluate_precision_and_recall."""
+    gt_boxes = np.array([[0.0, 0.0, 1.0, 1.0], [0.0, 0.0, 0.9, 1.0],
+                         [0.5, 0.5, 1.0, 1.0], [0.0, 0.0, 0.0, 0.0]])
+    gt_labels = np.array([b'cat', b'cat', b'dog', b''])
+    dt_boxes = np.array([[0.0, 0.0, 1.0, 1.0], [0.0, 0.0, 1.0, 1.0],
+                         [0.5, 0.5, 1.0, 1.0], [0.5, 0.5, 1.0, 1.0]])
+    dt_labels = np.array([b'cat', b'cat', b'cat', b'dog'])
+
+    # The first detection claims both of the cat boxes.
+
+    recall_mask, precision_mask = box_utils.py_evaluate_precision_and_recall(
+        3, gt_boxes, gt_labels, 4, dt_boxes, dt_labels)
+    self.assertAllEqual(recall_mask, [True, True, True, False])
+    self.assertAllEqual(precision_mask, [True, False, False, True])
+
+    recall_mask, precision_mask = box_utils.py_evaluate_precision_and_recall(
+        3, gt_boxes, gt_labels, 1, dt_boxes, dt_labels)
+    self.assertAllEqual(recall_mask, [True, True, False, False])
+    self.assertAllEqual(precision_mask, [True, False, False, False])
+
 
 if __name__ == "__main__":
   tf.test.main()
@@ -4,6 +4,7 @@ from __future__ import print_function
 
 import tensorflow as tf
 from core import imgproc
+from core import nms
 from core import utils
 
 from protos import image_resizer_pb2
@@ -28,14 +29,17 @@ def build_post_processor(options):
     raise ValueError(
         'The options has to be an instance of post_process_pb2.PostProcess.')
 
+  if (options.nms_type == post_process_pb2.PostProcess.VECTORIZED_NMS and
+      options.max_candidates_per_class <= 0):
+    raise ValueError(
+        'The max_candidates_per_class has to be positive for VECTORIZED_NMS.')
+
   def _post_process(boxes, scores, additional_fields=None):
     """Applies post process to get the final detections.
 
     Args:
-      boxes: A [batch_size, num_anchors, q, 4] float32 tensor containing
-        detections. If `q` is 1 then same boxes are used for all classes
-          otherwise, if `q` is equal to number of classes, class-specific boxes
-          are used.
+      boxes: A [batch_size, num_anchors, 4] float32 tensor containing
+        detections, the same boxes are used for all classes.
       scores: A [batch_size, num_anchors, num_classes] float32 tensor containing
         the scores for each of the `num_anchors` detections. The scores have to be
         non-negative when use_static_shapes is set True.
@@ -52,6 +56,20 @@ def build_post_processor(options):
       nmsed_classes: A [batch_size, max_detections] float32 tensor
         containing the class for boxes.
     """
+    if options.nms_type == post_process_pb2.PostProcess.VECTORIZED_NMS:
+      (num_detections, nmsed_boxes, nmsed_scores, nmsed_classes,
+       nmsed_additional_fields) = nms.batch_multiclass_non_max_suppression(
+           boxes,
+           scores,
+           score_thresh=options.score_thresh,
+           iou_thresh=options.iou_thresh,
+           max_size_per_class=options.max_size_per_class,
+           max_total_size=options.max_total_size,
+           max_candidates_per_class=options.max_candidates_per_class,
+           additional_fields=additional_fields)
+      return (num_detections, nmsed_boxes, nmsed_scores, nmsed_classes + 1,
+              nmsed_additional_fields)
+
     boxes = tf.expand_dims(boxes, axis=2)
     (nmsed_boxes, nmsed_scores, nmsed_classes, _, nmsed_additional_fields,
      num_detections) = batch_multiclass_non_max_suppression(
@@ -67,9 +85,25 @@ def build_post_processor(options):
   return _post_process
 
 
+def _scale_size(size, scale):
+  """Scales an image dimension.
+
+  Args:
+    size: A scalar int tensor or python int.
+    scale: A scalar float tensor or python float.
+
+  Returns:
+    A scalar int32 tensor.
+  """
+  return tf.to_int32(tf.round(tf.to_float(size) * scale))
+
+
 def build_image_resizer(options):
   """Builds image resizing function.
 
+  The returned callable optionally takes a `scale` argument, the image is then
+  resized to `scale` times the size denoted by the options, in a single pass.
+
   Args:
     options: An image_resizer_pb2.ImageResizer instance.
 
@@ -87,27 +121,40 @@ def build_image_resizer(options):
 
   if 'default_resizer' == image_resizer_oneof:
 
-    def _default_resize_fn(image):
+    def _default_resize_fn(image, scale=None):
       image_shape = utils.get_tensor_shape(image)
-      return tf.cast(image, tf.float32), image_shape
+      if scale is None:
+        return tf.cast(image, tf.float32), image_shape
+      return imgproc.resize_image_to_size(
+          image,
+          new_height=_scale_size(image_shape[0], scale),
+          new_width=_scale_size(image_shape[1], scale))
 
     return _default_resize_fn
 
   if 'fixed_shape_resizer' == image_resizer_oneof:
     options = options.fixed_shape_resizer
 
-    def _fixed_shape_resize_fn(image):
+    def _fixed_shape_resize_fn(image, scale=None):
+      if scale is None:
+        return imgproc.resize_image_to_size(
+            image, new_height=options.height, new_width=options.width)
       return imgproc.resize_image_to_size(
-          image, new_height=options.height, new_width=options.width)
+          image,
+          new_height=_scale_size(options.height, scale),
+          new_width=_scale_size(options.width, scale))
 
     return _fixed_shape_resize_fn
 
   if 'keep_aspect_ratio_resizer' == image_resizer_oneof:
     options = options.keep_aspect_ratio_resizer
 
-    def _keep_aspect_ratio_resize_fn(image):
+    def _keep_aspect_ratio_resize_fn(image, scale=None):
+      min_dimension = options.min_dimension
+      if scale is not None:
+        min_dimension = tf.to_float(min_dimension) * scale
       return imgproc.resize_image_to_min_dimension(
-          image, min_dimension=options.min_dimension)
+          image, min_dimension=min_dimension)
 
     return _keep_aspect_ratio_resize_fn
 
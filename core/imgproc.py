@@ -351,3 +351,49 @@ def resize_image_to_min_dimension(image,
         image, new_size[:-1], method=method, align_corners=align_corners)
 
     return new_image, new_size
+
+
+def decode_jpeg_downscaled(encoded_jpeg,
+                           min_height=0,
+                           min_width=0,
+                           min_dimension=0,
+                           channels=3):
+  """Decodes a JPEG image, downscaled in the DCT domain when possible.
+
+  The largest scaling ratio among 8, 4, 2 that keeps the decoded image no
+  smaller than the required size is used, so that the IDCT does not run at
+  the full resolution if the image is to be shrunk afterwards.
+
+  Args:
+    encoded_jpeg: A scalar string tensor of the JPEG-encoded image.
+    min_height: minimum height of the decoded image.
+    min_width: minimum width of the decoded image.
+    min_dimension: minimum size of the smaller dimension of the decoded image.
+    channels: number of color channels of the decoded image.
+
+  Returns:
+    image: A [height, width, channels] uint8 tensor.
+    image_shape: A 1D int32 tensor of shape [3] containing the shape of the
+      image at the full resolution.
+  """
+  with tf.name_scope("decode_jpeg_downscaled"):
+    image_shape = tf.image.extract_jpeg_shape(encoded_jpeg)
+    height, width = image_shape[0], image_shape[1]
+
+    def _fits(ratio):
+      # Note: libjpeg rounds up the scaled size.
+      new_height = (height + ratio - 1) // ratio
+      new_width = (width + ratio - 1) // ratio
+      return tf.logical_and(
+          tf.logical_and(new_height >= min_height, new_width >= min_width),
+          tf.minimum(new_height, new_width) >= min_dimension)
+
+    def _decode_fn(ratio):
+      return lambda: tf.image.decode_jpeg(
+          encoded_jpeg, channels=channels, ratio=ratio)
+
+    image = tf.case([(_fits(ratio), _decode_fn(ratio)) for ratio in [8, 4, 2]],
+                    default=_decode_fn(1),
+                    exclusive=False)
+    image.set_shape([None, None, channels])
+    return image, tf.stack([height, width, channels])
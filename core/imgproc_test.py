@@ -217,6 +217,28 @@ class ImgProcTest(tf.test.TestCase):
       self.assertEqual(img.shape, (1200, 900, 3))
       self.assertAllEqual(img_shape, [1200, 900, 3])
 
+  def test_decode_jpeg_downscaled(self):
+    tf.reset_default_graph()
+
+    encoded_jpeg = tf.image.encode_jpeg(tf.zeros([400, 600, 3], tf.uint8))
+
+    with self.test_session() as sess:
+      img, img_shape = sess.run(
+          imgproc.decode_jpeg_downscaled(encoded_jpeg, min_dimension=100))
+      self.assertEqual(img.shape, (100, 150, 3))
+      self.assertAllEqual(img_shape, [400, 600, 3])
+
+      img, img_shape = sess.run(
+          imgproc.decode_jpeg_downscaled(
+              encoded_jpeg, min_height=150, min_width=150))
+      self.assertEqual(img.shape, (200, 300, 3))
+      self.assertAllEqual(img_shape, [400, 600, 3])
+
+      img, img_shape = sess.run(
+          imgproc.decode_jpeg_downscaled(encoded_jpeg, min_dimension=448))
+      self.assertEqual(img.shape, (400, 600, 3))
+      self.assertAllEqual(img_shape, [400, 600, 3])
+
 
 #  def test_calc_box_saliency(self):
 #    tf.reset_default_graph()
@@ -0,0 +1,220 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+
+from core import box_utils
+
+
+def _batch_gather(params, indices):
+  """Gathers the values of each batch item.
+
+  Args:
+    params: A [batch, n, ...] tensor.
+    indices: A [batch, ...] int32 tensor, indices into the second dimension.
+
+  Returns:
+    A tensor of shape indices.shape + params.shape[2:].
+  """
+  batch_indices = tf.zeros_like(indices) + tf.reshape(
+      tf.range(tf.shape(indices)[0]),
+      tf.concat([[-1], tf.ones_like(tf.shape(indices)[1:])], 0))
+  return tf.gather_nd(params, tf.stack([batch_indices, indices], axis=-1))
+
+
+def select_top_k_per_class(boxes, scores, k):
+  """Selects the top-k scoring boxes of each class.
+
+  Args:
+    boxes: A [batch, num_boxes, 4] float tensor.
+    scores: A [batch, num_boxes, num_classes] float tensor.
+    k: An int scalar, number of boxes selected per class. It is clamped to
+      the number of boxes.
+
+  Returns:
+    top_k_boxes: A [batch, num_classes, k, 4] float tensor.
+    top_k_scores: A [batch, num_classes, k] float tensor, sorted in descending
+      order.
+    top_k_indices: A [batch, num_classes, k] int32 tensor, indices into the
+      boxes.
+  """
+  with tf.name_scope('select_top_k_per_class'):
+    k = tf.minimum(tf.shape(scores)[1], k)
+    top_k_scores, top_k_indices = tf.nn.top_k(
+        tf.transpose(scores, [0, 2, 1]), k=k)
+    top_k_indices = tf.to_int32(top_k_indices)
+    top_k_boxes = _batch_gather(boxes, top_k_indices)
+  return top_k_boxes, top_k_scores, top_k_indices
+
+
+def _greedy_suppression(candidate_valid, iou, iou_thresh, max_size_per_class):
+  """Runs the greedy NMS for all the images and classes at once.
+
+  The candidates are sorted by score in descending order, so the i-th step
+  decides if the i-th candidate of every image and class is selected.
+
+  Args:
+    candidate_valid: A [batch, num_classes, k] boolean tensor.
+    iou: A [batch, num_classes, k, k] float tensor, the pairwise IoU of the
+      candidates.
+    iou_thresh: A float, suppress the candidates overlapping the selected
+      ones with IoU larger than this value.
+    max_size_per_class: Maximum number of selected candidates per class.
+
+  Returns:
+    selected: A [batch, num_classes, k] boolean tensor.
+  """
+  k = tf.shape(candidate_valid)[-1]
+  suppress = tf.greater(iou, iou_thresh)
+
+  def _cond(i, keep, selected, num_selected):
+    return tf.logical_and(
+        i < k,
+        tf.reduce_any(
+            tf.logical_and(
+                tf.reduce_any(keep[:, :, i:], axis=-1),
+                num_selected < max_size_per_class)))
+
+  def _body(i, keep, selected, num_selected):
+    is_selected = tf.logical_and(keep[:, :, i],
+                                 num_selected < max_size_per_class)
+    is_current = tf.equal(tf.range(k), i)
+    selected = tf.logical_or(
+        selected, tf.logical_and(tf.expand_dims(is_selected, -1), is_current))
+
+    # Suppress the following candidates overlapping the selected one.
+
+    suppressed = tf.logical_and(
+        tf.expand_dims(is_selected, -1), suppress[:, :, i, :])
+    suppressed = tf.logical_and(suppressed, tf.range(k) > i)
+    keep = tf.logical_and(keep, tf.logical_not(suppressed))
+    return i + 1, keep, selected, num_selected + tf.to_int32(is_selected)
+
+  _, _, selected, _ = tf.while_loop(
+      _cond,
+      _body, [
+          tf.constant(0), candidate_valid,
+          tf.zeros_like(candidate_valid),
+          tf.zeros(tf.shape(candidate_valid)[:2], dtype=tf.int32)
+      ],
+      back_prop=False)
+  return selected
+
+
+def batch_multiclass_non_max_suppression(boxes,
+                                         scores,
+                                         score_thresh,
+                                         iou_thresh,
+                                         max_size_per_class,
+                                         max_total_size,
+                                         max_candidates_per_class=200,
+                                         additional_fields=None,
+                                         scope=None):
+  """Vectorized multi-class NMS, sharing the boxes among the classes.
+
+  It processes all the images and classes in a single graph: the top-k
+  candidates of each class are pre-selected by a batched `tf.nn.top_k`, their
+  IoU is computed as one [batch, num_classes, k, k] tensor, then a single
+  greedy loop suppresses the overlapping candidates of all the classes. The
+  outputs are the same as the object_detection API's
+  `batch_multiclass_non_max_suppression` with `q` = 1, as long as the
+  detections of each class are among its top-k candidates.
+
+  Args:
+    boxes: A [batch, num_boxes, 4] float tensor.
+    scores: A [batch, num_boxes, num_classes] float tensor.
+    score_thresh: A float, boxes having score not larger than this value are
+      removed before NMS.
+    iou_thresh: A float, IoU threshold of the suppression.
+    max_size_per_class: Maximum number of detections per class.
+    max_total_size: Maximum number of detections per image.
+    max_candidates_per_class: A positive int, only the top-k scoring boxes
+      per class are NMS candidates. The IoU tensor is quadratic in k, so this
+      bounds the memory when there are thousands of boxes.
+    additional_fields: A dict mapping from names to [batch, num_boxes, ...]
+      numeric tensors, gathered along with the detections.
+    scope: Name scope of the ops.
+
+  Returns:
+    num_detections: A [batch] int32 tensor.
+    nmsed_boxes: A [batch, max_total_size, 4] float tensor.
+    nmsed_scores: A [batch, max_total_size] float tensor.
+    nmsed_classes: A [batch, max_total_size] float tensor, the 0-based class
+      indices.
+    nmsed_additional_fields: A dict mapping from names to
+      [batch, max_total_size, ...] tensors, or None if additional_fields is
+      None.
+
+  Raises:
+    ValueError: If max_candidates_per_class is not positive.
+  """
+  if max_candidates_per_class <= 0:
+    raise ValueError('The max_candidates_per_class has to be positive.')
+
+  with tf.name_scope(scope, 'VectorizedMultiClassNonMaxSuppression'):
+    batch = tf.shape(scores)[0]
+
+    # Pre-select the top-k candidates per class.
+    #   candidate_scores shape = [batch, num_classes, k].
+    #   candidate_boxes shape = [batch, num_classes, k, 4].
+
+    (candidate_boxes, candidate_scores,
+     candidate_indices) = select_top_k_per_class(boxes, scores,
+                                                 max_candidates_per_class)
+    k = tf.shape(candidate_scores)[-1]
+
+    # Suppress the candidates, one IoU matrix per class.
+
+    selected = _greedy_suppression(
+        tf.greater(candidate_scores, score_thresh),
+        box_utils.pairwise_iou(candidate_boxes, candidate_boxes), iou_thresh,
+        max_size_per_class)
+
+    # Select the top scoring detections among all the classes.
+    #   detection_indices shape = [batch, max_total_size].
+
+    selected_scores = tf.where(
+        selected, candidate_scores,
+        tf.fill(tf.shape(candidate_scores), candidate_scores.dtype.min))
+    selected_scores = tf.reshape(selected_scores, [batch, -1])
+    num_detections = tf.minimum(
+        tf.reduce_sum(tf.to_int32(selected), axis=[1, 2]), max_total_size)
+
+    num_top = tf.minimum(max_total_size, tf.shape(selected_scores)[1])
+    _, detection_indices = tf.nn.top_k(selected_scores, k=num_top)
+    detection_indices = tf.pad(
+        detection_indices, [[0, 0], [0, max_total_size - num_top]])
+    detection_mask = tf.sequence_mask(
+        num_detections, maxlen=max_total_size, dtype=tf.float32)
+
+    def _gather_candidates(values):
+      values = tf.reshape(values,
+                          tf.concat([[batch, -1], tf.shape(values)[3:]], 0))
+      return _batch_gather(values, detection_indices)
+
+    nmsed_scores = _gather_candidates(candidate_scores) * detection_mask
+    nmsed_boxes = _gather_candidates(candidate_boxes) * tf.expand_dims(
+        detection_mask, -1)
+    nmsed_classes = tf.to_float(detection_indices // k) * detection_mask
+
+    nmsed_scores.set_shape([None, max_total_size])
+    nmsed_boxes.set_shape([None, max_total_size, 4])
+    nmsed_classes.set_shape([None, max_total_size])
+
+    # Gather the additional fields using the indices of the boxes.
+
+    nmsed_additional_fields = None
+    if additional_fields is not None:
+      nmsed_box_indices = _gather_candidates(candidate_indices)
+      nmsed_additional_fields = {}
+      for name, field in additional_fields.items():
+        value = _batch_gather(field, nmsed_box_indices)
+        mask = tf.reshape(
+            tf.cast(detection_mask, value.dtype),
+            tf.concat([tf.shape(detection_mask),
+                       tf.ones_like(tf.shape(value)[2:])], 0))
+        nmsed_additional_fields[name] = value * mask
+
+  return (num_detections, nmsed_boxes, nmsed_scores, nmsed_classes,
+          nmsed_additional_fields)
@@ -0,0 +1,142 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+from core import nms
+from object_detection.core import post_processing
+
+
+class NMSTest(tf.test.TestCase):
+
+  def test_select_top_k_per_class(self):
+    tf.reset_default_graph()
+    boxes = tf.placeholder(tf.float32, shape=[None, None, 4])
+    scores = tf.placeholder(tf.float32, shape=[None, None, 2])
+
+    top_k_boxes, top_k_scores, top_k_indices = nms.select_top_k_per_class(
+        boxes, scores, k=2)
+
+    with self.test_session() as sess:
+      top_k_boxes_v, top_k_scores_v, top_k_indices_v = sess.run(
+          [top_k_boxes, top_k_scores, top_k_indices],
+          feed_dict={
+              boxes: [[[0.0, 0.0, 1.0, 1.0], [0.0, 0.0, 0.5, 0.5],
+                       [0.5, 0.5, 1.0, 1.0]]],
+              scores: [[[0.1, 0.9], [0.8, 0.2], [0.3, 0.7]]],
+          })
+    self.assertAllEqual(top_k_indices_v, [[[1, 2], [0, 2]]])
+    self.assertAllClose(top_k_scores_v, [[[0.8, 0.3], [0.9, 0.7]]])
+    self.assertAllClose(top_k_boxes_v,
+                        [[[[0.0, 0.0, 0.5, 0.5], [0.5, 0.5, 1.0, 1.0]],
+                          [[0.0, 0.0, 1.0, 1.0], [0.5, 0.5, 1.0, 1.0]]]])
+
+    # The k is clamped to the number of boxes.
+
+    with self.test_session() as sess:
+      top_k_scores_v = sess.run(
+          nms.select_top_k_per_class(boxes, scores, k=10)[1],
+          feed_dict={
+              boxes: [[[0.0, 0.0, 1.0, 1.0], [0.0, 0.0, 0.5, 0.5]]],
+              scores: [[[0.1, 0.9], [0.8, 0.2]]],
+          })
+    self.assertAllClose(top_k_scores_v, [[[0.8, 0.1], [0.9, 0.2]]])
+
+  def test_batch_multiclass_non_max_suppression(self):
+    tf.reset_default_graph()
+    boxes = tf.placeholder(tf.float32, shape=[None, None, 4])
+    scores = tf.placeholder(tf.float32, shape=[None, None, 2])
+    proposal_ids = tf.placeholder(tf.float32, shape=[None, None])
+
+    (num_detections, nmsed_boxes, nmsed_scores, nmsed_classes,
+     nmsed_additional_fields) = nms.batch_multiclass_non_max_suppression(
+         boxes,
+         scores,
+         score_thresh=0.1,
+         iou_thresh=0.5,
+         max_size_per_class=2,
+         max_total_size=4,
+         additional_fields={'proposal_ids': proposal_ids})
+
+    with self.test_session() as sess:
+      values = sess.run(
+          [
+              num_detections, nmsed_boxes, nmsed_scores, nmsed_classes,
+              nmsed_additional_fields['proposal_ids']
+          ],
+          feed_dict={
+              boxes: [[[0.0, 0.0, 1.0, 1.0], [0.0, 0.0, 1.0, 0.9],
+                       [0.5, 0.5, 1.0, 1.0], [0.0, 0.0, 0.5, 0.5]]],
+              scores: [[[0.9, 0.0], [0.8, 0.05], [0.7, 0.6], [0.01, 0.3]]],
+              proposal_ids: [[0.0, 1.0, 2.0, 3.0]],
+          })
+
+    # Proposal #1 is suppressed by #0 in class 0, class 0 has at most 2
+    # detections, proposals #0 and #1 are below the score_thresh in class 1.
+
+    (num_detections_v, nmsed_boxes_v, nmsed_scores_v, nmsed_classes_v,
+     proposal_ids_v) = values
+    self.assertAllEqual(num_detections_v, [4])
+    self.assertAllClose(nmsed_scores_v, [[0.9, 0.7, 0.6, 0.3]])
+    self.assertAllClose(nmsed_classes_v, [[0, 0, 1, 1]])
+    self.assertAllClose(proposal_ids_v, [[0, 2, 2, 3]])
+    self.assertAllClose(nmsed_boxes_v,
+                        [[[0.0, 0.0, 1.0, 1.0], [0.5, 0.5, 1.0, 1.0],
+                          [0.5, 0.5, 1.0, 1.0], [0.0, 0.0, 0.5, 0.5]]])
+
+  def test_same_outputs_as_object_detection_api(self):
+    tf.reset_default_graph()
+    random_state = np.random.RandomState(0)
+
+    batch, num_boxes, num_classes = 2, 200, 5
+    center = random_state.uniform(0.2, 0.8, size=[batch, num_boxes, 2])
+    size = random_state.uniform(0.05, 0.4, size=[batch, num_boxes, 2])
+    boxes_v = np.concatenate([center - size / 2, center + size / 2], -1)
+    scores_v = random_state.uniform(size=[batch, num_boxes, num_classes])
+
+    boxes = tf.constant(boxes_v, dtype=tf.float32)
+    scores = tf.constant(scores_v, dtype=tf.float32)
+    kwargs = {
+        'score_thresh': 0.3,
+        'iou_thresh': 0.4,
+        'max_size_per_class': 10,
+        'max_total_size': 30,
+    }
+
+    (num_detections, nmsed_boxes, nmsed_scores, nmsed_classes,
+     _) = nms.batch_multiclass_non_max_suppression(boxes, scores, **kwargs)
+    (expected_boxes, expected_scores, expected_classes, _, _,
+     expected_num_detections) = (
+         post_processing.batch_multiclass_non_max_suppression(
+             tf.expand_dims(boxes, 2), scores, **kwargs))
+
+    with self.test_session() as sess:
+      values, expected_values = sess.run([
+          [num_detections, nmsed_boxes, nmsed_scores, nmsed_classes],
+          [
+              expected_num_detections, expected_boxes, expected_scores,
+              expected_classes
+          ]
+      ])
+    for value, expected_value in zip(values, expected_values):
+      self.assertAllClose(value, expected_value)
+
+  def test_max_candidates_per_class_has_to_be_positive(self):
+    tf.reset_default_graph()
+    boxes = tf.zeros([1, 10, 4])
+    scores = tf.zeros([1, 10, 2])
+    with self.assertRaises(ValueError):
+      nms.batch_multiclass_non_max_suppression(
+          boxes,
+          scores,
+          score_thresh=0.1,
+          iou_thresh=0.5,
+          max_size_per_class=2,
+          max_total_size=4,
+          max_candidates_per_class=0)
+
+
+if __name__ == '__main__':
+  tf.test.main()
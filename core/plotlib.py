@@ -2,10 +2,10 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import re
 import cv2
 import numpy as np
 import tensorflow as tf
-import matplotlib.pyplot as plt
 import functools
 import base64
 
@@ -21,6 +21,13 @@ _SMALL_NUMBER = 1e-8
 _CMAP = "jet"
 _FONTFACE = cv2.FONT_HERSHEY_COMPLEX_SMALL
 
+_LUT_SIZE = 256
+_COLORMAP_LUTS = {}
+
+_MAX_TEXT_BOXES = 100
+_MAX_TEXT_SIZE_CACHE = 10000
+_TEXT_SIZE_CACHE = {}
+
 # NOTE: THE DEFAULT CHANNEL ORDER IS RGB.
 
 
@@ -31,6 +38,82 @@ def _py_convert_to_base64(image, ext='.jpg', quality=90):
       '\n', '')
 
 
+def _py_get_colormap_lut(cmap=_CMAP):
+  """Gets the uint8 lookup table of the colormap.
+
+  The table is computed on the first use of each colormap, matplotlib is
+  imported only then.
+
+  Args:
+    cmap: name of the matplotlib colormap.
+
+  Returns:
+    lut: a [256, 3] uint8 numpy array, the RGB color of each quantized value.
+  """
+  lut = _COLORMAP_LUTS.get(cmap)
+  if lut is None:
+    import matplotlib.pyplot as plt
+
+    values = (np.arange(_LUT_SIZE) + 0.5) / _LUT_SIZE
+    lut = plt.get_cmap(cmap)(values)[:, :3]
+    lut = (lut * 255.0 + 0.5).astype(np.uint8)
+    _COLORMAP_LUTS[cmap] = lut
+  return lut
+
+
+def _py_normalize(image, normalize_to=None):
+  """Normalizes the values to the range of [0.0, 1.0].
+
+  Args:
+    image: a float numpy array.
+    normalize_to: a (min_v, max_v) tuple, if provided, the values are clipped
+      to the range before normalization.
+
+  Returns:
+    image: a float numpy array, the values are in the range of [0.0, 1.0].
+  """
+  if normalize_to is None:
+    min_v, max_v = image.min(), image.max()
+  else:
+    min_v, max_v = normalize_to
+    image = np.clip(image, min_v, max_v)
+  return (image - min_v) / (_SMALL_NUMBER + max_v - min_v)
+
+
+def _py_quantize(image):
+  """Quantizes the values in the range of [0.0, 1.0] to the LUT indices.
+
+  Args:
+    image: a float numpy array.
+
+  Returns:
+    indices: a uint8 numpy array, the values out of range are clipped.
+  """
+  indices = np.multiply(image, _LUT_SIZE, dtype=np.float32)
+  np.clip(indices, 0, _LUT_SIZE - 1, out=indices)
+  return indices.astype(np.uint8)
+
+
+def _py_convert_to_heatmap_uint8(image,
+                                 normalize=True,
+                                 normalize_to=None,
+                                 cmap=_CMAP):
+  """Converts single-channel image to heat-map image.
+
+  Args:
+    image: a [height, width] float numpy array.
+    normalize: if True, normalize the pixel values to the range of [0.0, 1.0].
+    normalize_to: a (min_v, max_v) tuple, the range to normalize from.
+    cmap: name of the matplotlib colormap.
+
+  Returns:
+    heatmap: a [height, width, 3] uint8 numpy array.
+  """
+  if normalize:
+    image = _py_normalize(image, normalize_to)
+  return _py_get_colormap_lut(cmap)[_py_quantize(image)]
+
+
 def _py_convert_to_heatmap(image, normalize=True, normalize_to=None,
                            cmap=_CMAP):
   """Converts single-channel image to heat-map image.
@@ -43,41 +126,145 @@ def _py_convert_to_heatmap(image, normalize=True, normalize_to=None,
     heatmap: a [height, width, 3] float numpy array, the values are in the
       range of [0.0, 1.0].
   """
-  if normalize:
-    if normalize_to is None:
-      min_v, max_v = image.min(), image.max()
-    else:
-      min_v, max_v = normalize_to
-      image = np.maximum(image, min_v)
-      image = np.minimum(image, max_v)
-    image = (image - min_v) / (_SMALL_NUMBER + max_v - min_v)
+  heatmap = _py_convert_to_heatmap_uint8(image, normalize, normalize_to, cmap)
+  return np.multiply(heatmap, 1.0 / 255, dtype=np.float32)
 
-  cm = plt.get_cmap(cmap)
-  heatmap = cm(image)
-  return heatmap[:, :, :3].astype(np.float32)
 
-
-def _py_show_heatmap(image, saliency):
+def _py_show_heatmap(image, saliency, cmap=_CMAP, out=None):
   """Shows heatmap on the original image.
 
+  The colors are looked up from the raw saliency, and are blended using the
+  normalized saliency as the weights. The blending is done in uint16, without
+  float copies of the image.
+
   Args:
     image: a [height, width, 3] uint8 numpy array.
     saliency: a [height, width] float numpy array.
+    cmap: name of the matplotlib colormap.
+    out: a [height, width, 3] uint8 numpy array to store the results, it could
+      be the `image` itself.
 
   Returns:
     image_with_heatmap: a [height, width, 3] uint8 numpy array with heatmap
       visualization.
   """
-  heatmap = _py_convert_to_heatmap(saliency, normalize=False)
+  heatmap = _py_get_colormap_lut(cmap)[_py_quantize(saliency)]
+
+  alpha = np.multiply(_py_normalize(saliency), 255.0, dtype=np.float32)
+  alpha = np.expand_dims((alpha + 0.5).astype(np.uint16), -1)
+
+  # output = (heatmap * alpha + image * (255 - alpha)) / 255.
+
+  blended = heatmap.astype(np.uint16)
+  blended *= alpha
+  alpha = 255 - alpha
+  blended += image * alpha
+  blended += 127
+  blended //= 255
+
+  if out is None:
+    return blended.astype(np.uint8)
+  np.copyto(out, blended, casting='unsafe')
+  return out
+
+
+def _py_get_text_size(text, fontscale, thickness):
+  """Gets the size of the text, the results are cached.
+
+  The cache is keyed on the text with the digits replaced by zeros, so that
+  the texts differing only in the scores share the same entry. The Hershey
+  digits have the same width, the size is exactly the one of the text.
+
+  Args:
+    text: a python string.
+    fontscale: scale of the font.
+    thickness: thinkness of the line.
+
+  Returns:
+    a (text_w, text_h) tuple.
+  """
+  template = re.sub(r'\d', '0', text)
+  key = (template, fontscale, thickness)
+  size = _TEXT_SIZE_CACHE.get(key)
+  if size is None:
+    if len(_TEXT_SIZE_CACHE) >= _MAX_TEXT_SIZE_CACHE:
+      _TEXT_SIZE_CACHE.clear()
+    size, _ = cv2.getTextSize(template, _FONTFACE, fontscale, thickness)
+    _TEXT_SIZE_CACHE[key] = size
+  return size
 
-  min_v, max_v = saliency.min(), saliency.max()
-  saliency = (saliency - min_v) / (_SMALL_NUMBER + max_v - min_v)
-  saliency = np.expand_dims(saliency, -1)
 
-  image_with_heatmap = np.add(
-      np.multiply(1.0 - saliency, image.astype(np.float32)),
-      np.multiply(saliency, heatmap * 255.0)).astype(np.uint8)
-  return image_with_heatmap
+def _py_box_corners(boxes, height, width):
+  """Converts the normalized boxes to pixel coordinates.
+
+  Args:
+    boxes: a [batch, 4] float numpy array representing normalized boxes.
+    height: height of the image.
+    width: width of the image.
+
+  Returns:
+    corners: a [batch, 4] int32 numpy array, [ymin, xmin, ymax, xmax].
+  """
+  boxes = np.asarray(boxes, dtype=np.float32).reshape([-1, 4])
+  scale = np.array([height, width, height, width], dtype=np.float32)
+  return (boxes * scale + 0.5).astype(np.int32)
+
+
+def _py_draw_outlines(canvas, corners, color, thickness):
+  """Draws the outlines of all the boxes with a single `cv2.polylines` call.
+
+  Args:
+    canvas: a [height, width, 3] uint8 numpy array, drawn in place.
+    corners: a [batch, 4] int32 numpy array, [ymin, xmin, ymax, xmax].
+    color: the color to be drawn.
+    thickness: thinkness of the line.
+  """
+  if not len(corners):
+    return
+  ymin, xmin, ymax, xmax = [corners[:, i] for i in range(4)]
+  polygons = np.stack([
+      np.stack([xmin, ymin], -1),
+      np.stack([xmax, ymin], -1),
+      np.stack([xmax, ymax], -1),
+      np.stack([xmin, ymax], -1)
+  ], 1)
+  cv2.polylines(
+      canvas, list(polygons), isClosed=True, color=color, thickness=thickness)
+
+
+def _py_draw_texts(canvas, corners, texts, color, thickness, fontscale,
+                   offset, padding):
+  """Draws the texts at the top-left corners of the boxes.
+
+  Args:
+    canvas: a [height, width, 3] uint8 numpy array, drawn in place.
+    corners: a [batch, 4] int32 numpy array, [ymin, xmin, ymax, xmax].
+    texts: a list of python strings, empty strings are skipped.
+    color: the background color of the texts.
+    thickness: thinkness of the line.
+    fontscale: scale of the font.
+    offset: offset of the text background from the corner.
+    padding: padding of the text background to the bottom-right.
+  """
+  text_color = BLACK if color != BLACK else WHITE
+  for (ymin, xmin, _, _), text in zip(corners.tolist(), texts):
+    if not text:
+      continue
+    text_w, text_h = _py_get_text_size(text, fontscale, thickness)
+    cv2.rectangle(
+        canvas,
+        pt1=(xmin + offset, ymin + offset),
+        pt2=(xmin + padding + text_w, ymin + padding + text_h),
+        color=color,
+        thickness=-1)
+    cv2.putText(
+        canvas,
+        text,
+        org=(xmin, ymin + text_h),
+        fontFace=_FONTFACE,
+        fontScale=fontscale,
+        color=text_color,
+        thickness=thickness)
 
 
 def _py_draw_rectangles(image,
@@ -86,9 +273,13 @@ def _py_draw_rectangles(image,
                         labels,
                         color=GREEN,
                         thickness=1,
-                        fontscale=1.0):
+                        fontscale=1.0,
+                        max_text_boxes=_MAX_TEXT_BOXES):
   """Draws boxes on the image.
 
+  The outlines of all the boxes are drawn at once, then the texts of the first
+  `max_text_boxes` boxes are drawn.
+
   Args:
     image: a [height, width, 3] uint8 numpy array.
     boxes: a [batch, 4] float numpy array representing normalized boxes.
@@ -97,6 +288,7 @@ def _py_draw_rectangles(image,
     color: the color to be drawn.
     thickness: thinkness of the line.
     fontscale: scale of the font.
+    max_text_boxes: maximum number of boxes to draw the texts.
 
   Returns:
     canvas: a [height, width, 3] uint8 numpy array.
@@ -104,43 +296,27 @@ def _py_draw_rectangles(image,
   height, width, _ = image.shape
 
   canvas = image.copy()
-  for i, (box, score, label) in enumerate(zip(boxes, scores, labels)):
+  corners = _py_box_corners(boxes, height, width)
+  _py_draw_outlines(canvas, corners, color, thickness)
+
+  texts = []
+  for score, label in zip(scores[:max_text_boxes], labels[:max_text_boxes]):
     label = label.decode('UTF8') if isinstance(label, bytes) else label
     if label and score > -1000:
-      text = '%s: %.3lf' % (label, score)
+      texts.append('%s: %.3lf' % (label, score))
     elif score > -1000:
-      text = '%.3lf' % (score)
+      texts.append('%.3lf' % (score))
     else:
-      text = label
-    (text_w, text_h), baseline = cv2.getTextSize(text, _FONTFACE, fontscale,
-                                                 thickness)
-
-    ymin, xmin, ymax, xmax = box
-    ymin, xmin, ymax, xmax = (int(height * ymin + 0.5), int(width * xmin + 0.5),
-                              int(height * ymax + 0.5), int(width * xmax + 0.5))
-
-    cv2.rectangle(
-        canvas,
-        pt1=(xmin, ymin),
-        pt2=(xmax, ymax),
-        color=color,
-        thickness=thickness)
-    if text:
-      cv2.rectangle(
-          canvas,
-          pt1=(xmin + thickness, ymin + thickness),
-          pt2=(xmin + thickness + text_w, ymin + thickness + text_h),
-          color=color,
-          thickness=-1)
-      text_color = BLACK if color != BLACK else WHITE
-      cv2.putText(
-          canvas,
-          text,
-          org=(xmin, ymin + text_h),
-          fontFace=_FONTFACE,
-          fontScale=fontscale,
-          color=text_color,
-          thickness=thickness)
+      texts.append(label)
+  _py_draw_texts(
+      canvas,
+      corners,
+      texts,
+      color,
+      thickness,
+      fontscale,
+      offset=thickness,
+      padding=thickness)
   return canvas
 
 
@@ -152,17 +328,24 @@ def _py_draw_rectangles_v2(image,
                            color=GREEN,
                            thickness=1,
                            fontscale=1.0,
-                           show_score=True):
+                           show_score=True,
+                           max_text_boxes=_MAX_TEXT_BOXES):
   """Draws boxes on the image.
 
+  The outlines of all the boxes are drawn at once, then the texts of the first
+  `max_text_boxes` boxes are drawn.
+
   Args:
     image: a [height, width, 3] uint8 numpy array.
+    total: number of boxes to be drawn.
     boxes: a [batch, 4] float numpy array representing normalized boxes.
     scores: a [batch] float numpy array representing box scores.
     labels: a [batch] string numpy array representing labels.
     color: the color to be drawn.
     thickness: thinkness of the line.
     fontscale: scale of the font.
+    show_score: if True, draw the scores along with the labels.
+    max_text_boxes: maximum number of boxes to draw the texts.
 
   Returns:
     canvas: a [height, width, 3] uint8 numpy array.
@@ -170,40 +353,23 @@ def _py_draw_rectangles_v2(image,
   height, width, _ = image.shape
 
   canvas = image.copy()
-  for i, (box, score, label) in enumerate(zip(boxes, scores, labels)):
-    if i >= total: break
+  corners = _py_box_corners(boxes, height, width)[:total]
+  _py_draw_outlines(canvas, corners, color, thickness * 2)
 
+  num_text_boxes = min(total, max_text_boxes)
+  texts = []
+  for score, label in zip(scores[:num_text_boxes], labels[:num_text_boxes]):
     label = label.decode('UTF8') if isinstance(label, bytes) else label
-    text = '%s: %.0lf%%' % (label, score * 100) if show_score else label
-
-    (text_w, text_h), baseline = cv2.getTextSize(text, _FONTFACE, fontscale,
-                                                 thickness)
-
-    ymin, xmin, ymax, xmax = box
-    ymin, xmin, ymax, xmax = (int(height * ymin + 0.5), int(width * xmin + 0.5),
-                              int(height * ymax + 0.5), int(width * xmax + 0.5))
-
-    cv2.rectangle(
-        canvas,
-        pt1=(xmin, ymin),
-        pt2=(xmax, ymax),
-        color=color,
-        thickness=thickness * 2)
-    cv2.rectangle(
-        canvas,
-        pt1=(xmin, ymin),
-        pt2=(xmin + 2 * thickness + text_w, ymin + 2 * thickness + text_h),
-        color=color,
-        thickness=-1)
-    text_color = BLACK if color != BLACK else WHITE
-    cv2.putText(
-        canvas,
-        text,
-        org=(xmin, ymin + text_h),
-        fontFace=_FONTFACE,
-        fontScale=fontscale,
-        color=text_color,
-        thickness=thickness)
+    texts.append('%s: %.0lf%%' % (label, score * 100) if show_score else label)
+  _py_draw_texts(
+      canvas,
+      corners,
+      texts,
+      color,
+      thickness,
+      fontscale,
+      offset=0,
+      padding=2 * thickness)
   return canvas
 
 
@@ -326,7 +492,8 @@ def draw_rectangles(image,
                     labels=None,
                     color=GREEN,
                     thickness=1,
-                    fontscale=1.0):
+                    fontscale=1.0,
+                    max_text_boxes=_MAX_TEXT_BOXES):
   """Draws rectangle to the image.
 
   Args:
@@ -340,6 +507,7 @@ def draw_rectangles(image,
     color: color to be used.
     thickness: the line thickness.
     fontscale: size of the font.
+    max_text_boxes: maximum number of boxes to draw the texts.
 
   Returns:
     canvas: a [batch, height, width, 3] uint8 tensor with information drawn.
@@ -359,7 +527,7 @@ def draw_rectangles(image,
     """
     image, boxes, scores, labels = inputs
     canvas = tf.py_func(
-        func=lambda x, y, z, w: _py_draw_rectangles(x, y, z, w, color=color, thickness=thickness, fontscale=fontscale),
+        func=lambda x, y, z, w: _py_draw_rectangles(x, y, z, w, color=color, thickness=thickness, fontscale=fontscale, max_text_boxes=max_text_boxes),
         inp=[image, boxes, scores, labels], Tout=tf.uint8)
     canvas.set_shape(tf.TensorShape([None, None, 3]))
     return canvas
@@ -381,7 +549,8 @@ def draw_rectangles_v2(image,
                        labels,
                        color=GREEN,
                        thickness=1,
-                       fontscale=1.0):
+                       fontscale=1.0,
+                       max_text_boxes=_MAX_TEXT_BOXES):
   """Draws rectangle to the image.
 
   Args:
@@ -396,6 +565,7 @@ def draw_rectangles_v2(image,
     color: color to be used.
     thickness: the line thickness.
     fontscale: size of the font.
+    max_text_boxes: maximum number of boxes to draw the texts.
 
   Returns:
     canvas: a [batch, height, width, 3] uint8 tensor with information drawn.
@@ -415,7 +585,7 @@ def draw_rectangles_v2(image,
     """
     image, total, boxes, scores, labels = inputs
     canvas = tf.py_func(
-        func=lambda a, b, c, d, e: _py_draw_rectangles_v2(a, b, c, d, e, color=color, thickness=thickness, fontscale=fontscale),
+        func=lambda a, b, c, d, e: _py_draw_rectangles_v2(a, b, c, d, e, color=color, thickness=thickness, fontscale=fontscale, max_text_boxes=max_text_boxes),
         inp=[image, total, boxes, scores, labels], Tout=tf.uint8)
     canvas.set_shape(tf.TensorShape([None, None, 3]))
     return canvas
@@ -25,6 +25,38 @@ class PlotLibTest(tf.test.TestCase):
     cv2.imwrite(filename, kernel_heatmap[:, :, ::-1])  # RGB to BGR.
     tf.logging.info("The kernel image is written to %s.", filename)
 
+  def test_py_get_colormap_lut(self):
+    lut = plotlib._py_get_colormap_lut("jet")
+    self.assertEqual(lut.shape, (256, 3))
+    self.assertEqual(lut.dtype, np.uint8)
+    self.assertIs(plotlib._py_get_colormap_lut("jet"), lut)
+
+    heatmap = plotlib._py_convert_to_heatmap_uint8(
+        np.array([[0.0, 0.5, 1.0]]), normalize=False)
+    self.assertAllEqual(heatmap[0], lut[[0, 128, 255]])
+
+  def test_py_show_heatmap(self):
+    random_state = np.random.RandomState(0)
+    image = random_state.randint(256, size=(32, 48, 3)).astype(np.uint8)
+    saliency = random_state.uniform(size=(32, 48)).astype(np.float32)
+
+    # Reference implementation in float32.
+
+    heatmap = plotlib._py_convert_to_heatmap(saliency, normalize=False)
+    alpha = np.expand_dims(
+        (saliency - saliency.min()) / (saliency.max() - saliency.min()), -1)
+    expected = (1.0 - alpha) * image + alpha * heatmap * 255.0
+
+    output = plotlib._py_show_heatmap(image, saliency)
+    self.assertEqual(output.dtype, np.uint8)
+    self.assertAllClose(output, expected, atol=1.5)
+
+    # Blend in place.
+
+    canvas = image.copy()
+    self.assertIs(plotlib._py_show_heatmap(canvas, saliency, out=canvas), canvas)
+    self.assertAllEqual(canvas, output)
+
   def test_convert_to_heatmap(self):
     image = tf.placeholder(tf.float32, shape=[None, None])
     heatmap = plotlib.convert_to_heatmap(
@@ -54,6 +86,50 @@ class PlotLibTest(tf.test.TestCase):
     cv2.imwrite(filename, canvas[:, :, ::-1])  # RGB to BGR.
     tf.logging.info("The image with rectangles is written to %s.", filename)
 
+  def test_py_get_text_size(self):
+    for text in ["dog: 0.123", "person: 98%", "0.456", "bicycle", "7: 1.789"]:
+      for fontscale, thickness in [(1.0, 1), (0.5, 2)]:
+        (text_w, text_h), _ = cv2.getTextSize(text, plotlib._FONTFACE,
+                                              fontscale, thickness)
+        self.assertEqual(
+            tuple(plotlib._py_get_text_size(text, fontscale, thickness)),
+            (text_w, text_h))
+
+    # The texts differing only in the digits share the cache entry.
+
+    plotlib._TEXT_SIZE_CACHE.clear()
+    plotlib._py_get_text_size("dog: 0.123", 1.0, 1)
+    plotlib._py_get_text_size("dog: 0.987", 1.0, 1)
+    self.assertEqual(list(plotlib._TEXT_SIZE_CACHE), [("dog: 0.000", 1.0, 1)])
+
+  def test_py_draw_rectangles_max_text_boxes(self):
+    image = np.zeros((100, 200, 3), dtype=np.uint8)
+    boxes = np.array([[0.1, 0.1, 0.9, 0.5], [0.2, 0.6, 0.8, 0.9]])
+    scores = np.array([0.5, 0.6], dtype=np.float32)
+    labels = np.array([b"dog", b"cat"])
+
+    # The outlines are drawn for all the boxes.
+
+    canvas = plotlib._py_draw_rectangles(
+        image, boxes, scores, labels, color=plotlib.RED, max_text_boxes=0)
+    self.assertAllEqual(canvas[10, 20:101], [plotlib.RED] * 81)
+    self.assertAllEqual(canvas[20:81, 180], [plotlib.RED] * 61)
+    self.assertAllEqual(canvas[50, 50], plotlib.BLACK)
+
+    no_texts = plotlib._py_draw_rectangles(
+        image, boxes, [-9999.0] * 2, [b""] * 2, color=plotlib.RED)
+    self.assertAllEqual(canvas, no_texts)
+
+    # Only the text of the first box is drawn.
+
+    plotlib._TEXT_SIZE_CACHE.clear()
+    canvas = plotlib._py_draw_rectangles_v2(
+        image, 2, boxes, scores, labels, color=plotlib.RED, max_text_boxes=1)
+    self.assertIn(("dog: 00%", 1.0, 1), plotlib._TEXT_SIZE_CACHE)
+    self.assertNotIn(("cat: 00%", 1.0, 1), plotlib._TEXT_SIZE_CACHE)
+    self.assertTrue((canvas[11:20, 21:30] == plotlib.RED).all(-1).any())
+    self.assertAllEqual(canvas[23:32, 123:132], np.zeros((9, 9, 3)))
+
   def test_py_draw_caption(self):
     image = np.zeros((480, 640, 3), dtype=np.uint8)
     canvas = plotlib._py_draw_caption(
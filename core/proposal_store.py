@@ -0,0 +1,340 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+import numpy as np
+import tensorflow as tf
+
+from object_detection.utils import dataset_util
+
+from core import box_utils
+
+# A proposal store is a directory holding:
+#   boxes.bin: one contiguous [total_num_proposals, 4] array of normalized
+#     boxes [ymin, xmin, ymax, xmax];
+#   index.txt: one `image_id offset num_proposals` line per image, the line is
+#     appended only after the boxes are flushed, so that the index never
+#     refers to partially written data;
+#   meta.json: the dtype of the boxes.
+
+_BOXES_FILENAME = 'boxes.bin'
+_INDEX_FILENAME = 'index.txt'
+_META_FILENAME = 'meta.json'
+
+_SUPPORTED_DTYPES = ['float16', 'float32']
+
+
+def _read_index(filename):
+  """Reads the index file.
+
+  Args:
+    filename: path to the index file.
+
+  Only the lines terminated by a newline are read, a torn last line left by a
+  crash is ignored.
+
+  Args:
+    filename: path to the index file.
+
+  Returns:
+    index: a dict mapping from image_id string to (offset, num_proposals).
+    total: total number of proposals referred by the index.
+    size: size in bytes of the complete lines.
+  """
+  index, total, size = {}, 0, 0
+  if os.path.isfile(filename):
+    with open(filename, 'rb') as fid:
+      for line in fid:
+        if not line.endswith(b'\n'):
+          break
+        size += len(line)
+        fields = line.decode('utf8').split()
+        if len(fields) != 3:
+          continue
+        image_id, offset, num_proposals = fields[0], int(fields[1]), int(
+            fields[2])
+        index[image_id] = (offset, num_proposals)
+        total = max(total, offset + num_proposals)
+  return index, total, size
+
+
+class ProposalStoreWriter(object):
+  """Appends proposals of images to a proposal store.
+
+  The writer is resumable: re-opening an existing store drops the data written
+  after the last indexed image and keeps appending.
+  """
+
+  def __init__(self, path, dtype='float32'):
+    """Opens the store for appending.
+
+    Args:
+      path: path to the store directory.
+      dtype: dtype of the stored boxes, either `float16` or `float32`.
+
+    Raises:
+      ValueError: if dtype is invalid or differs from the existing store.
+    """
+    if dtype not in _SUPPORTED_DTYPES:
+      raise ValueError('Invalid dtype {}.'.format(dtype))
+
+    if not os.path.isdir(path):
+      os.makedirs(path)
+
+    meta_file = os.path.join(path, _META_FILENAME)
+    if os.path.isfile(meta_file):
+      with open(meta_file, 'r') as fid:
+        if json.load(fid)['dtype'] != dtype:
+          raise ValueError('The store {} is not of dtype {}.'.format(
+              path, dtype))
+    else:
+      with open(meta_file, 'w') as fid:
+        json.dump({'dtype': dtype}, fid)
+
+    self._dtype = np.dtype(dtype)
+    index_file = os.path.join(path, _INDEX_FILENAME)
+    self._index, self._total, index_size = _read_index(index_file)
+
+    # Drop the torn index line and the boxes written after the last indexed
+    # image.
+
+    with open(index_file, 'ab') as fid:
+      fid.truncate(index_size)
+
+    boxes_file = os.path.join(path, _BOXES_FILENAME)
+    with open(boxes_file, 'ab') as fid:
+      fid.truncate(self._total * 4 * self._dtype.itemsize)
+
+    self._boxes_fid = open(boxes_file, 'ab')
+    self._index_fid = open(index_file, 'a')
+
+  def __contains__(self, image_id):
+    return str(image_id) in self._index
+
+  def __len__(self):
+    return len(self._index)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def write(self, image_id, proposals):
+    """Appends the proposals of an image.
+
+    Args:
+      image_id: the image id.
+      proposals: a [num_proposals, 4] float numpy array.
+
+    Raises:
+      ValueError: if the image_id has already been written.
+    """
+    image_id = str(image_id)
+    if image_id in self._index:
+      raise ValueError('Duplicate image_id {}.'.format(image_id))
+
+    proposals = np.asarray(proposals, dtype=self._dtype).reshape([-1, 4])
+    self._boxes_fid.write(proposals.tobytes())
+    self._boxes_fid.flush()
+
+    num_proposals = proposals.shape[0]
+    self._index[image_id] = (self._total, num_proposals)
+    self._index_fid.write('{} {} {}\n'.format(image_id, self._total,
+                                              num_proposals))
+    self._index_fid.flush()
+    self._total += num_proposals
+
+  def close(self):
+    self._boxes_fid.close()
+    self._index_fid.close()
+
+
+class ProposalStore(object):
+  """Random access reader of one or more proposal stores.
+
+  The boxes are opened via np.memmap, so that reading the proposals of an
+  image costs a dict lookup and a slice instead of opening a file.
+  """
+
+  def __init__(self, paths):
+    """Opens the stores.
+
+    Args:
+      paths: path to the store directory, or a list of paths.
+
+    Raises:
+      ValueError: if an image_id appears in more than one store.
+    """
+    if isinstance(paths, str):
+      paths = [paths]
+
+    self._boxes = []
+    self._index = {}
+    for path in paths:
+      with open(os.path.join(path, _META_FILENAME), 'r') as fid:
+        dtype = np.dtype(json.load(fid)['dtype'])
+      index, total, _ = _read_index(os.path.join(path, _INDEX_FILENAME))
+
+      boxes = np.zeros([0, 4], dtype=dtype)
+      if total > 0:
+        boxes = np.memmap(
+            os.path.join(path, _BOXES_FILENAME),
+            dtype=dtype,
+            mode='r',
+            shape=(total, 4))
+
+      store_id = len(self._boxes)
+      self._boxes.append(boxes)
+      for image_id, (offset, num_proposals) in index.items():
+        if image_id in self._index:
+          raise ValueError('Duplicate image_id {} in {}.'.format(
+              image_id, path))
+        self._index[image_id] = (store_id, offset, num_proposals)
+
+  def __contains__(self, image_id):
+    return str(image_id) in self._index
+
+  def __len__(self):
+    return len(self._index)
+
+  def keys(self):
+    return self._index.keys()
+
+  def get(self, image_id):
+    """Reads the proposals of an image.
+
+    Args:
+      image_id: the image id.
+
+    Returns:
+      proposals: a [num_proposals, 4] float32 numpy array.
+
+    Raises:
+      KeyError: if the image_id is not in the store.
+    """
+    store_id, offset, num_proposals = self._index[str(image_id)]
+    return np.array(
+        self._boxes[store_id][offset:offset + num_proposals], dtype=np.float32)
+
+
+class ProposalLoader(object):
+  """Loads the proposals from the proposal stores or the .npy files.
+
+  The stores are opened on the first read, so that a loader created before
+  forking the worker processes opens its own handles in each worker.
+  """
+
+  def __init__(self, store_paths=None, npy_path_fn=None):
+    """Initializes the loader.
+
+    Args:
+      store_paths: a list of paths to the proposal stores.
+      npy_path_fn: a callable mapping from image_id to the path of the .npy
+        file, used if `store_paths` is empty.
+
+    Raises:
+      ValueError: if neither `store_paths` nor `npy_path_fn` is provided.
+    """
+    if not store_paths and npy_path_fn is None:
+      raise ValueError('Either store_paths or npy_path_fn should be provided.')
+
+    self._store_paths = store_paths
+    self._npy_path_fn = npy_path_fn
+    self._store = None
+
+  def get(self, image_id):
+    """Reads the proposals of an image.
+
+    Args:
+      image_id: the image id.
+
+    Returns:
+      proposals: a [num_proposals, 4] float numpy array.
+    """
+    if self._store_paths:
+      if self._store is None:
+        self._store = ProposalStore(self._store_paths)
+      return self._store.get(image_id)
+
+    with open(self._npy_path_fn(image_id), 'rb') as fid:
+      return np.load(fid)
+
+
+class ProposalFeatureEncoder(object):
+  """Creates the proposal features of the tf.Example.
+
+  If `quantize` is set, the proposals are stored as one bytes feature of
+  uint16 normalized coordinates, and the precision loss is accumulated.
+  """
+
+  def __init__(self, quantize=False):
+    """Initializes the encoder.
+
+    Args:
+      quantize: if True, quantize the proposals.
+    """
+    self._quantize = quantize
+    self._error = {'max': 0.0, 'sum': 0.0, 'count': 0}
+
+  @property
+  def quantization_error(self):
+    """A dict of the `max`, `sum` and `count` of the quantization errors."""
+    return dict(self._error)
+
+  def encode(self, proposals):
+    """Creates the proposal features.
+
+    Args:
+      proposals: a [num_proposals, 4] float numpy array.
+
+    Returns:
+      a dict mapping from feature name to tf.train.Feature.
+    """
+    if self._quantize:
+      encoded_proposals = box_utils.py_encode_quantized_boxes(proposals)
+
+      # Measure the precision loss.
+
+      error = np.abs(
+          box_utils.py_decode_quantized_boxes(encoded_proposals) - proposals)
+      if error.size > 0:
+        self.merge_quantization_error({
+            'max': float(error.max()),
+            'sum': float(error.sum()),
+            'count': error.size
+        })
+      return {
+          'image/proposal/bbox/encoded':
+          dataset_util.bytes_feature(encoded_proposals),
+      }
+
+    return {
+        'image/proposal/bbox/ymin':
+        dataset_util.float_list_feature(proposals[:, 0].tolist()),
+        'image/proposal/bbox/xmin':
+        dataset_util.float_list_feature(proposals[:, 1].tolist()),
+        'image/proposal/bbox/ymax':
+        dataset_util.float_list_feature(proposals[:, 2].tolist()),
+        'image/proposal/bbox/xmax':
+        dataset_util.float_list_feature(proposals[:, 3].tolist()),
+    }
+
+  def merge_quantization_error(self, error):
+    """Merges the quantization errors, e.g. from the other workers.
+
+    Args:
+      error: a dict of the `max`, `sum` and `count` of the errors.
+    """
+    self._error['max'] = max(self._error['max'], error['max'])
+    self._error['sum'] += error['sum']
+    self._error['count'] += error['count']
+
+  def log_quantization_error(self):
+    """Logs the precision loss of the quantized proposals."""
+    if self._quantize:
+      tf.logging.info(
+          'Proposal quantization error: max %.3e, mean %.3e (normalized).',
+          self._error['max'], self._error['sum'] / max(self._error['count'], 1))
@@ -0,0 +1,153 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import numpy as np
+import tensorflow as tf
+
+from core import proposal_store
+
+
+class ProposalStoreTest(tf.test.TestCase):
+
+  def _get_store_path(self, name):
+    path = os.path.join(self.get_temp_dir(), name)
+    if os.path.isdir(path):
+      shutil.rmtree(path)
+    return path
+
+  def test_write_and_read(self):
+    path = self._get_store_path('store')
+    proposals_1 = np.array([[0.0, 0.0, 1.0, 1.0], [0.1, 0.2, 0.3, 0.4]])
+    proposals_2 = np.array([[0.5, 0.5, 0.6, 0.7]])
+
+    with proposal_store.ProposalStoreWriter(path) as writer:
+      writer.write(1, proposals_1)
+      writer.write('000002', proposals_2)
+      writer.write(3, np.zeros([0, 4]))
+      self.assertEqual(len(writer), 3)
+      with self.assertRaises(ValueError):
+        writer.write(1, proposals_1)
+
+    store = proposal_store.ProposalStore(path)
+    self.assertEqual(len(store), 3)
+    self.assertIn(1, store)
+    self.assertNotIn(2, store)
+    self.assertAllClose(store.get(1), proposals_1)
+    self.assertAllClose(store.get('000002'), proposals_2)
+    self.assertEqual(store.get(3).shape, (0, 4))
+    self.assertEqual(store.get(1).dtype, np.float32)
+
+  def test_resume(self):
+    path = self._get_store_path('resume')
+    proposals = np.array([[0.0, 0.0, 1.0, 1.0], [0.1, 0.2, 0.3, 0.4]])
+
+    writer = proposal_store.ProposalStoreWriter(path, dtype='float16')
+    writer.write(1, proposals)
+    writer.close()
+
+    # Simulate a crash that left unindexed boxes behind.
+
+    with open(os.path.join(path, 'boxes.bin'), 'ab') as fid:
+      fid.write(np.zeros([3, 4], dtype=np.float16).tobytes())
+
+    with self.assertRaises(ValueError):
+      proposal_store.ProposalStoreWriter(path, dtype='float32')
+
+    with proposal_store.ProposalStoreWriter(path, dtype='float16') as writer:
+      self.assertIn(1, writer)
+      writer.write(2, proposals[::-1])
+
+    store = proposal_store.ProposalStore(path)
+    self.assertAllClose(store.get(1), proposals, atol=1e-3)
+    self.assertAllClose(store.get(2), proposals[::-1], atol=1e-3)
+
+  def test_resume_with_torn_index_line(self):
+    path = self._get_store_path('torn')
+    proposals = np.array([[0.0, 0.0, 1.0, 1.0], [0.1, 0.2, 0.3, 0.4]])
+
+    with proposal_store.ProposalStoreWriter(path) as writer:
+      writer.write(1, proposals)
+
+    # Simulate a crash while writing the index line `2 2 30`.
+
+    with open(os.path.join(path, 'boxes.bin'), 'ab') as fid:
+      fid.write(np.ones([30, 4], dtype=np.float32).tobytes())
+    with open(os.path.join(path, 'index.txt'), 'a') as fid:
+      fid.write('2 2 3')
+
+    store = proposal_store.ProposalStore(path)
+    self.assertEqual(len(store), 1)
+    self.assertNotIn(2, store)
+
+    with proposal_store.ProposalStoreWriter(path) as writer:
+      self.assertNotIn(2, writer)
+      writer.write(3, proposals[::-1])
+
+    with open(os.path.join(path, 'index.txt'), 'r') as fid:
+      self.assertEqual(fid.readlines(), ['1 0 2\n', '3 2 2\n'])
+    self.assertEqual(
+        os.path.getsize(os.path.join(path, 'boxes.bin')), 4 * 4 * 4)
+
+    store = proposal_store.ProposalStore(path)
+    self.assertAllClose(store.get(1), proposals)
+    self.assertAllClose(store.get(3), proposals[::-1])
+
+  def test_multiple_stores(self):
+    path_1 = self._get_store_path('part1')
+    path_2 = self._get_store_path('part2')
+
+    with proposal_store.ProposalStoreWriter(path_1) as writer:
+      writer.write(1, [[0.0, 0.0, 1.0, 1.0]])
+    with proposal_store.ProposalStoreWriter(path_2) as writer:
+      writer.write(2, [[0.0, 0.0, 0.5, 0.5]])
+
+    store = proposal_store.ProposalStore([path_1, path_2])
+    self.assertAllClose(store.get(1), [[0.0, 0.0, 1.0, 1.0]])
+    self.assertAllClose(store.get(2), [[0.0, 0.0, 0.5, 0.5]])
+
+  def test_proposal_loader(self):
+    path = self._get_store_path('loader')
+    with proposal_store.ProposalStoreWriter(path) as writer:
+      writer.write(1, [[0.0, 0.0, 1.0, 1.0]])
+
+    loader = proposal_store.ProposalLoader(store_paths=[path])
+    self.assertAllClose(loader.get(1), [[0.0, 0.0, 1.0, 1.0]])
+
+    npy_dir = self._get_store_path('npy')
+    os.makedirs(npy_dir)
+    np.save(os.path.join(npy_dir, '2.npy'), np.array([[0.0, 0.0, 0.5, 0.5]]))
+
+    loader = proposal_store.ProposalLoader(
+        npy_path_fn=lambda x: os.path.join(npy_dir, '{}.npy'.format(x)))
+    self.assertAllClose(loader.get(2), [[0.0, 0.0, 0.5, 0.5]])
+
+    with self.assertRaises(ValueError):
+      proposal_store.ProposalLoader()
+
+  def test_proposal_feature_encoder(self):
+    proposals = np.array([[0.0, 0.0, 1.0, 1.0], [0.1, 0.2, 0.3, 0.4]])
+
+    encoder = proposal_store.ProposalFeatureEncoder(quantize=False)
+    features = encoder.encode(proposals)
+    self.assertAllClose(features['image/proposal/bbox/xmin'].float_list.value,
+                        [0.0, 0.2])
+    self.assertEqual(encoder.quantization_error['count'], 0)
+
+    encoder = proposal_store.ProposalFeatureEncoder(quantize=True)
+    features = encoder.encode(proposals)
+    self.assertIn('image/proposal/bbox/encoded', features)
+    self.assertEqual(encoder.quantization_error['count'], 8)
+    self.assertLess(encoder.quantization_error['max'], 1e-4)
+
+    # Merge the errors of the other workers.
+
+    encoder.merge_quantization_error({'max': 1.0, 'sum': 2.0, 'count': 2})
+    self.assertEqual(encoder.quantization_error['count'], 10)
+    self.assertEqual(encoder.quantization_error['max'], 1.0)
+
+
+if __name__ == '__main__':
+  tf.test.main()
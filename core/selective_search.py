@@ -0,0 +1,326 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import time
+import threading
+import multiprocessing
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from core import proposal_store
+
+# Each worker process holds its own SelectiveSearchSegmentation instance.
+
+_worker_ss = None
+_worker_options = None
+
+
+def py_selective_search(bgr,
+                        ss,
+                        fast_mode=False,
+                        min_box_size=20,
+                        max_aspect_ratio=2.2,
+                        max_image_size=None):
+  """Extracts selective search proposals from an image.
+
+  Args:
+    bgr: a [height, width, 3] uint8 numpy array, BGR format.
+    ss: an instance of cv2.ximgproc.segmentation.SelectiveSearchSegmentation.
+    fast_mode: if True, use the fast mode instead of the quality mode.
+    min_box_size: boxes having height or width less than it are discarded.
+    max_aspect_ratio: images having larger aspect ratio are stretched first.
+    max_image_size: if set, images are downscaled so that the larger dimension
+      is no more than this value.
+
+  Returns:
+    proposals: a [num_proposals, 4] float numpy array representing normalized
+      boxes [ymin, xmin, ymax, xmax].
+  """
+  # Resize image if neccessary.
+
+  height, width = bgr.shape[0], bgr.shape[1]
+  if height / width >= max_aspect_ratio:
+    width = int(height / max_aspect_ratio)
+    bgr = cv2.resize(bgr, (width, height))
+  elif width / height >= max_aspect_ratio:
+    height = int(width / max_aspect_ratio)
+    bgr = cv2.resize(bgr, (width, height))
+
+  if max_image_size and max(height, width) > max_image_size:
+    ratio = max(height, width) / max_image_size
+    height = int(height / ratio)
+    width = int(width / ratio)
+    bgr = cv2.resize(bgr, (width, height))
+  height, width = bgr.shape[0], bgr.shape[1]
+
+  ss.setBaseImage(bgr)
+  if fast_mode:
+    ss.switchToSelectiveSearchFast()
+  else:
+    ss.switchToSelectiveSearchQuality()
+  rects = ss.process().reshape([-1, 4])
+
+  rects = rects[np.logical_and(rects[:, 2] >= min_box_size,
+                               rects[:, 3] >= min_box_size)]
+
+  x, y, w, h = [rects[:, i] for i in range(4)]
+  proposals = np.stack(
+      [y / height, x / width, (y + h) / height, (x + w) / width], axis=-1)
+  return proposals
+
+
+def save_proposals(filename, proposals):
+  """Saves proposals to a .npy file atomically.
+
+  The data is written to a temporary file and then renamed, so that a crashed
+  run never leaves a truncated .npy file behind.
+
+  Args:
+    filename: path to the output .npy file.
+    proposals: a [num_proposals, 4] float numpy array.
+  """
+  temp_filename = filename + '.tmp'
+  with open(temp_filename, 'wb') as fid:
+    np.save(fid, proposals)
+  os.rename(temp_filename, filename)
+
+
+class ProposalManifest(object):
+  """Append-only record of the images whose proposals have been persisted."""
+
+  def __init__(self, filename):
+    """Initializes the manifest, loading the records of previous runs.
+
+    Args:
+      filename: path to the manifest file.
+    """
+    self._image_ids = set()
+    if os.path.isfile(filename):
+      with open(filename, 'r') as fid:
+        self._image_ids = set(line.strip('\n') for line in fid if line.strip())
+    self._fid = open(filename, 'a')
+
+  def __contains__(self, image_id):
+    return str(image_id) in self._image_ids
+
+  def __len__(self):
+    return len(self._image_ids)
+
+  def add(self, image_id):
+    """Records that the proposals of `image_id` are persisted.
+
+    Args:
+      image_id: the image id.
+    """
+    self._image_ids.add(str(image_id))
+    self._fid.write('{}\n'.format(image_id))
+    self._fid.flush()
+
+  def close(self):
+    self._fid.close()
+
+
+class NpyProposalWriter(object):
+  """Saves the proposals of each image to an individual .npy file."""
+
+  def __init__(self, path_fn, manifest_file):
+    """Initializes the writer.
+
+    Args:
+      path_fn: a callable mapping from image_id to the path of the .npy file.
+      manifest_file: path to the manifest file.
+    """
+    self._path_fn = path_fn
+    self._manifest = ProposalManifest(manifest_file)
+
+  def __contains__(self, image_id):
+    return image_id in self._manifest
+
+  def __len__(self):
+    return len(self._manifest)
+
+  def write(self, image_id, proposals):
+    save_proposals(self._path_fn(image_id), proposals)
+    self._manifest.add(image_id)
+
+  def close(self):
+    self._manifest.close()
+
+
+def get_manifest_file(output_dir, manifest_file, part_at_i=0, part_total=1):
+  """Gets the path to the manifest file of a part.
+
+  The `--parts` processes may run concurrently on a shared filesystem, so each
+  part appends to its own manifest.
+
+  Args:
+    output_dir: path to the output directory.
+    manifest_file: path to the manifest file, defaults to
+      `output_dir`/manifest.txt if empty.
+    part_at_i: index of the part to be processed.
+    part_total: total number of parts.
+
+  Returns:
+    path to the manifest file.
+  """
+  manifest_file = manifest_file or os.path.join(output_dir, 'manifest.txt')
+  if part_total > 1:
+    root, ext = os.path.splitext(manifest_file)
+    manifest_file = '{}.part_at_{}_of_{}{}'.format(root, part_at_i, part_total,
+                                                   ext)
+  return manifest_file
+
+
+def get_proposal_store_path(store_path, part_at_i=0, part_total=1):
+  """Gets the path to the proposal store of a part.
+
+  The proposal store has no locking, so each of the concurrent `--parts`
+  processes appends to its own store. The stores of all the parts are read
+  together by `proposal_store.ProposalStore`.
+
+  Args:
+    store_path: path to the proposal store directory, or empty.
+    part_at_i: index of the part to be processed.
+    part_total: total number of parts.
+
+  Returns:
+    path to the proposal store directory, or empty if `store_path` is empty.
+  """
+  if store_path and part_total > 1:
+    store_path = '{}.part_at_{}_of_{}'.format(
+        store_path.rstrip('/'), part_at_i, part_total)
+  return store_path
+
+
+def create_proposal_writer(path_fn,
+                           manifest_file,
+                           store_path=None,
+                           store_dtype='float32'):
+  """Creates the writer persisting the proposals.
+
+  Args:
+    path_fn: a callable mapping from image_id to the path of the .npy file.
+    manifest_file: path to the manifest file of the .npy files.
+    store_path: if set, write to the proposal store instead of .npy files.
+    store_dtype: dtype of the boxes in the proposal store.
+
+  Returns:
+    a NpyProposalWriter or proposal_store.ProposalStoreWriter instance.
+  """
+  if store_path:
+    return proposal_store.ProposalStoreWriter(store_path, dtype=store_dtype)
+  return NpyProposalWriter(path_fn, manifest_file)
+
+
+def _init_worker(num_threads, options):
+  """Initializes the SelectiveSearchSegmentation of a worker process.
+
+  Args:
+    num_threads: number of OpenCV threads used by the worker.
+    options: a dict of keyword arguments passed to `py_selective_search`.
+  """
+  global _worker_ss
+  global _worker_options
+
+  cv2.setUseOptimized(True)
+  cv2.setNumThreads(num_threads)
+  _worker_ss = cv2.ximgproc.segmentation.createSelectiveSearchSegmentation()
+  _worker_options = options
+
+
+def _process_image(task):
+  """Extracts proposals in the worker process.
+
+  Args:
+    task: a tuple of (image_id, encoded_image).
+
+  Returns:
+    image_id: the image id.
+    proposals: a [num_proposals, 4] float numpy array.
+  """
+  image_id, encoded_image = task
+  bgr = cv2.imdecode(
+      np.frombuffer(encoded_image, dtype=np.uint8), cv2.IMREAD_COLOR)
+  return image_id, py_selective_search(bgr, _worker_ss, **_worker_options)
+
+
+def run_selective_search(image_iterator,
+                         writer,
+                         num_workers=0,
+                         queue_size=0,
+                         num_threads=1,
+                         log_every_n_images=100,
+                         **kwargs):
+  """Runs selective search over images using a pool of worker processes.
+
+  Images are read lazily and at most `queue_size` of them are in flight at any
+  time. Images already persisted by the writer are skipped without being
+  read, so a crashed run resumes where it stopped.
+
+  Args:
+    image_iterator: an iterable yielding (image_id, read_fn) tuples, in which
+      `read_fn` is a callable returning the encoded image bytes.
+    writer: a NpyProposalWriter or proposal_store.ProposalStoreWriter
+      instance, it is only used in the main process.
+    num_workers: number of worker processes, defaults to the number of cores.
+    queue_size: maximum number of images in flight, defaults to
+      4 * num_workers.
+    num_threads: number of OpenCV threads of each worker process.
+    log_every_n_images: log the throughput every this many images.
+    **kwargs: additional keyword arguments passed to `py_selective_search`.
+
+  Returns:
+    number of images processed in this run.
+  """
+  num_workers = num_workers or multiprocessing.cpu_count()
+  queue_size = queue_size or 4 * num_workers
+
+  tf.logging.info('Found %i finished images.', len(writer))
+
+  # The task generator is consumed by the task handler thread of the pool, the
+  # semaphore blocks it when `queue_size` images are in flight.
+
+  slots = threading.Semaphore(queue_size)
+  stopped = threading.Event()
+
+  def _task_generator():
+    for image_id, read_fn in image_iterator:
+      if image_id in writer:
+        continue
+      slots.acquire()
+      if stopped.is_set():
+        return
+      yield image_id, read_fn()
+
+  pool = multiprocessing.Pool(
+      num_workers, initializer=_init_worker, initargs=(num_threads, kwargs))
+
+  count = 0
+  start_time = time.time()
+  try:
+    for image_id, proposals in pool.imap_unordered(_process_image,
+                                                   _task_generator()):
+      slots.release()
+      writer.write(image_id, proposals)
+
+      count += 1
+      if count % log_every_n_images == 0:
+        tf.logging.info('On image %i, %.2lf images/sec.', count,
+                        count / (time.time() - start_time))
+    pool.close()
+  except:
+    # Unblock the task handler thread so that the pool can be terminated.
+    stopped.set()
+    slots.release()
+    pool.terminate()
+    raise
+  finally:
+    pool.join()
+
+  tf.logging.info('Processed %i images in %.2lf secs.', count,
+                  time.time() - start_time)
+  return count
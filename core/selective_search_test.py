@@ -0,0 +1,64 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import numpy as np
+import tensorflow as tf
+
+from core import selective_search
+
+
+class SelectiveSearchTest(tf.test.TestCase):
+
+  def test_save_proposals(self):
+    filename = os.path.join(self.get_temp_dir(), 'proposals.npy')
+    proposals = np.array([[0.0, 0.0, 1.0, 1.0], [0.1, 0.2, 0.3, 0.4]])
+
+    selective_search.save_proposals(filename, proposals)
+    self.assertFalse(os.path.isfile(filename + '.tmp'))
+    self.assertAllClose(np.load(filename), proposals)
+
+  def test_proposal_manifest(self):
+    filename = os.path.join(self.get_temp_dir(), 'manifest.txt')
+    if os.path.isfile(filename):
+      os.remove(filename)
+
+    manifest = selective_search.ProposalManifest(filename)
+    self.assertEqual(len(manifest), 0)
+    manifest.add(123)
+    manifest.add('000005')
+    self.assertIn(123, manifest)
+    self.assertIn('000005', manifest)
+    self.assertNotIn(5, manifest)
+    manifest.close()
+
+    # Records of the previous run are loaded.
+
+    manifest = selective_search.ProposalManifest(filename)
+    self.assertEqual(len(manifest), 2)
+    self.assertIn(123, manifest)
+    self.assertIn('000005', manifest)
+    manifest.close()
+
+  def test_get_manifest_file(self):
+    self.assertEqual(
+        selective_search.get_manifest_file('output', ''),
+        os.path.join('output', 'manifest.txt'))
+    self.assertEqual(
+        selective_search.get_manifest_file('output', '', 2, 4),
+        os.path.join('output', 'manifest.part_at_2_of_4.txt'))
+    self.assertEqual(
+        selective_search.get_manifest_file('output', 'done.txt', 0, 2),
+        'done.part_at_0_of_2.txt')
+
+  def test_get_proposal_store_path(self):
+    self.assertEqual(selective_search.get_proposal_store_path('', 2, 4), '')
+    self.assertEqual(selective_search.get_proposal_store_path('store'), 'store')
+    self.assertEqual(
+        selective_search.get_proposal_store_path('output/store/', 2, 4),
+        'output/store.part_at_2_of_4')
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -53,6 +53,7 @@ class TFExampleDataFields(object):
   proposal_box_xmin = "image/proposal/bbox/xmin"
   proposal_box_ymax = "image/proposal/bbox/ymax"
   proposal_box_xmax = "image/proposal/bbox/xmax"
+  proposal_box_encoded = "image/proposal/bbox/encoded"
 
   object_box = "image/object/bbox"
   object_text = "image/object/class/text"
@@ -107,6 +108,10 @@ class DetectionResultFields(object):
   detection_scores = 'detection_scores'
   detection_classes = 'detection_classes'
 
+  # Indices of the post-processed OICR stages, the detection fields are
+  # suffixed by `_at_{stage}`.
+  post_process_stages = 'post_process_stages'
+
 
 class GAPPredictionTasks(object):
   """Prediction tasks of the GAP model."""
@@ -133,6 +138,7 @@ class GAPPredictions(object):
 
   image_saliency = "image_saliency"
   image_score_map = "image_score_map"
+  image_score_map_saliency = "image_score_map_saliency"
   word_embedding = "word_embedding"
   word_saliency = "image_saliency"
   vocabulary = "vocabulary"
@@ -12,6 +12,7 @@ from models import builder
 import cv2
 from core import plotlib
 from core import imgproc
+from core import batch_inference
 from core.standard_fields import InputDataFields
 from core.standard_fields import GAPPredictions
 from core.standard_fields import GAPPredictionTasks
@@ -29,6 +30,14 @@ flags.DEFINE_string('demo_path', 'tmp',
 flags.DEFINE_string('model_dir', '',
                     'Path to the directory storing model checkpoints.')
 
+flags.DEFINE_integer('batch_size', 32, 'Batch size of the inference.')
+
+flags.DEFINE_integer('num_reader_threads', 4,
+                     'Number of threads to decode and resize the images.')
+
+flags.DEFINE_integer('num_writer_threads', 4,
+                     'Number of threads to render and save the results.')
+
 FLAGS = flags.FLAGS
 
 _SMALL_NUMBER = 1e-8
@@ -51,28 +60,45 @@ def _load_pipeline_proto(filename):
   return pipeline_proto
 
 
-def _get_score_map(input_path, output_path, names, score_map_func, shape):
-  """Gets the score map and save it to visualization file.
+def _load_image(input_path, height, width):
+  """Loads the image and resizes it to the model input size.
 
   Args:
     input_path: path to the input jpeg file.
+    height: height of the model input.
+    width: width of the model input.
+
+  Returns:
+    image_resized: a [height, width, 3] RGB uint8 numpy array.
+    image_data: the [image_height, image_width, 3] RGB uint8 numpy array.
+    None is returned if the image could not be read.
+  """
+  image_data = cv2.imread(input_path)
+  if image_data is None:
+    return None
+  image_data = image_data[:, :, ::-1]  # To RGB.
+  image_resized = cv2.resize(image_data, (width, height))
+  return image_resized, image_data
+
+
+def _write_score_map(output_path, image_data, names, score_map_list, shape):
+  """Saves the score maps to visualization files.
+
+  Args:
     output_path: path to the output jpeg file.
+    image_data: a [image_height, image_width, 3] RGB uint8 numpy array.
     names: name of each score map.
-    score_map_func: a callable that takes [height, width, 3] RGB numpy image as
-      input and outputs the [height, width, 1] float array denoting saliency map 
-      and a [height, width, num_classes] float array denoting score maps.
+    score_map_list: a list of [height, width] float arrays, the smoothed and
+      the raw saliency maps followed by the score map of each class.
     shape: a tuple (height, width) defines the shape of output visualizations.
   """
-  image_data = cv2.imread(input_path)[:, :, ::-1]  # To RGB.
-
-  score_map_list = score_map_func(image_data)
-
   image_data = cv2.resize(image_data, shape)
   outputs = []
   outputs.append(image_data)
   for i, score_map in enumerate(score_map_list):
-    outputs.append((255.0 * plotlib._py_convert_to_heatmap(
-        np.squeeze(score_map), normalize=(i == 0))).astype(np.uint8))
+    outputs.append(
+        plotlib._py_convert_to_heatmap_uint8(
+            np.squeeze(score_map), normalize=(i < 2)))
 
   for name, output in zip(['original'] + names, outputs):
     tf.logging.info("output shape: %s", output.shape)
@@ -104,28 +130,36 @@ def main(_):
   g = tf.Graph()
   with g.as_default():
 
-    image = tf.placeholder(tf.uint8, shape=[None, None, 3])
-    image_resized = tf.image.resize_images(image, [
-        pipeline_proto.eval_reader.image_height,
-        pipeline_proto.eval_reader.image_width
-    ])
+    height = pipeline_proto.eval_reader.image_height
+    width = pipeline_proto.eval_reader.image_width
+
+    image = tf.placeholder(tf.uint8, shape=[None, height, width, 3])
 
     model = builder.build(pipeline_proto.model, is_training=False)
     prediction_dict = model.build_prediction(
         examples={
-            InputDataFields.image: tf.expand_dims(image_resized, 0),
+            InputDataFields.image: tf.to_float(image),
             InputDataFields.category_strings: tf.constant(categories)
         },
-        prediction_task=GAPPredictionTasks.image_score_map)
-
-    # height, width = tf.shape(image)[0], tf.shape(image)[1]
-
-    (saliency_map,
-     score_maps) = (prediction_dict[GAPPredictions.image_saliency],
-                    prediction_dict[GAPPredictions.image_score_map])
-
-    score_map_list = [tf.squeeze(saliency_map, axis=-1)] + tf.unstack(
-        score_maps, axis=-1)
+        prediction_task=[
+            GAPPredictionTasks.image_score_map,
+            GAPPredictionTasks.image_saliency
+        ])
+
+    # The tasks share the CNN pass. The raw saliency is resized without
+    # smoothing, to compare with the smoothed one of the score map.
+
+    (saliency_map, raw_saliency_map, score_maps) = (
+        prediction_dict[GAPPredictions.image_score_map_saliency],
+        prediction_dict[GAPPredictions.image_saliency],
+        prediction_dict[GAPPredictions.image_score_map])
+    raw_saliency_map = tf.image.resize_images(
+        tf.expand_dims(raw_saliency_map, axis=-1), [height, width])
+
+    score_map_list = [
+        tf.squeeze(saliency_map, axis=-1),
+        tf.squeeze(raw_saliency_map, axis=-1)
+    ] + tf.unstack(score_maps, axis=-1)
 
     tf.logging.info("score map list size: %d", len(score_map_list))
     for i, x in enumerate(score_map_list):
@@ -148,18 +182,20 @@ def main(_):
 
     # Iterate the testdir to generate the demo results.
 
-    score_map_func = lambda x: sess.run(score_map_list, feed_dict={image: x})
-
-    for filename in os.listdir(FLAGS.image_path):
-      tf.logging.info('On processing %s', filename)
-
-      _get_score_map(
-          input_path=os.path.join(FLAGS.image_path, filename),
-          output_path=os.path.join(FLAGS.demo_path, filename),
-          names=['saliency'] + categories,
-          score_map_func=score_map_func,
-          shape=(pipeline_proto.eval_reader.image_height,
-                 pipeline_proto.eval_reader.image_width))
+    batch_inference.run_batched_inference(
+        batch_inference.list_image_files(FLAGS.image_path),
+        load_fn=lambda filename: _load_image(
+            os.path.join(FLAGS.image_path, filename), height, width),
+        predict_fn=lambda x: sess.run(score_map_list, feed_dict={image: x}),
+        write_fn=lambda filename, image_data, outputs: _write_score_map(
+            output_path=os.path.join(FLAGS.demo_path, filename),
+            image_data=image_data,
+            names=['saliency', 'raw_saliency'] + categories,
+            score_map_list=outputs,
+            shape=(height, width)),
+        batch_size=FLAGS.batch_size,
+        num_reader_threads=FLAGS.num_reader_threads,
+        num_writer_threads=FLAGS.num_writer_threads)
 
   tf.logging.info('Done')
 
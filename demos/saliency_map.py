@@ -12,6 +12,7 @@ from protos import pipeline_pb2
 from models import builder
 import cv2
 from core import plotlib
+from core import batch_inference
 from core.standard_fields import InputDataFields
 from core.standard_fields import GAPPredictions
 from core.standard_fields import GAPPredictionTasks
@@ -29,6 +30,14 @@ flags.DEFINE_string('demo_path',
     'tmp', 
     'Path to the directory storing demo results.')
 
+flags.DEFINE_integer('batch_size', 32, 'Batch size of the inference.')
+
+flags.DEFINE_integer('num_reader_threads', 4,
+                     'Number of threads to decode and resize the images.')
+
+flags.DEFINE_integer('num_writer_threads', 4,
+                     'Number of threads to blend and save the results.')
+
 FLAGS = flags.FLAGS
 
 _SMALL_NUMBER = 1e-8
@@ -51,30 +60,44 @@ def _load_pipeline_proto(filename):
   return pipeline_proto
 
 
-def _get_saliency(input_path, output_path, saliency_func):
-  """Gets the saliency map and save it to visualization file.
+def _load_image(input_path, height, width):
+  """Loads the image and resizes it to the model input size.
 
   Args:
     input_path: path to the input jpeg file.
+    height: height of the model input.
+    width: width of the model input.
+
+  Returns:
+    image_resized: a [height, width, 3] RGB uint8 numpy array.
+    image_data: the [image_height, image_width, 3] RGB uint8 numpy array.
+    None is returned if the image could not be read.
+  """
+  image_data = cv2.imread(input_path)
+  if image_data is None:
+    return None
+  image_data = image_data[:, :, ::-1]  # To RGB.
+  image_resized = cv2.resize(image_data, (width, height))
+  return image_resized, image_data
+
+
+def _write_saliency(output_path, image_data, saliency):
+  """Merges the saliency map with the image and saves it to the file.
+
+  Args:
     output_path: path to the output jpeg file.
-    saliency_func: a callable that takes [height, width, 3] RGB numpy image as
-      input and outputs the [height, width] float array denoting saliency.
+    image_data: a [height, width, 3] RGB uint8 numpy array.
+    saliency: a [feature_height, feature_width] float array denoting saliency.
   """
-  image_data = cv2.imread(input_path)[:, :, ::-1]  # To RGB.
-  saliency = saliency_func(image_data)
+  height, width = image_data.shape[:2]
+  saliency = cv2.resize(
+      saliency, (width, height), interpolation=cv2.INTER_NEAREST)
 
   min_v, max_v = saliency.min(), saliency.max()
   saliency = (saliency- min_v) / (_SMALL_NUMBER + max_v - min_v)
 
-  # Merge image and heatmap.
-  heatmap = plotlib._py_convert_to_heatmap(saliency, normalize=False)
-
-  saliency = np.expand_dims(saliency, -1)
-  output = np.add(
-      np.multiply(1.0 - saliency, image_data.astype(np.float32)),
-      np.multiply(saliency, heatmap * 255.0))
-
-  output = output.astype(np.uint8)
+  # Merge image and heatmap, in place.
+  output = plotlib._py_show_heatmap(image_data, saliency, out=image_data)
   cv2.imwrite(output_path, output[:, :, ::-1])  # To BGR.
 
 
@@ -88,20 +111,17 @@ def main(_):
 
     # Infer saliency.
 
-    image = tf.placeholder(tf.uint8, shape=[None, None, 3])
-    image_resized = tf.image.resize_images(
-        image, [pipeline_proto.eval_reader.image_height,
-        pipeline_proto.eval_reader.image_width])
+    height = pipeline_proto.eval_reader.image_height
+    width = pipeline_proto.eval_reader.image_width
+
+    image = tf.placeholder(tf.uint8, shape=[None, height, width, 3])
 
     model = builder.build(pipeline_proto.model, is_training=False)
     predictions = model.build_prediction(
-        examples={ InputDataFields.image: tf.expand_dims(image_resized, 0)}, 
+        examples={ InputDataFields.image: tf.to_float(image)}, 
         prediction_task=GAPPredictionTasks.image_saliency)
 
-    height, width = tf.shape(image)[0], tf.shape(image)[1]
-    saliency = tf.image.resize_images(
-        tf.expand_dims(predictions[GAPPredictions.image_saliency], axis=-1), 
-        [height, width], tf.image.ResizeMethod.NEAREST_NEIGHBOR)[:, :, :, 0]
+    saliency = predictions[GAPPredictions.image_saliency]
 
     saver = tf.train.Saver()
     invalid_variable_names = tf.report_uninitialized_variables()
@@ -118,15 +138,16 @@ def main(_):
 
     # Iterate the testdir to generate the demo results.
 
-    saliency_func = lambda x: sess.run(saliency[0], feed_dict={ image: x })
-
-    for filename in os.listdir(FLAGS.image_path):
-      tf.logging.info('On processing %s', filename)
-
-      _get_saliency(
-          input_path=os.path.join(FLAGS.image_path, filename),
-          output_path=os.path.join(FLAGS.demo_path, filename),
-          saliency_func=saliency_func)
+    batch_inference.run_batched_inference(
+        batch_inference.list_image_files(FLAGS.image_path),
+        load_fn=lambda filename: _load_image(
+            os.path.join(FLAGS.image_path, filename), height, width),
+        predict_fn=lambda x: sess.run([saliency], feed_dict={ image: x }),
+        write_fn=lambda filename, image_data, outputs: _write_saliency(
+            os.path.join(FLAGS.demo_path, filename), image_data, *outputs),
+        batch_size=FLAGS.batch_size,
+        num_reader_threads=FLAGS.num_reader_threads,
+        num_writer_threads=FLAGS.num_writer_threads)
 
   tf.logging.info('Done')
 
@@ -20,11 +20,9 @@ from core.standard_fields import DetectionResultFields
 from core.training_utils import build_hyperparams
 from core import init_grid_anchors
 from models import utils as model_utils
-from core import box_utils
 
 from object_detection.builders import hyperparams_builder
 from object_detection.builders import box_predictor_builder
-from object_detection.core.post_processing import batch_multiclass_non_max_suppression
 from object_detection.builders.model_builder import _build_faster_rcnn_feature_extractor as build_faster_rcnn_feature_extractor
 
 slim = tf.contrib.slim
@@ -188,49 +186,44 @@ class Model(ModelBase):
   def _post_process(self,
                     boxes,
                     scores,
-                    score_thresh=1e-6,
                     iou_thresh=0.5,
                     max_size_per_class=100,
                     max_total_size=300):
     """Applies post process to get the final detections.
 
+    Only the top `pre_nms_top_k` boxes per class scoring higher than
+    `post_process_score_thresh` are fed to the NMS selected by `nms_type`.
+
     Args:
-      boxes: A [batch_size, num_anchors, q, 4] float32 tensor containing
-        detections. If `q` is 1 then same boxes are used for all classes
-          otherwise, if `q` is equal to number of classes, class-specific boxes
-          are used.
+      boxes: A [batch_size, num_anchors, 4] float32 tensor containing
+        detections, the same boxes are used for all classes.
       scores: A [batch_size, num_anchors, num_classes] float32 tensor containing
-        the scores for each of the `num_anchors` detections. The scores have to be
-        non-negative when use_static_shapes is set True.
-      score_thresh: scalar threshold for score (low scoring boxes are removed).
+        the scores for each of the `num_anchors` detections.
       iou_thresh: scalar threshold for IOU (new boxes that have high IOU overlap
         with previously selected boxes are removed).
       max_size_per_class: maximum number of retained boxes per class.
-      max_total_size: maximum number of boxes retained over all classes. By
-        default returns all boxes retained after capping boxes per class.
-
-  Returns:
-    num_detections: A [batch_size] int32 tensor indicating the number of
-      valid detections per batch item. Only the top num_detections[i] entries in
-      nms_boxes[i], nms_scores[i] and nms_class[i] are valid. The rest of the
-      entries are zero paddings.
-    nmsed_boxes: A [batch_size, max_detections, 4] float32 tensor
-      containing the non-max suppressed boxes.
-    nmsed_scores: A [batch_size, max_detections] float32 tensor containing
-      the scores for the boxes.
-    nmsed_classes: A [batch_size, max_detections] float32 tensor
-      containing the class for boxes.
+      max_total_size: maximum number of boxes retained over all classes.
+
+    Returns:
+      num_detections: A [batch_size] int32 tensor indicating the number of
+        valid detections per batch item.
+      nmsed_boxes: A [batch_size, max_total_size, 4] float32 tensor
+        containing the non-max suppressed boxes.
+      nmsed_scores: A [batch_size, max_total_size] float32 tensor containing
+        the scores for the boxes.
+      nmsed_classes: A [batch_size, max_total_size] float32 tensor
+        containing the 1-based class for boxes.
     """
-    boxes = tf.expand_dims(boxes, axis=2)
-    (nmsed_boxes, nmsed_scores, nmsed_classes, _, _,
-     num_detections) = batch_multiclass_non_max_suppression(
-         boxes,
-         scores,
-         score_thresh=score_thresh,
-         iou_thresh=iou_thresh,
-         max_size_per_class=max_size_per_class,
-         max_total_size=max_total_size)
-    return num_detections, nmsed_boxes, nmsed_scores, nmsed_classes + 1
+    options = self._model_proto
+    return model_utils.post_process(
+        boxes,
+        scores,
+        score_thresh=options.post_process_score_thresh,
+        iou_thresh=iou_thresh,
+        max_size_per_class=max_size_per_class,
+        max_total_size=max_total_size,
+        pre_nms_top_k=options.pre_nms_top_k,
+        nms_type=options.nms_type)
 
   def build_prediction(self,
                        examples,
@@ -349,12 +342,21 @@ class Model(ModelBase):
     midn_proposal_scores = tf.multiply(
         tf.expand_dims(tf.nn.softmax(midn_logits), axis=1), proba_r_given_c)
 
-    (predictions[DetectionResultFields.num_detections + '_at_{}'.format(0)],
-     predictions[DetectionResultFields.detection_boxes + '_at_{}'.format(0)],
-     predictions[DetectionResultFields.detection_scores + '_at_{}'.format(0)],
-     predictions[DetectionResultFields.detection_classes +
-                 '_at_{}'.format(0)]) = self._post_process(
-                     proposals, midn_proposal_scores)
+    post_process_stages = model_utils.get_post_process_stages(
+        options.oicr_iterations, options.post_process_stages)
+    predictions[DetectionResultFields.post_process_stages] = tf.constant(
+        post_process_stages, dtype=tf.int32)
+
+    if 0 in post_process_stages:
+      (predictions[DetectionResultFields.num_detections +
+                   '_at_{}'.format(0)],
+       predictions[DetectionResultFields.detection_boxes +
+                   '_at_{}'.format(0)],
+       predictions[DetectionResultFields.detection_scores +
+                   '_at_{}'.format(0)],
+       predictions[DetectionResultFields.detection_classes +
+                   '_at_{}'.format(0)]) = self._post_process(
+                       proposals, midn_proposal_scores)
 
     self._visl_proposals(
         inputs, num_proposals, proposals, name='proposals', top_k=2000)
@@ -363,19 +365,20 @@ class Model(ModelBase):
       predictions[OICRPredictions.oicr_proposal_scores +
                   '_at_{}'.format(i + 1)] = oicr_proposal_scores_at_i
 
-      (predictions[DetectionResultFields.num_detections +
-                   '_at_{}'.format(i + 1)],
-       predictions[DetectionResultFields.detection_boxes +
-                   '_at_{}'.format(i + 1)],
-       predictions[DetectionResultFields.detection_scores +
-                   '_at_{}'.format(i + 1)],
-       predictions[DetectionResultFields.detection_classes +
-                   '_at_{}'.format(i + 1)]) = self._post_process(
-                       proposals,
-                       tf.nn.softmax(oicr_proposal_scores_at_i,
-                                     axis=-1)[:, :, 1:])
-
-    for i in range(1 + options.oicr_iterations):
+      if i + 1 in post_process_stages:
+        (predictions[DetectionResultFields.num_detections +
+                     '_at_{}'.format(i + 1)],
+         predictions[DetectionResultFields.detection_boxes +
+                     '_at_{}'.format(i + 1)],
+         predictions[DetectionResultFields.detection_scores +
+                     '_at_{}'.format(i + 1)],
+         predictions[DetectionResultFields.detection_classes +
+                     '_at_{}'.format(i + 1)]) = self._post_process(
+                         proposals,
+                         tf.nn.softmax(oicr_proposal_scores_at_i,
+                                       axis=-1)[:, :, 1:])
+
+    for i in post_process_stages:
       num_detections, detection_boxes, detection_scores, detection_classes = (
           predictions[DetectionResultFields.num_detections +
                       '_at_{}'.format(i)],
@@ -420,104 +423,6 @@ class Model(ModelBase):
 
     return labels
 
-  def _calc_oicr_loss(self,
-                      labels,
-                      num_proposals,
-                      proposals,
-                      scores_0,
-                      scores_1,
-                      scope,
-                      iou_threshold=0.5):
-    """Calculates the OICR loss at refinement stage `i`.
-
-    Args:
-      labels: A [batch, num_classes] float tensor.
-      num_proposals: A [batch] int tensor.
-      proposals: A [batch, max_num_proposals, 4] float tensor.
-      scores_0: A [batch, max_num_proposal, 1 + num_classes] float tensor, 
-        representing the proposal score at `k-th` refinement.
-      scores_1: A [batch, max_num_proposal, 1 + num_classes] float tensor,
-        representing the proposal score at `(k+1)-th` refinement.
-
-    Returns:
-      oicr_cross_entropy_loss: a scalar float tensor.
-    """
-    with tf.name_scope(scope):
-      (batch, max_num_proposals,
-       num_classes_plus_one) = utils.get_tensor_shape(scores_0)
-      num_classes = num_classes_plus_one - 1
-
-      # For each class, look for the most confident proposal.
-      #   proposal_ind shape = [batch, num_classes].
-
-      proposal_mask = tf.sequence_mask(
-          num_proposals, maxlen=max_num_proposals, dtype=tf.float32)
-      proposal_ind = utils.masked_argmax(
-          tf.nn.softmax(scores_0, axis=-1)[:, :, 1:],
-          tf.expand_dims(proposal_mask, axis=-1),
-          dim=1)
-
-      # Deal with the most confident proposal per each class.
-      #   Unstack the `proposal_ind`, `labels`.
-      #   proposal_labels shape = [batch, max_num_proposals, num_classes].
-
-      proposal_labels = []
-      indices_0 = tf.range(batch, dtype=tf.int64)
-      for indices_1, label_per_class in zip(
-          tf.unstack(proposal_ind, axis=-1), tf.unstack(labels, axis=-1)):
-
-        # Gather the most confident proposal for the class.
-        #   confident_proosal shape = [batch, 4].
-
-        indices = tf.stack([indices_0, indices_1], axis=-1)
-        confident_proposal = tf.gather_nd(proposals, indices)
-
-        # Get the Iou from all the proposals to the most confident proposal.
-        #   iou shape = [batch, max_num_proposals].
-
-        confident_proposal_tiled = tf.tile(
-            tf.expand_dims(confident_proposal, axis=1),
-            [1, max_num_proposals, 1])
-        iou = box_utils.iou(
-            tf.reshape(proposals, [-1, 4]),
-            tf.reshape(confident_proposal_tiled, [-1, 4]))
-        iou = tf.reshape(iou, [batch, max_num_proposals])
-
-        # Filter out irrelevant predictions using image-level label.
-
-        target = tf.to_float(tf.greater_equal(iou, iou_threshold))
-        target = tf.where(
-            label_per_class > 0, x=target, y=tf.zeros_like(target))
-        proposal_labels.append(target)
-
-      proposal_labels = tf.stack(proposal_labels, axis=-1)
-
-      # Add background targets, and normalize the sum value to 1.0.
-      #   proposal_labels shape = [batch, max_num_proposals, 1 + num_classes].
-
-      bkg = tf.logical_not(tf.reduce_sum(proposal_labels, axis=-1) > 0)
-      proposal_labels = tf.concat(
-          [tf.expand_dims(tf.to_float(bkg), axis=-1), proposal_labels], axis=-1)
-
-      proposal_labels = tf.div(
-          proposal_labels, tf.reduce_sum(
-              proposal_labels, axis=-1, keepdims=True))
-
-      assert_op = tf.Assert(
-          tf.reduce_all(
-              tf.abs(tf.reduce_sum(proposal_labels, axis=-1) - 1) < 1e-6),
-          ["Probabilities not sum to ONE", proposal_labels])
-
-      # Compute the loss.
-
-      with tf.control_dependencies([assert_op]):
-        losses = tf.nn.softmax_cross_entropy_with_logits(
-            labels=tf.stop_gradient(proposal_labels), logits=scores_1)
-        oicr_cross_entropy_loss = tf.reduce_mean(
-            utils.masked_avg(data=losses, mask=proposal_mask, dim=1))
-
-    return oicr_cross_entropy_loss
-
   def build_loss(self, predictions, examples, **kwargs):
     """Build tf graph to compute loss.
 
@@ -566,11 +471,11 @@ class Model(ModelBase):
       for i in range(options.oicr_iterations):
         proposal_scores_1 = predictions[OICRPredictions.oicr_proposal_scores +
                                         '_at_{}'.format(i + 1)]
-        oicr_cross_entropy_loss_at_i = self._calc_oicr_loss(
+        oicr_cross_entropy_loss_at_i = model_utils.calc_oicr_loss(
             labels,
             num_proposals,
             proposals,
-            proposal_scores_0,
+            tf.nn.softmax(proposal_scores_0, axis=-1),
             proposal_scores_1,
             scope='oicr_{}'.format(i + 1),
             iou_threshold=options.oicr_iou_threshold)
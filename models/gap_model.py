@@ -48,6 +48,9 @@ class Model(ModelBase):
     if not isinstance(model_proto, gap_model_pb2.GAPModel):
       raise ValueError('The model_proto has to be an instance of GAPModel.')
 
+    self._image_feature_cache = {}
+    self._image_feature_cache_graph = None
+
   def get_variables_to_train(self):
     """Returns model variables.
       
@@ -331,6 +334,53 @@ class Model(ModelBase):
             activation_fn=None)
     return feature_map
 
+  def _encode_and_project_images(self, image):
+    """Extracts the projected image feature.
+
+    The feature is cached by the image tensor, so that the prediction tasks
+    built on the same image share a single CNN pass. The cache only holds the
+    tensors of the graph of the latest image, it is reset when the model is
+    reused in another graph.
+
+    Args:
+      image: a [batch, height, width, channels] float tensor, the values are 
+        ranging from [0.0, 255.0].
+
+    Returns:
+      feature_map: a [batch, feature_height, feature_width, common_dimensions] 
+        float tensor.
+    """
+    if self._image_feature_cache_graph is not image.graph:
+      self._image_feature_cache = {}
+      self._image_feature_cache_graph = image.graph
+
+    if image in self._image_feature_cache:
+      return self._image_feature_cache[image]
+
+    options = self._model_proto
+    is_training = self._is_training
+
+    feature_map = self._encode_images(
+        image,
+        cnn_name=options.cnn_name,
+        cnn_trainable=options.cnn_trainable,
+        cnn_weight_decay=options.cnn_weight_decay,
+        cnn_feature_map=options.cnn_feature_map,
+        cnn_dropout_keep_prob=options.cnn_dropout_keep_prob,
+        cnn_checkpoint=options.cnn_checkpoint,
+        cnn_scope=GAPVariableScopes.cnn,
+        is_training=is_training)
+
+    feature_map = self._project_images(
+        feature_map,
+        common_dimensions=options.common_dimensions,
+        scope=GAPVariableScopes.image_proj,
+        hyperparams=options.image_proj_hyperparams,
+        is_training=is_training)
+
+    self._image_feature_cache[image] = feature_map
+    return feature_map
+
   def _calc_saliency_score(self,
                            inputs,
                            scope,
@@ -377,23 +427,7 @@ class Model(ModelBase):
     # Extract image feature, shape =
     #   [batch, feature_height * feature_width, common_dimensions].
 
-    image_feature = self._encode_images(
-        image,
-        cnn_name=options.cnn_name,
-        cnn_trainable=options.cnn_trainable,
-        cnn_weight_decay=options.cnn_weight_decay,
-        cnn_feature_map=options.cnn_feature_map,
-        cnn_dropout_keep_prob=options.cnn_dropout_keep_prob,
-        cnn_checkpoint=options.cnn_checkpoint,
-        cnn_scope=GAPVariableScopes.cnn,
-        is_training=is_training)
-
-    image_feature = self._project_images(
-        image_feature,
-        common_dimensions=options.common_dimensions,
-        scope=GAPVariableScopes.image_proj,
-        hyperparams=options.image_proj_hyperparams,
-        is_training=is_training)
+    image_feature = self._encode_and_project_images(image)
 
     (batch, feature_height, feature_width,
      common_dimensions) = utils.get_tensor_shape(image_feature)
@@ -475,7 +509,7 @@ class Model(ModelBase):
     score_map = resize_fn(score_map)
 
     return {
-        GAPPredictions.image_saliency: image_saliency,
+        GAPPredictions.image_score_map_saliency: image_saliency,
         GAPPredictions.image_score_map: score_map
     }
 
@@ -500,23 +534,7 @@ class Model(ModelBase):
     # Extract image feature, shape =
     #   [batch, feature_height * feature_width, common_dimensions].
 
-    image_feature = self._encode_images(
-        image,
-        cnn_name=options.cnn_name,
-        cnn_trainable=options.cnn_trainable,
-        cnn_weight_decay=options.cnn_weight_decay,
-        cnn_feature_map=options.cnn_feature_map,
-        cnn_dropout_keep_prob=options.cnn_dropout_keep_prob,
-        cnn_checkpoint=options.cnn_checkpoint,
-        cnn_scope=GAPVariableScopes.cnn,
-        is_training=is_training)
-
-    image_feature = self._project_images(
-        image_feature,
-        common_dimensions=options.common_dimensions,
-        scope=GAPVariableScopes.image_proj,
-        hyperparams=options.image_proj_hyperparams,
-        is_training=is_training)
+    image_feature = self._encode_and_project_images(image)
 
     (batch, feature_height, feature_width,
      common_dimensions) = utils.get_tensor_shape(image_feature)
@@ -597,17 +615,6 @@ class Model(ModelBase):
                          examples[InputDataFields.caption_strings],
                          examples[InputDataFields.caption_lengths])
 
-    image_feature = self._encode_images(
-        image,
-        cnn_name=options.cnn_name,
-        cnn_trainable=options.cnn_trainable,
-        cnn_weight_decay=options.cnn_weight_decay,
-        cnn_feature_map=options.cnn_feature_map,
-        cnn_dropout_keep_prob=options.cnn_dropout_keep_prob,
-        cnn_checkpoint=options.cnn_checkpoint,
-        cnn_scope=GAPVariableScopes.cnn,
-        is_training=is_training)
-
     (image_ids_gathered, caption_strings_gathered,
      caption_lengths_gathered) = model_utils.gather_in_batch_captions(
          image_id, num_captions, caption_strings, caption_lengths)
@@ -616,12 +623,7 @@ class Model(ModelBase):
     #   [batch, feature_height * feature_width, common_dimensions].
 
     with tf.name_scope(OperationNames.image_model):
-      image_feature = self._project_images(
-          image_feature,
-          common_dimensions=options.common_dimensions,
-          scope=GAPVariableScopes.image_proj,
-          hyperparams=options.image_proj_hyperparams,
-          is_training=is_training)
+      image_feature = self._encode_and_project_images(image)
 
       (batch, feature_height, feature_width,
        common_dimensions) = utils.get_tensor_shape(image_feature)
@@ -760,11 +762,26 @@ class Model(ModelBase):
 
     Args:
       examples: dict of input tensors keyed by name.
-      prediction_task: the specific prediction task.
+      prediction_task: the specific prediction task, or a list of tasks. The
+        tasks in the list share the CNN feature and the prediction heads.
 
     Returns:
       predictions: dict of prediction results keyed by name.
+
+    Raises:
+      ValueError: if the prediction task is invalid, or two tasks in the list
+        predict different results under the same name.
     """
+    if isinstance(prediction_task, (list, tuple)):
+      predictions = {}
+      with tf.variable_scope(tf.get_variable_scope(), reuse=tf.AUTO_REUSE):
+        for task in prediction_task:
+          for name, value in self.build_prediction(examples, task).items():
+            if name in predictions and predictions[name] is not value:
+              raise ValueError("Prediction %s is predicted by multiple tasks." %
+                               (name))
+            predictions[name] = value
+      return predictions
 
     if prediction_task == GAPPredictionTasks.similarity:
       return self._predict_similarity(examples)
@@ -2,11 +2,15 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
 import numpy as np
 import tensorflow as tf
 from google.protobuf import text_format
 
 from models import gap_model
+from core.standard_fields import InputDataFields
+from core.standard_fields import GAPPredictions
+from core.standard_fields import GAPPredictionTasks
 from protos import gap_model_pb2
 from protos import hyperparams_pb2
 
@@ -119,6 +123,112 @@ class GAPModelTest(tf.test.TestCase):
         is_training=False)
     self.assertAllEqual(feature_map.get_shape().as_list(), [32, 14, 14, 199])
 
+  def test_encode_and_project_images(self):
+    model_proto = gap_model_pb2.GAPModel()
+    text_format.Merge(
+        r"""
+        cnn_name: "mobilenet_v1"
+        cnn_feature_map: "Conv2d_13_pointwise"
+        common_dimensions: 50
+        image_proj_hyperparams {
+          op: CONV
+          activation: NONE
+          regularizer {
+            l2_regularizer {
+              weight: 1e-8
+            }
+          }
+          initializer {
+            truncated_normal_initializer {
+              mean: 0.0
+              stddev: 0.03
+            }
+          }
+        }
+        """, model_proto)
+    model = gap_model.Model(model_proto, is_training=False)
+
+    # The CNN runs once per image tensor.
+
+    tf.reset_default_graph()
+
+    image = tf.random_uniform(shape=[32, 224, 224, 3])
+    feature_map = model._encode_and_project_images(image)
+    self.assertAllEqual(feature_map.get_shape().as_list(), [32, 7, 7, 50])
+
+    num_ops = len(tf.get_default_graph().get_operations())
+    self.assertIs(model._encode_and_project_images(image), feature_map)
+    self.assertEqual(len(tf.get_default_graph().get_operations()), num_ops)
+
+    # The features of another graph are not reused.
+
+    g = tf.Graph()
+    with g.as_default():
+      image = tf.random_uniform(shape=[32, 224, 224, 3])
+      feature_map = model._encode_and_project_images(image)
+      self.assertIs(feature_map.graph, g)
+      self.assertEqual(len(model._image_feature_cache), 1)
+
+  def test_build_prediction_with_multiple_tasks(self):
+    vocabulary_file = os.path.join(self.get_temp_dir(), 'vocab.txt')
+    with open(vocabulary_file, 'w') as fid:
+      fid.write('dog\ncat\n')
+
+    model_proto = gap_model_pb2.GAPModel()
+    text_format.Merge(
+        r"""
+        cnn_name: "mobilenet_v1"
+        cnn_feature_map: "Conv2d_13_pointwise"
+        common_dimensions: 50
+        use_saliency_score: true
+        image_proj_hyperparams {
+          op: CONV
+          activation: NONE
+          initializer {
+            truncated_normal_initializer {
+              mean: 0.0
+              stddev: 0.03
+            }
+          }
+        }
+        image_saliency_hyperparams {
+          op: CONV
+          activation: NONE
+          initializer {
+            truncated_normal_initializer {
+              mean: 0.0
+              stddev: 0.03
+            }
+          }
+        }
+        """, model_proto)
+    model_proto.vocabulary_file = vocabulary_file
+    model = gap_model.Model(model_proto, is_training=False)
+
+    # The resized saliency of the score map does not collide with the raw
+    # saliency.
+
+    tf.reset_default_graph()
+
+    predictions = model.build_prediction(
+        examples={
+            InputDataFields.image: tf.random_uniform(shape=[2, 224, 224, 3]),
+            InputDataFields.category_strings: tf.constant(['dog', 'cat']),
+        },
+        prediction_task=[
+            GAPPredictionTasks.image_score_map,
+            GAPPredictionTasks.image_saliency
+        ])
+    self.assertAllEqual(
+        predictions[GAPPredictions.image_saliency].get_shape().as_list(),
+        [2, 7, 7])
+    self.assertAllEqual(
+        predictions[GAPPredictions.image_score_map_saliency].get_shape()
+        .as_list(), [2, 224, 224, 1])
+    self.assertAllEqual(
+        predictions[GAPPredictions.image_score_map].get_shape().as_list(),
+        [2, 224, 224, 2])
+
   def test_encode_captions(self):
     model_proto = gap_model_pb2.GAPModel()
     model = gap_model.Model(model_proto, is_training=False)
@@ -0,0 +1,115 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import numpy as np
+import tensorflow as tf
+from google.protobuf import text_format
+
+from models import oicr_model
+from protos import oicr_model_pb2
+from core.standard_fields import InputDataFields
+from core.standard_fields import DetectionResultFields
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+_MODEL_CONFIG = r"""
+  feature_extractor: SPP
+  spp_bins: 1
+  feature_crop_size: 4
+  oicr_iterations: 1
+  pre_nms_top_k: 5
+  nms_type: VECTORIZED_NMS
+  fc_hyperparams {
+    op: FC
+    activation: NONE
+    initializer {
+      truncated_normal_initializer {
+        mean: 0.0
+        stddev: 0.01
+      }
+    }
+  }
+"""
+
+
+class OICRModelTest(tf.test.TestCase):
+
+  def _build_model_proto(self, config):
+    vocabulary_file = os.path.join(self.get_temp_dir(), 'vocab.txt')
+    with open(vocabulary_file, 'w') as fid:
+      fid.write('dog\ncat\n')
+
+    model_proto = oicr_model_pb2.OICRModel()
+    text_format.Merge(config, model_proto)
+    model_proto.vocabulary_file = vocabulary_file
+    return model_proto
+
+  def test_build_prediction_with_vectorized_nms(self):
+    model = oicr_model.Model(
+        self._build_model_proto(_MODEL_CONFIG), is_training=False)
+
+    g = tf.Graph()
+    with g.as_default():
+      predictions = model.build_prediction(
+          examples={
+              InputDataFields.image:
+              tf.random_uniform([2, 64, 64, 3], maxval=255.0),
+              InputDataFields.num_proposals:
+              tf.constant([3, 2]),
+              InputDataFields.proposals:
+              tf.constant([[[0.0, 0.0, 1.0, 1.0], [0.0, 0.0, 0.5, 0.5],
+                            [0.5, 0.5, 1.0, 1.0]],
+                           [[0.0, 0.0, 0.6, 0.6], [0.4, 0.4, 1.0, 1.0],
+                            [0.0, 0.0, 0.0, 0.0]]]),
+              InputDataFields.caption_strings:
+              tf.constant([[['dog']], [['cat']]]),
+          })
+
+      # The post-process of all the stages uses the vectorized NMS.
+
+      op_names = [op.name for op in g.get_operations()]
+      self.assertTrue(
+          any('VectorizedMultiClassNonMaxSuppression' in x for x in op_names))
+      self.assertFalse(
+          any('BatchMultiClassNonMaxSuppression' in x for x in op_names))
+
+      init_op = tf.global_variables_initializer()
+      table_init_op = tf.tables_initializer()
+
+    with self.test_session(graph=g) as sess:
+      sess.run([init_op, table_init_op])
+      for i in [0, 1]:
+        num_detections, detection_classes = sess.run([
+            predictions[DetectionResultFields.num_detections +
+                        '_at_{}'.format(i)],
+            predictions[DetectionResultFields.detection_classes +
+                        '_at_{}'.format(i)],
+        ])
+        self.assertAllEqual(detection_classes.shape, [2, 300])
+        for num, classes in zip(num_detections, detection_classes):
+          self.assertLessEqual(num, 2 * 3)
+          self.assertTrue(np.all(classes[:num] >= 1))
+          self.assertTrue(np.all(classes[:num] <= 2))
+
+  def test_vectorized_nms_requires_pre_nms_top_k(self):
+    model = oicr_model.Model(
+        self._build_model_proto(_MODEL_CONFIG + 'pre_nms_top_k: 0'),
+        is_training=False)
+
+    g = tf.Graph()
+    with g.as_default():
+      with self.assertRaises(ValueError):
+        model.build_prediction(
+            examples={
+                InputDataFields.image: tf.zeros([1, 64, 64, 3]),
+                InputDataFields.num_proposals: tf.constant([1]),
+                InputDataFields.proposals: tf.constant([[[0.0, 0.0, 1.0,
+                                                          1.0]]]),
+                InputDataFields.caption_strings: tf.constant([[['dog']]]),
+            })
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -10,7 +10,9 @@ from core import utils
 from core import imgproc
 from core import plotlib
 from core import box_utils
+from core import nms
 from protos import cnn_pb2
+from protos import post_process_pb2
 from object_detection.core.post_processing import batch_multiclass_non_max_suppression
 
 _SMALL_NUMBER = 1e-10
@@ -778,14 +780,14 @@ def post_process(boxes,
                  score_thresh=1e-6,
                  iou_thresh=0.5,
                  max_size_per_class=100,
-                 max_total_size=300):
+                 max_total_size=300,
+                 pre_nms_top_k=0,
+                 nms_type=post_process_pb2.PostProcess.BATCH_MULTICLASS_NMS):
   """Applies post process to get the final detections.
 
   Args:
-    boxes: A [batch_size, num_anchors, q, 4] float32 tensor containing
-      detections. If `q` is 1 then same boxes are used for all classes
-        otherwise, if `q` is equal to number of classes, class-specific boxes
-        are used.
+    boxes: A [batch_size, num_anchors, 4] float32 tensor containing
+      detections, the same boxes are used for all classes.
     scores: A [batch_size, num_anchors, num_classes] float32 tensor containing
       the scores for each of the `num_anchors` detections. The scores have to be
       non-negative when use_static_shapes is set True.
@@ -795,6 +797,10 @@ def post_process(boxes,
     max_size_per_class: maximum number of retained boxes per class.
     max_total_size: maximum number of boxes retained over all classes. By
       default returns all boxes retained after capping boxes per class.
+    pre_nms_top_k: if positive, only the top-k scoring boxes per class are
+      fed to the NMS.
+    nms_type: a post_process_pb2.PostProcess.NMSType value. The VECTORIZED_NMS
+      uses the `pre_nms_top_k` as the number of candidates per class.
 
 Returns:
   num_detections: A [batch_size] int32 tensor indicating the number of
@@ -807,8 +813,38 @@ Returns:
     the scores for the boxes.
   nmsed_classes: A [batch_size, max_detections] float32 tensor
     containing the class for boxes.
+
+Raises:
+  ValueError: if the nms_type is invalid, or the pre_nms_top_k is not positive
+    for the VECTORIZED_NMS.
   """
-  boxes = tf.expand_dims(boxes, axis=2)
+  if nms_type == post_process_pb2.PostProcess.VECTORIZED_NMS:
+    if pre_nms_top_k <= 0:
+      raise ValueError(
+          'The pre_nms_top_k has to be positive for VECTORIZED_NMS.')
+    (num_detections, nmsed_boxes, nmsed_scores, nmsed_classes,
+     _) = nms.batch_multiclass_non_max_suppression(
+         boxes,
+         scores,
+         score_thresh=score_thresh,
+         iou_thresh=iou_thresh,
+         max_size_per_class=max_size_per_class,
+         max_total_size=max_total_size,
+         max_candidates_per_class=pre_nms_top_k)
+    return num_detections, nmsed_boxes, nmsed_scores, nmsed_classes + 1
+
+  if nms_type != post_process_pb2.PostProcess.BATCH_MULTICLASS_NMS:
+    raise ValueError('Invalid nms_type {}.'.format(nms_type))
+
+  if pre_nms_top_k > 0:
+
+    # Use the class-specific top-k boxes, shape = [batch, k, num_classes, 4].
+
+    boxes, scores, _ = nms.select_top_k_per_class(boxes, scores, pre_nms_top_k)
+    boxes = tf.transpose(boxes, [0, 2, 1, 3])
+    scores = tf.transpose(scores, [0, 2, 1])
+  else:
+    boxes = tf.expand_dims(boxes, axis=2)
   (nmsed_boxes, nmsed_scores, nmsed_classes, _, _,
    num_detections) = batch_multiclass_non_max_suppression(
        boxes,
@@ -820,6 +856,36 @@ Returns:
   return num_detections, nmsed_boxes, nmsed_scores, nmsed_classes + 1
 
 
+def get_post_process_stages(oicr_iterations, post_process_stages):
+  """Gets the indices of the stages to be post-processed.
+
+  Stage 0 denotes the MIDN, and stage `i` denotes the `i-th` OICR iteration.
+
+  Args:
+    oicr_iterations: number of OICR iterations.
+    post_process_stages: a list of stage indices, negative indices count from
+      the last stage, e.g., [-1] selects the final stage only. An empty list
+      selects all the stages.
+
+  Returns:
+    a sorted list of unique stage indices.
+
+  Raises:
+    ValueError: if any of the stage indices is out of range.
+  """
+  num_stages = 1 + oicr_iterations
+  if not post_process_stages:
+    return list(range(num_stages))
+
+  stages = set()
+  for stage in post_process_stages:
+    if not -num_stages <= stage < num_stages:
+      raise ValueError('Invalid post process stage {}, the model has {} '
+                       'stages.'.format(stage, num_stages))
+    stages.add(stage % num_stages)
+  return sorted(stages)
+
+
 def calc_oicr_loss(labels,
                    num_proposals,
                    proposals,
@@ -827,16 +893,20 @@ def calc_oicr_loss(labels,
                    scores_1,
                    scope,
                    iou_threshold=0.5):
-  """Calculates the NOD loss at refinement stage `i`.
+  """Calculates the OICR loss at refinement stage `i`.
 
   Args:
     labels: A [batch, num_classes] float tensor.
     num_proposals: A [batch] int tensor.
     proposals: A [batch, max_num_proposals, 4] float tensor.
     scores_0: A [batch, max_num_proposal, 1 + num_classes] float tensor, 
-      representing the proposal score at `k-th` refinement.
+      representing the proposal score at `k-th` refinement, used to pick the
+      most confident proposal per class.
     scores_1: A [batch, max_num_proposal, 1 + num_classes] float tensor,
-      representing the proposal score at `(k+1)-th` refinement.
+      representing the proposal logits at `(k+1)-th` refinement.
+    scope: name scope of the loss.
+    iou_threshold: proposals having IoU not less than this value to the most
+      confident proposal are labeled as its class.
 
   Returns:
     oicr_cross_entropy_loss: a scalar float tensor.
@@ -854,38 +924,25 @@ def calc_oicr_loss(labels,
     proposal_ind = utils.masked_argmax(
         scores_0[:, :, 1:], tf.expand_dims(proposal_mask, axis=-1), dim=1)
 
-    # Deal with the most confident proposal per each class.
-    #   Unstack the `proposal_ind`, `labels`.
-    #   proposal_labels shape = [batch, max_num_proposals, num_classes].
+    # Gather the most confident proposal per each class.
+    #   confident_proposals shape = [batch, num_classes, 4].
 
-    proposal_labels = []
-    indices_0 = tf.range(batch, dtype=tf.int64)
-    for indices_1, label_per_class in zip(
-        tf.unstack(proposal_ind, axis=-1), tf.unstack(labels, axis=-1)):
+    indices_0 = tf.expand_dims(tf.range(batch, dtype=tf.int64), axis=-1)
+    indices = tf.stack(
+        [tf.zeros_like(proposal_ind) + indices_0, proposal_ind], axis=-1)
+    confident_proposals = tf.gather_nd(proposals, indices)
 
-      # Gather the most confident proposal for the class.
-      #   confident_proosal shape = [batch, 4].
+    # Get the IoU from all the proposals to the most confident proposals.
+    #   iou shape = [batch, max_num_proposals, num_classes].
 
-      indices = tf.stack([indices_0, indices_1], axis=-1)
-      confident_proposal = tf.gather_nd(proposals, indices)
+    iou = box_utils.pairwise_iou(proposals, confident_proposals)
 
-      # Get the Iou from all the proposals to the most confident proposal.
-      #   iou shape = [batch, max_num_proposals].
-
-      confident_proposal_tiled = tf.tile(
-          tf.expand_dims(confident_proposal, axis=1), [1, max_num_proposals, 1])
-      iou = box_utils.iou(
-          tf.reshape(proposals, [-1, 4]),
-          tf.reshape(confident_proposal_tiled, [-1, 4]))
-      iou = tf.reshape(iou, [batch, max_num_proposals])
-
-      # Filter out irrelevant predictions using image-level label.
-
-      target = tf.to_float(tf.greater_equal(iou, iou_threshold))
-      target = tf.where(label_per_class > 0, x=target, y=tf.zeros_like(target))
-      proposal_labels.append(target)
+    # Filter out irrelevant predictions using image-level label.
+    #   proposal_labels shape = [batch, max_num_proposals, num_classes].
 
-    proposal_labels = tf.stack(proposal_labels, axis=-1)
+    proposal_labels = tf.multiply(
+        tf.to_float(tf.greater_equal(iou, iou_threshold)),
+        tf.to_float(tf.expand_dims(labels > 0, axis=1)))
 
     # Add background targets, and normalize the sum value to 1.0.
     #   proposal_labels shape = [batch, max_num_proposals, 1 + num_classes].
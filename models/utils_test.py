@@ -2,8 +2,10 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import numpy as np
 import tensorflow as tf
 from models import utils
+from protos import post_process_pb2
 
 
 class UtilsTest(tf.test.TestCase):
@@ -92,6 +94,139 @@ class UtilsTest(tf.test.TestCase):
                            [b"e", b"e", b"e"], [b"f", b"f", b"f"]])
       self.assertAllEqual(caption_lengths_value, [1, 2, 3, 3])
 
+  def test_get_post_process_stages(self):
+    self.assertAllEqual(utils.get_post_process_stages(3, []), [0, 1, 2, 3])
+    self.assertAllEqual(utils.get_post_process_stages(3, [-1]), [3])
+    self.assertAllEqual(utils.get_post_process_stages(3, [2, 0, -2]), [0, 2])
+    with self.assertRaises(ValueError):
+      utils.get_post_process_stages(3, [4])
+    with self.assertRaises(ValueError):
+      utils.get_post_process_stages(3, [-5])
+
+  def test_post_process_with_pre_nms_top_k(self):
+    g = tf.Graph()
+
+    with g.as_default():
+      boxes = tf.placeholder(tf.float32, [None, None, 4])
+      scores = tf.placeholder(tf.float32, [None, None, 2])
+
+      kwargs = {
+          'score_thresh': 0.1,
+          'iou_thresh': 0.5,
+          'max_size_per_class': 2,
+          'max_total_size': 4,
+      }
+      outputs = utils.post_process(boxes, scores, **kwargs)
+      outputs_top_k = utils.post_process(
+          boxes, scores, pre_nms_top_k=2, **kwargs)
+
+    feed_dict = {
+        boxes: [[[0.0, 0.0, 1.0, 1.0], [0.0, 0.0, 1.0, 0.9],
+                 [0.5, 0.5, 1.0, 1.0], [0.0, 0.0, 0.5, 0.5]]],
+        scores: [[[0.9, 0.0], [0.8, 0.05], [0.7, 0.6], [0.01, 0.3]]],
+    }
+    with self.test_session(graph=g) as sess:
+      (num_detections, _, detection_scores,
+       detection_classes) = sess.run(outputs, feed_dict=feed_dict)
+      (num_detections_top_k, detection_boxes_top_k, detection_scores_top_k,
+       detection_classes_top_k) = sess.run(outputs_top_k, feed_dict=feed_dict)
+
+    # Without the top-k, proposal #2 is the second detection of class 1.
+
+    self.assertAllEqual(num_detections, [4])
+    self.assertAllClose(detection_scores, [[0.9, 0.7, 0.6, 0.3]])
+    self.assertAllClose(detection_classes, [[1, 1, 2, 2]])
+
+    # The top-2 candidates of class 1 are proposal #0 and #1, and #1 is
+    # suppressed by #0.
+
+    self.assertAllEqual(num_detections_top_k, [3])
+    self.assertAllClose(detection_scores_top_k[:, :3], [[0.9, 0.6, 0.3]])
+    self.assertAllClose(detection_classes_top_k[:, :3], [[1, 2, 2]])
+    self.assertAllClose(detection_boxes_top_k[:, :3],
+                        [[[0.0, 0.0, 1.0, 1.0], [0.5, 0.5, 1.0, 1.0],
+                          [0.0, 0.0, 0.5, 0.5]]])
+
+  def test_post_process_with_vectorized_nms(self):
+    g = tf.Graph()
+
+    with g.as_default():
+      boxes = tf.placeholder(tf.float32, [None, None, 4])
+      scores = tf.placeholder(tf.float32, [None, None, 2])
+
+      kwargs = {
+          'score_thresh': 0.1,
+          'iou_thresh': 0.5,
+          'max_size_per_class': 2,
+          'max_total_size': 4,
+          'pre_nms_top_k': 4,
+      }
+      outputs = utils.post_process(boxes, scores, **kwargs)
+      outputs_vectorized = utils.post_process(
+          boxes,
+          scores,
+          nms_type=post_process_pb2.PostProcess.VECTORIZED_NMS,
+          **kwargs)
+
+      with self.assertRaises(ValueError):
+        utils.post_process(
+            boxes,
+            scores,
+            pre_nms_top_k=0,
+            nms_type=post_process_pb2.PostProcess.VECTORIZED_NMS)
+
+    feed_dict = {
+        boxes: [[[0.0, 0.0, 1.0, 1.0], [0.0, 0.0, 1.0, 0.9],
+                 [0.5, 0.5, 1.0, 1.0], [0.0, 0.0, 0.5, 0.5]]],
+        scores: [[[0.9, 0.0], [0.8, 0.05], [0.7, 0.6], [0.01, 0.3]]],
+    }
+    with self.test_session(graph=g) as sess:
+      values = sess.run(outputs, feed_dict=feed_dict)
+      values_vectorized = sess.run(outputs_vectorized, feed_dict=feed_dict)
+
+    for value, value_vectorized in zip(values, values_vectorized):
+      self.assertAllClose(value, value_vectorized)
+
+  def test_calc_oicr_loss(self):
+    g = tf.Graph()
+
+    with g.as_default():
+      labels = tf.placeholder(tf.float32, [None, 2])
+      num_proposals = tf.placeholder(tf.int32, [None])
+      proposals = tf.placeholder(tf.float32, [None, None, 4])
+      scores_0 = tf.placeholder(tf.float32, [None, None, 3])
+      scores_1 = tf.placeholder(tf.float32, [None, None, 3])
+
+      loss = utils.calc_oicr_loss(labels, num_proposals, proposals, scores_0,
+                                  scores_1, 'oicr_loss')
+
+    # The most confident proposals are #0 for class 1 and #2 for class 2.
+    #   IoU(#0, #1) = 0.9, IoU(#0, #2) = 0.25, IoU(#1, #2) = 0.2 / 0.95.
+
+    feed_dict = {
+        num_proposals: [3],
+        proposals: [[[0.0, 0.0, 1.0, 1.0], [0.0, 0.0, 1.0, 0.9],
+                     [0.5, 0.5, 1.0, 1.0]]],
+        scores_0: [[[0.0, 0.9, 0.1], [0.0, 0.5, 0.2], [0.0, 0.1, 0.8]]],
+    }
+    expected_loss = np.log(np.exp(2.0) + 2.0) - 2.0
+
+    with self.test_session(graph=g) as sess:
+
+      # Class 1 is present: #0 and #1 are class 1, #2 is background.
+
+      feed_dict[labels] = [[1.0, 0.0]]
+      feed_dict[scores_1] = [[[0.0, 2.0, 0.0], [0.0, 2.0, 0.0],
+                              [2.0, 0.0, 0.0]]]
+      self.assertAllClose(sess.run(loss, feed_dict=feed_dict), expected_loss)
+
+      # Class 2 is present: #0 and #1 are background, #2 is class 2.
+
+      feed_dict[labels] = [[0.0, 1.0]]
+      feed_dict[scores_1] = [[[2.0, 0.0, 0.0], [2.0, 0.0, 0.0],
+                              [0.0, 0.0, 2.0]]]
+      self.assertAllClose(sess.run(loss, feed_dict=feed_dict), expected_loss)
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -2,6 +2,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
+import hashlib
 import tensorflow as tf
 
 from core.standard_fields import InputDataFields
@@ -10,11 +12,50 @@ from core.standard_fields import OperationNames
 from core import preprocess
 from core import utils
 from core import box_utils
+from core import imgproc
 from core import builder as function_builder
 from protos import reader_pb2
 
 _IMAGE_CHANNELS = 3
 
+# Prefix of the tf.data stats, see `Reader.enable_stats`.
+
+STATS_PREFIX = 'reader'
+
+# Collection of the serialized summary of the tf.data stats.
+
+STATS_SUMMARY_COLLECTION = 'reader_stats_summary'
+
+
+def calc_padding_efficiency(image, image_shape):
+  """Computes the fraction of the batched image pixels that are not padding.
+
+  Args:
+    image: a [batch, pad_height, pad_width, channels] float tensor.
+    image_shape: a [batch, 3] int tensor denoting the unpadded image shapes.
+
+  Returns:
+    a scalar float tensor.
+  """
+  batch, pad_height, pad_width, _ = utils.get_tensor_shape(image)
+  height, width, _ = tf.unstack(image_shape, axis=-1)
+  valid_pixels = tf.reduce_sum(tf.to_float(height) * tf.to_float(width))
+  total_pixels = tf.to_float(batch * pad_height * pad_width)
+  return valid_pixels / tf.maximum(total_pixels, 1.0)
+
+
+def get_cache_filename(options):
+  """Returns the cache filename of the parsed examples.
+
+  Args:
+    options: an instance of reader_pb2.Reader.
+
+  Returns:
+    path to the cache file under `options.cache_dir`.
+  """
+  config_hash = hashlib.md5(str(options).encode('utf8')).hexdigest()
+  return os.path.join(options.cache_dir, 'reader_{}.cache'.format(config_hash))
+
 
 def get_input_fn(options):
   """Returns a function that generate input examples.
@@ -28,11 +69,57 @@ def get_input_fn(options):
   if not isinstance(options, reader_pb2.Reader):
     raise ValueError('options has to be an instance of Reader.')
 
-  def _parse_fn(example):
+  if options.cache_dir and (options.is_training or
+                            len(options.batch_resize_scale_value) > 0):
+    raise ValueError('The cache_dir is only supported for evaluation.')
+
+  multi_scale = options.decode_image and len(
+      options.batch_resize_scale_value) > 0
+  bucket_by_aspect_ratio = options.decode_image and len(
+      options.aspect_ratio_bucket_boundaries) > 0
+
+  def _decode_jpeg_downscaled(encoded_jpeg):
+    """Decodes the JPEG image to the smallest size the resizer allows.
+
+    Args:
+      encoded_jpeg: a scalar string tensor.
+
+    Returns:
+      image: a [height, width, 3] uint8 tensor.
+      jpeg_shape: a [3] int tensor, shape of the image at full resolution.
+    """
+    resizer_options = options.image_resizer
+    image_resizer_oneof = resizer_options.WhichOneof('image_resizer_oneof')
+
+    min_height = min_width = min_dimension = 0
+    if 'fixed_shape_resizer' == image_resizer_oneof:
+      min_height = resizer_options.fixed_shape_resizer.height
+      min_width = resizer_options.fixed_shape_resizer.width
+    elif 'keep_aspect_ratio_resizer' == image_resizer_oneof:
+      min_dimension = resizer_options.keep_aspect_ratio_resizer.min_dimension
+    else:
+      # The default_resizer keeps the full resolution.
+
+      image = tf.image.decode_jpeg(encoded_jpeg, channels=_IMAGE_CHANNELS)
+      return image, tf.shape(image)
+
+    # The image may be resized to a larger random scale.
+
+    scale = max([1.0] + [x for x in options.batch_resize_scale_value])
+    return imgproc.decode_jpeg_downscaled(
+        encoded_jpeg,
+        min_height=int(min_height * scale),
+        min_width=int(min_width * scale),
+        min_dimension=int(min_dimension * scale),
+        channels=_IMAGE_CHANNELS)
+
+  def _parse_fn(example, scale=None):
     """Parses tf::Example proto.
 
     Args:
       example: a tf::Example proto.
+      scale: if set, a scalar float tensor, the image is resized to `scale`
+        times the size denoted by the `image_resizer`.
 
     Returns:
       feature_dict: a dict mapping from names to tensors.
@@ -49,11 +136,19 @@ def get_input_fn(options):
         TFExampleDataFields.object_box_xmax: tf.VarLenFeature(tf.float32),
         TFExampleDataFields.object_label: tf.VarLenFeature(tf.int64),
         TFExampleDataFields.object_text: tf.VarLenFeature(tf.string),
-        TFExampleDataFields.proposal_box_ymin: tf.VarLenFeature(tf.float32),
-        TFExampleDataFields.proposal_box_xmin: tf.VarLenFeature(tf.float32),
-        TFExampleDataFields.proposal_box_ymax: tf.VarLenFeature(tf.float32),
-        TFExampleDataFields.proposal_box_xmax: tf.VarLenFeature(tf.float32),
     }
+    if options.proposal_encoding == reader_pb2.Reader.QUANTIZED_UINT16:
+      example_fmt.update({
+          TFExampleDataFields.proposal_box_encoded:
+          tf.FixedLenFeature((), tf.string, default_value=''),
+      })
+    else:
+      example_fmt.update({
+          TFExampleDataFields.proposal_box_ymin: tf.VarLenFeature(tf.float32),
+          TFExampleDataFields.proposal_box_xmin: tf.VarLenFeature(tf.float32),
+          TFExampleDataFields.proposal_box_ymax: tf.VarLenFeature(tf.float32),
+          TFExampleDataFields.proposal_box_xmax: tf.VarLenFeature(tf.float32),
+      })
     parsed = tf.parse_single_example(
         example, example_fmt, name=OperationNames.parse_single_example)
 
@@ -87,16 +182,22 @@ def get_input_fn(options):
     if options.decode_image:
 
       with tf.name_scope(OperationNames.decode_image):
-        image = tf.image.decode_jpeg(
-            parsed[TFExampleDataFields.image_encoded], channels=_IMAGE_CHANNELS)
+        if options.jpeg_dct_downscaling:
+          image, jpeg_shape = _decode_jpeg_downscaled(
+              parsed[TFExampleDataFields.image_encoded])
+          image_height, image_width = jpeg_shape[0], jpeg_shape[1]
+        else:
+          image = tf.image.decode_jpeg(
+              parsed[TFExampleDataFields.image_encoded],
+              channels=_IMAGE_CHANNELS)
+          image_height, image_width, _ = utils.get_tensor_shape(image)
+
         if options.HasField("preprocess_options"):
           image, operations = preprocess.preprocess_image_v2(
               image, options.preprocess_options)
 
-        image_height, image_width, _ = utils.get_tensor_shape(image)
-
         resize_fn = function_builder.build_image_resizer(options.image_resizer)
-        image, image_shape = resize_fn(image)
+        image, image_shape = resize_fn(image, scale=scale)
       feature_dict.update({
           InputDataFields.image: image,
           InputDataFields.image_height: image_height,
@@ -108,10 +209,21 @@ def get_input_fn(options):
     # Region proposal annotations.
 
     with tf.name_scope(OperationNames.decode_proposal):
-      bbox_decoder = tf.contrib.slim.tfexample_decoder.BoundingBox(
-          prefix=TFExampleDataFields.proposal_box + '/')
-      proposals = bbox_decoder.tensors_to_item(parsed)
-      if options.is_training and options.shuffle_proposals:
+      shuffle_proposals = options.is_training and options.shuffle_proposals
+      if options.proposal_encoding == reader_pb2.Reader.QUANTIZED_UINT16:
+        encoded_proposals = parsed[TFExampleDataFields.proposal_box_encoded]
+
+        # Each box takes 8 bytes, only decode the ones to be kept.
+
+        if not shuffle_proposals:
+          encoded_proposals = tf.substr(encoded_proposals, 0,
+                                        8 * options.max_num_proposals)
+        proposals = box_utils.decode_quantized_boxes(encoded_proposals)
+      else:
+        bbox_decoder = tf.contrib.slim.tfexample_decoder.BoundingBox(
+            prefix=TFExampleDataFields.proposal_box + '/')
+        proposals = bbox_decoder.tensors_to_item(parsed)
+      if shuffle_proposals:
         proposals = tf.random_shuffle(proposals)
       proposals = proposals[:options.max_num_proposals]
 
@@ -146,36 +258,23 @@ def get_input_fn(options):
     })
     return feature_dict
 
-  def _batch_resize_image_fn(examples):
-
-    # Resize image, height and width denote the padding size.
-
-    image = examples[InputDataFields.image]
-    _, height, width, channels = utils.get_tensor_shape(image)
+  def _parse_with_random_scale_fn(example):
+    """Parses tf::Example proto and resizes the image to a random scale.
 
-    index = tf.random_uniform([],
-                              minval=0,
-                              maxval=len(options.batch_resize_scale_value),
-                              dtype=tf.int32)
-    scale_h = scale_w = tf.gather([x for x in options.batch_resize_scale_value],
-                                  index)
-    new_height = tf.to_int32(tf.round(scale_h * tf.to_float(height)))
-    new_width = tf.to_int32(tf.round(scale_w * tf.to_float(width)))
-
-    new_image = tf.image.resize_images(image, tf.stack([new_height, new_width]))
-    examples[InputDataFields.image] = new_image
-
-    # Modify the image_shape, height and width denote the image size.
-
-    image_shape = examples[InputDataFields.image_shape]
-    height, width, channels = tf.unstack(image_shape, axis=-1)
-    new_height = tf.to_int32(tf.round(scale_h * tf.to_float(height)))
-    new_width = tf.to_int32(tf.round(scale_w * tf.to_float(width)))
-
-    new_image_shape = tf.stack([new_height, new_width, channels], axis=-1)
-    examples[InputDataFields.image_shape] = new_image_shape
+    Args:
+      example: a tf::Example proto.
 
-    return examples
+    Returns:
+      scale_index: a int64 scalar tensor, index of the chosen scale.
+      feature_dict: a dict mapping from names to tensors.
+    """
+    scale_index = tf.random_uniform([],
+                                    minval=0,
+                                    maxval=len(options.batch_resize_scale_value),
+                                    dtype=tf.int64)
+    scale = tf.gather([x for x in options.batch_resize_scale_value],
+                      scale_index)
+    return scale_index, _parse_fn(example, scale=scale)
 
   def _batch_scale_box_fn(examples):
     (image, image_shape, object_boxes,
@@ -204,28 +303,95 @@ def get_input_fn(options):
 
     return examples
 
-  def _filter_fn(examples):
-    #image_id = examples[InputDataFields.image_id]
-    #image_id = tf.string_to_number(image_id, out_type=tf.int64)
+  def _parse_shard_indicator():
+    """Parses the `shard_indicator` option.
 
-    #numer, denom = options.shard_indicator.split('/')
-    #assert numer.isdigit() and denom.isdigit()
-
-    #numer, denom = int(numer), int(denom)
-    #assert 0 <= numer < denom
-
-    #return tf.equal(tf.mod(image_id, denom), numer)
-    image_id = examples[InputDataFields.image_id]
+    Returns:
+      numer: index of the shard.
+      denom: number of shards.
 
+    Raises:
+      ValueError: if the shard_indicator is invalid.
+    """
     numer, denom = options.shard_indicator.split('/')
-    assert numer.isdigit() and denom.isdigit()
+    if not (numer.isdigit() and denom.isdigit()):
+      raise ValueError('Invalid shard_indicator {}.'.format(
+          options.shard_indicator))
 
     numer, denom = int(numer), int(denom)
-    assert 0 <= numer < denom
+    if not 0 <= numer < denom:
+      raise ValueError('Invalid shard_indicator {}.'.format(
+          options.shard_indicator))
+    return numer, denom
+
+  def _filter_fn(example):
+    """Filters the serialized tf::Example by the hash of the image_id.
+
+    Only the image_id is parsed, so that the images of the other shards are
+    dropped before being decoded.
+
+    Args:
+      example: a tf::Example proto.
+
+    Returns:
+      a boolean scalar tensor, True if the example belongs to the shard.
+    """
+    numer, denom = _parse_shard_indicator()
+
+    parsed = tf.parse_single_example(
+        example, {TFExampleDataFields.image_id: tf.FixedLenFeature((),
+                                                                  tf.string)})
+    image_id = parsed[TFExampleDataFields.image_id]
 
     hash_bucket = tf.strings.to_hash_bucket(image_id, num_buckets=denom)
     return tf.equal(hash_bucket, numer)
 
+  def _group_key_fn(scale_index, examples):
+    """Returns the key grouping the examples to be batched together.
+
+    Args:
+      scale_index: a int64 scalar tensor, index of the random scale.
+      examples: a dict mapping from names to tensors, see `_parse_fn`.
+
+    Returns:
+      a int64 scalar tensor.
+    """
+    if not bucket_by_aspect_ratio:
+      return scale_index
+    num_buckets = 1 + len(options.aspect_ratio_bucket_boundaries)
+    return scale_index * num_buckets + _aspect_ratio_key_fn(examples)
+
+  def _aspect_ratio_key_fn(examples):
+    """Returns the aspect ratio bucket index of the example.
+
+    Args:
+      examples: a dict mapping from names to tensors, see `_parse_fn`.
+
+    Returns:
+      a int64 scalar tensor.
+    """
+    height, width, _ = tf.unstack(examples[InputDataFields.image_shape])
+    aspect_ratio = tf.to_float(height) / tf.to_float(tf.maximum(width, 1))
+    boundaries = tf.constant(
+        [x for x in options.aspect_ratio_bucket_boundaries], dtype=tf.float32)
+    return tf.reduce_sum(tf.to_int64(aspect_ratio >= boundaries))
+
+  def _add_latency_stats(dataset, stage):
+    """Records the latency of producing the elements of a stage.
+
+    Args:
+      dataset: a tf.data.Dataset instance.
+      stage: name of the stage.
+
+    Returns:
+      dataset: a tf.data.Dataset instance.
+    """
+    if not options.enable_stats:
+      return dataset
+    return dataset.apply(
+        tf.contrib.data.latency_stats('{}/{}_latency'.format(
+            STATS_PREFIX, stage)))
+
   def _input_fn():
     """Returns a python dictionary.
 
@@ -237,12 +403,28 @@ def get_input_fn(options):
         input_pattern, shuffle=options.is_training)
     dataset = files.interleave(
         tf.data.TFRecordDataset, cycle_length=options.interleave_cycle_length)
+    dataset = _add_latency_stats(dataset, 'read')
     if options.is_training:
       dataset = dataset.repeat().shuffle(options.shuffle_buffer_size)
-    dataset = dataset.map(
-        map_func=_parse_fn, num_parallel_calls=options.map_num_parallel_calls)
+
+    # Drop the examples of the other shards before the expensive decoding.
+
     if options.shard_indicator:
       dataset = dataset.filter(predicate=_filter_fn)
+    if options.max_num_examples > 0:
+      dataset = dataset.take(options.max_num_examples)
+    dataset = dataset.map(
+        map_func=_parse_with_random_scale_fn if multi_scale else _parse_fn,
+        num_parallel_calls=options.map_num_parallel_calls)
+    dataset = _add_latency_stats(dataset, 'parse')
+
+    # Cache the deterministic evaluation examples to skip the decoding.
+
+    if options.cache_dir:
+      tf.gfile.MakeDirs(options.cache_dir)
+      cache_filename = get_cache_filename(options)
+      tf.logging.info('Cache the examples to %s.', cache_filename)
+      dataset = dataset.cache(cache_filename)
 
     padded_shapes = {
         InputDataFields.image_id: [],
@@ -265,21 +447,49 @@ def get_input_fn(options):
           InputDataFields.image_shape: [3],
       })
 
-    dataset = dataset.padded_batch(
-        options.batch_size, padded_shapes=padded_shapes, drop_remainder=True)
-
-    # Randomly resize image according to the batch scale values.
-
-    if options.decode_image and len(options.batch_resize_scale_value) > 0:
-      dataset = dataset.map(
-          map_func=_batch_resize_image_fn, num_parallel_calls=1)
+    def _padded_batch_fn(dataset, drop_remainder=True):
+      return dataset.padded_batch(
+          options.batch_size,
+          padded_shapes=padded_shapes,
+          drop_remainder=drop_remainder)
+
+    # Batch the images having the same random scale together, and group the
+    # images having similar aspect ratios to reduce the padding. Each group
+    # leaves a partial batch at the end, which is only dropped in training,
+    # so that the evaluation still reads all the examples.
+
+    if multi_scale or bucket_by_aspect_ratio:
+      if not multi_scale:
+        dataset = dataset.map(
+            lambda examples: (tf.constant(0, dtype=tf.int64), examples))
+      dataset = dataset.apply(
+          tf.contrib.data.group_by_window(
+              key_func=_group_key_fn,
+              reduce_func=lambda _, window: _padded_batch_fn(
+                  window.map(lambda _, examples: examples),
+                  drop_remainder=options.is_training),
+              window_size=options.batch_size))
+    else:
+      dataset = _padded_batch_fn(dataset)
 
     # Scale the proposal and object boxes according to the padding facts.
 
     if options.decode_image:
       dataset = dataset.map(map_func=_batch_scale_box_fn, num_parallel_calls=1)
+    dataset = _add_latency_stats(dataset, 'batch')
 
     dataset = dataset.prefetch(options.prefetch_buffer_size)
+    dataset = _add_latency_stats(dataset, 'prefetch')
+
+    # Export the stats, including the prefetch buffer utilization, through
+    # the summaries saved by the estimator.
+
+    if options.enable_stats:
+      aggregator = tf.contrib.data.StatsAggregator()
+      dataset = dataset.apply(tf.contrib.data.set_stats_aggregator(aggregator))
+      summary = aggregator.get_summary()
+      tf.add_to_collection(tf.GraphKeys.SUMMARIES, summary)
+      tf.add_to_collection(STATS_SUMMARY_COLLECTION, summary)
     return dataset
 
   return _input_fn
@@ -2,10 +2,13 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
+import numpy as np
 import tensorflow as tf
 from google.protobuf import text_format
 
-import reader
+from reader import reader
+from reader import synthetic_data
 
 from core.standard_fields import InputDataFields
 from core.standard_fields import TFExampleDataFields
@@ -81,5 +84,209 @@ class ReaderTest(tf.test.TestCase):
         coord.request_stop()
       coord.join(threads)
 
+
+class SyntheticReaderTest(tf.test.TestCase):
+
+  def _write_records(self, name, num_examples=24):
+    output_path = os.path.join(self.get_temp_dir(), name + '.record')
+    synthetic_data.write_synthetic_tf_records(
+        output_path,
+        num_examples=num_examples,
+        num_files=2,
+        seed=0,
+        min_image_size=32,
+        max_image_size=96,
+        num_proposals=20)
+    return output_path + '-*'
+
+  def _build_options(self, input_pattern, options_str=''):
+    options = reader_pb2.Reader()
+    text_format.Merge(
+        r"""
+        interleave_cycle_length: 1
+        is_training: false
+        batch_size: 4
+        max_num_proposals: 10
+        """ + options_str, options)
+    if not options.HasField('image_resizer'):
+      options.image_resizer.keep_aspect_ratio_resizer.min_dimension = 32
+    options.input_pattern.append(input_pattern)
+    return options
+
+  def _read_all(self, options):
+    """Reads all the batches of a non-repeated dataset."""
+    tf.reset_default_graph()
+    dataset = reader.get_input_fn(options)()
+    feature_dict = dataset.make_one_shot_iterator().get_next()
+
+    batches = []
+    with self.test_session() as sess:
+      try:
+        while True:
+          batches.append(sess.run(feature_dict))
+      except tf.errors.OutOfRangeError:
+        pass
+    return batches
+
+  def _read_image_ids(self, batches):
+    return [
+        int(image_id) for values in batches
+        for image_id in values[InputDataFields.image_id]
+    ]
+
+  def test_bucket_by_aspect_ratio(self):
+    input_pattern = self._write_records('bucket')
+    boundaries = [0.8, 1.25]
+
+    def _padded_pixels(batches):
+      padded = 0
+      for values in batches:
+        batch, pad_height, pad_width, _ = values[InputDataFields.image].shape
+        image_shape = values[InputDataFields.image_shape]
+        padded += batch * pad_height * pad_width - np.sum(
+            image_shape[:, 0] * image_shape[:, 1])
+      return padded
+
+    batches = self._read_all(self._build_options(input_pattern))
+    bucketed_batches = self._read_all(
+        self._build_options(
+            input_pattern,
+            ''.join('aspect_ratio_bucket_boundaries: {} '.format(x)
+                    for x in boundaries)))
+
+    # Each batch has only one aspect ratio bucket.
+
+    for values in bucketed_batches:
+      image_shape = values[InputDataFields.image_shape]
+      aspect_ratios = image_shape[:, 0] / image_shape[:, 1].astype(np.float32)
+      keys = set(int(np.sum(x >= np.array(boundaries))) for x in aspect_ratios)
+      self.assertEqual(len(keys), 1)
+
+    # The partial batches of the buckets are kept in evaluation.
+
+    self.assertAllEqual(
+        sorted(self._read_image_ids(bucketed_batches)), list(range(24)))
+    self.assertLess(_padded_pixels(bucketed_batches), _padded_pixels(batches))
+
+  def test_batch_resize_scale_value(self):
+    input_pattern = self._write_records('multi_scale')
+    batches = self._read_all(
+        self._build_options(
+            input_pattern, r"""
+            batch_resize_scale_value: 0.5
+            batch_resize_scale_value: 1.0
+            batch_resize_scale_value: 1.5
+            image_resizer {
+              fixed_shape_resizer {
+                height: 32
+                width: 32
+              }
+            }
+            """))
+
+    # Each batch is resized to one of the scales, without padding.
+
+    sizes = set()
+    for values in batches:
+      _, pad_height, pad_width, _ = values[InputDataFields.image].shape
+      self.assertEqual(pad_height, pad_width)
+      self.assertIn(pad_height, [16, 32, 48])
+      for height, width, _ in values[InputDataFields.image_shape]:
+        self.assertEqual(height, pad_height)
+        self.assertEqual(width, pad_width)
+      sizes.add(pad_height)
+    self.assertGreater(len(sizes), 1)
+    self.assertAllEqual(sorted(self._read_image_ids(batches)), list(range(24)))
+
+  def test_shard_indicator(self):
+    input_pattern = self._write_records('shard')
+    num_shards = 3
+
+    def _read_shard(i):
+      return self._read_image_ids(
+          self._read_all(
+              self._build_options(
+                  input_pattern,
+                  'batch_size: 1 shard_indicator: "{}/{}"'.format(
+                      i, num_shards))))
+
+    baseline_ids = self._read_image_ids(
+        self._read_all(self._build_options(input_pattern, 'batch_size: 1')))
+    self.assertAllEqual(sorted(baseline_ids), list(range(24)))
+
+    with self.test_session(graph=tf.Graph()) as sess:
+      hash_buckets = sess.run(
+          tf.strings.to_hash_bucket(
+              [str(x) for x in range(100)], num_buckets=num_shards))
+
+    # The shards keep the baseline ordering of their examples.
+
+    for i in range(num_shards):
+      self.assertAllEqual(
+          _read_shard(i), [x for x in baseline_ids if hash_buckets[x] == i])
+
+    # Add an example of the other shards having a corrupted JPEG, shard 0 is
+    # still readable as the example is dropped before being parsed.
+
+    image_id = next(x for x in range(24, 100) if hash_buckets[x] != 0)
+    example = tf.train.Example(
+        features=tf.train.Features(
+            feature={
+                TFExampleDataFields.image_id:
+                tf.train.Feature(
+                    bytes_list=tf.train.BytesList(
+                        value=[str(image_id).encode('utf8')])),
+                TFExampleDataFields.image_encoded:
+                tf.train.Feature(
+                    bytes_list=tf.train.BytesList(value=[b'corrupted'])),
+            }))
+    with tf.python_io.TFRecordWriter(input_pattern[:-1] +
+                                     'corrupted') as writer:
+      writer.write(example.SerializeToString())
+
+    self.assertAllEqual(
+        _read_shard(0), [x for x in baseline_ids if hash_buckets[x] == 0])
+
+  def test_cache_dir(self):
+    input_pattern = self._write_records('cache')
+    cache_dir = os.path.join(self.get_temp_dir(), 'cache')
+    options = self._build_options(
+        input_pattern, 'cache_dir: "{}"'.format(cache_dir))
+
+    # The first epoch writes the cache, the second epoch reads it even if the
+    # records are removed.
+
+    batches = self._read_all(options)
+    cache_filename = reader.get_cache_filename(options)
+    self.assertTrue(cache_filename.startswith(cache_dir))
+    self.assertTrue(tf.gfile.Glob(cache_filename + '*'))
+
+    for filename in tf.gfile.Glob(input_pattern):
+      tf.gfile.Remove(filename)
+    cached_batches = self._read_all(options)
+
+    self.assertEqual(len(cached_batches), len(batches))
+    for values, cached_values in zip(batches, cached_batches):
+      for name in [
+          InputDataFields.image_id, InputDataFields.image,
+          InputDataFields.image_shape, InputDataFields.proposals
+      ]:
+        self.assertAllEqual(values[name], cached_values[name])
+
+  def test_cache_dir_is_only_for_evaluation(self):
+    options = self._build_options('unused', 'cache_dir: "cache"')
+    options.is_training = True
+    with self.assertRaises(ValueError):
+      reader.get_input_fn(options)
+
+  def test_get_cache_filename(self):
+    options = self._build_options('unused', 'cache_dir: "cache"')
+    cache_filename = reader.get_cache_filename(options)
+    self.assertEqual(cache_filename, reader.get_cache_filename(options))
+
+    options.max_num_proposals = 20
+    self.assertNotEqual(cache_filename, reader.get_cache_filename(options))
+
+
 if __name__ == '__main__':
   tf.test.main()
@@ -0,0 +1,201 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from core import box_utils
+from core.standard_fields import TFExampleDataFields
+
+# The PASCAL VOC classes, used as the default vocabulary.
+
+DEFAULT_VOCABULARY = [
+    'aeroplane', 'bicycle', 'bird', 'boat', 'bottle', 'bus', 'car', 'cat',
+    'chair', 'cow', 'diningtable', 'dog', 'horse', 'motorbike', 'person',
+    'pottedplant', 'sheep', 'sofa', 'train', 'tvmonitor'
+]
+
+
+def _bytes_list_feature(value):
+  return tf.train.Feature(bytes_list=tf.train.BytesList(value=value))
+
+
+def _int64_list_feature(value):
+  return tf.train.Feature(int64_list=tf.train.Int64List(value=value))
+
+
+def _float_list_feature(value):
+  return tf.train.Feature(float_list=tf.train.FloatList(value=value))
+
+
+def _random_boxes(num_boxes, random_state):
+  """Generates random normalized boxes.
+
+  Args:
+    num_boxes: number of boxes.
+    random_state: a np.random.RandomState instance.
+
+  Returns:
+    a [num_boxes, 4] float numpy array of [ymin, xmin, ymax, xmax].
+  """
+  # Sorting makes [ymin, xmin] no larger than [ymax, xmax].
+
+  boxes = np.sort(random_state.uniform(size=[num_boxes, 2, 2]), axis=1)
+  return boxes.reshape([num_boxes, 4]).astype(np.float32)
+
+
+def write_vocabulary(filename, vocabulary=None):
+  """Writes the vocabulary file, one word per line.
+
+  Args:
+    filename: path to the vocabulary file.
+    vocabulary: a list of words, defaults to DEFAULT_VOCABULARY.
+  """
+  vocabulary = vocabulary or DEFAULT_VOCABULARY
+  with tf.gfile.GFile(filename, 'w') as fid:
+    for word in vocabulary:
+      fid.write('%s\n' % (word))
+
+
+def create_synthetic_example(image_id,
+                             vocabulary=None,
+                             min_image_size=300,
+                             max_image_size=500,
+                             num_proposals=2000,
+                             max_num_objects=4,
+                             num_captions=1,
+                             max_caption_length=8,
+                             quantize_proposals=False,
+                             random_state=None):
+  """Creates a tf.Example having the schema of the TFRecord tools.
+
+  The first caption consists of the class names of the objects, as in the
+  PASCAL records, the others are random words from the vocabulary.
+
+  Args:
+    image_id: the image id.
+    vocabulary: a list of class names, defaults to DEFAULT_VOCABULARY.
+    min_image_size: minimum height and width of the random JPEG image.
+    max_image_size: maximum height and width of the random JPEG image.
+    num_proposals: number of proposals.
+    max_num_objects: maximum number of object annotations, at least one.
+    num_captions: number of captions.
+    max_caption_length: maximum number of words of the random captions.
+    quantize_proposals: if true, encode proposals as quantized uint16.
+    random_state: a np.random.RandomState instance.
+
+  Returns:
+    a tf.train.Example instance.
+  """
+  vocabulary = vocabulary or DEFAULT_VOCABULARY
+  random_state = random_state or np.random.RandomState()
+
+  # Random image.
+
+  height, width = random_state.randint(
+      min_image_size, max_image_size + 1, size=2)
+  image = random_state.randint(256, size=[height, width, 3], dtype=np.uint8)
+  _, encoded_jpg = cv2.imencode('.jpg', image)
+
+  # Object annotations.
+
+  num_objects = random_state.randint(1, max_num_objects + 1)
+  object_boxes = _random_boxes(num_objects, random_state)
+  object_labels = random_state.randint(len(vocabulary), size=num_objects)
+  object_texts = [vocabulary[i].encode('utf8') for i in object_labels]
+
+  # Caption annotations.
+
+  caption_string, caption_offset, caption_length = [], [], []
+  for i in range(num_captions):
+    if i == 0:
+      caption = object_texts
+    else:
+      caption = [
+          vocabulary[j].encode('utf8') for j in random_state.randint(
+              len(vocabulary), size=random_state.randint(
+                  1, max_caption_length + 1))
+      ]
+    caption_offset.append(len(caption_string))
+    caption_length.append(len(caption))
+    caption_string.extend(caption)
+
+  feature = {
+      'image/height': _int64_list_feature([height]),
+      'image/width': _int64_list_feature([width]),
+      'image/filename': _bytes_list_feature([str(image_id).encode('utf8')]),
+      'image/format': _bytes_list_feature([b'jpeg']),
+      TFExampleDataFields.image_id:
+      _bytes_list_feature([str(image_id).encode('utf8')]),
+      TFExampleDataFields.image_encoded:
+      _bytes_list_feature([encoded_jpg.tobytes()]),
+      TFExampleDataFields.object_box_ymin:
+      _float_list_feature(object_boxes[:, 0].tolist()),
+      TFExampleDataFields.object_box_xmin:
+      _float_list_feature(object_boxes[:, 1].tolist()),
+      TFExampleDataFields.object_box_ymax:
+      _float_list_feature(object_boxes[:, 2].tolist()),
+      TFExampleDataFields.object_box_xmax:
+      _float_list_feature(object_boxes[:, 3].tolist()),
+      TFExampleDataFields.object_label:
+      _int64_list_feature((1 + object_labels).tolist()),
+      TFExampleDataFields.object_text: _bytes_list_feature(object_texts),
+      TFExampleDataFields.caption_string: _bytes_list_feature(caption_string),
+      TFExampleDataFields.caption_offset: _int64_list_feature(caption_offset),
+      TFExampleDataFields.caption_length: _int64_list_feature(caption_length),
+  }
+
+  # Region proposals.
+
+  proposals = _random_boxes(num_proposals, random_state)
+  if quantize_proposals:
+    feature[TFExampleDataFields.proposal_box_encoded] = _bytes_list_feature(
+        [box_utils.py_encode_quantized_boxes(proposals)])
+  else:
+    for i, name in enumerate([
+        TFExampleDataFields.proposal_box_ymin,
+        TFExampleDataFields.proposal_box_xmin,
+        TFExampleDataFields.proposal_box_ymax,
+        TFExampleDataFields.proposal_box_xmax
+    ]):
+      feature[name] = _float_list_feature(proposals[:, i].tolist())
+
+  return tf.train.Example(features=tf.train.Features(feature=feature))
+
+
+def write_synthetic_tf_records(output_path,
+                               num_examples,
+                               num_files=1,
+                               seed=None,
+                               **kwargs):
+  """Writes synthetic examples to sharded TFRecord files.
+
+  Args:
+    output_path: prefix of the output files, the files are named
+      `{output_path}-{index:05d}-of-{num_files:05d}`.
+    num_examples: total number of examples.
+    num_files: number of output files.
+    seed: random seed, for reproducible data.
+    **kwargs: additional keyword arguments passed to
+      `create_synthetic_example`.
+
+  Returns:
+    filenames: a list of paths to the output files.
+  """
+  random_state = np.random.RandomState(seed)
+
+  filenames = [
+      '{}-{:05d}-of-{:05d}'.format(output_path, i, num_files)
+      for i in range(num_files)
+  ]
+  writers = [tf.python_io.TFRecordWriter(filename) for filename in filenames]
+  for image_id in range(num_examples):
+    example = create_synthetic_example(
+        image_id, random_state=random_state, **kwargs)
+    writers[image_id % num_files].write(example.SerializeToString())
+
+  for writer in writers:
+    writer.close()
+  return filenames
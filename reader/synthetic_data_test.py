@@ -0,0 +1,86 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import tensorflow as tf
+from google.protobuf import text_format
+
+from reader import reader
+from reader import synthetic_data
+from core.standard_fields import InputDataFields
+from protos import reader_pb2
+
+
+class SyntheticDataTest(tf.test.TestCase):
+
+  def _read_batch(self, output_path, proposal_encoding):
+    options_str = r"""
+      interleave_cycle_length: 2
+      is_training: false
+      batch_size: 2
+      max_num_proposals: 100
+      image_resizer {
+        fixed_shape_resizer {
+          height: 64
+          width: 64
+        }
+      }
+    """
+    options = reader_pb2.Reader()
+    text_format.Merge(options_str, options)
+    options.input_pattern.append(output_path + '-*')
+    options.proposal_encoding = proposal_encoding
+
+    tf.reset_default_graph()
+    dataset = reader.get_input_fn(options)()
+    feature_dict = dataset.make_one_shot_iterator().get_next()
+    with self.test_session() as sess:
+      return sess.run(feature_dict)
+
+  def test_write_vocabulary(self):
+    filename = os.path.join(self.get_temp_dir(), 'vocab.txt')
+    synthetic_data.write_vocabulary(filename, ['cat', 'dog'])
+    with open(filename, 'r') as fid:
+      self.assertEqual(fid.read(), 'cat\ndog\n')
+
+  def test_read_float_list_proposals(self):
+    output_path = os.path.join(self.get_temp_dir(), 'float_list.record')
+    filenames = synthetic_data.write_synthetic_tf_records(
+        output_path,
+        num_examples=6,
+        num_files=2,
+        seed=0,
+        min_image_size=32,
+        max_image_size=96,
+        num_proposals=150)
+    self.assertEqual(len(filenames), 2)
+
+    values = self._read_batch(output_path, reader_pb2.Reader.FLOAT_LIST)
+    self.assertAllEqual(values[InputDataFields.image].shape, [2, 64, 64, 3])
+    self.assertAllEqual(values[InputDataFields.num_proposals], [100, 100])
+    self.assertAllEqual(values[InputDataFields.proposals].shape, [2, 100, 4])
+    self.assertAllEqual(values[InputDataFields.num_captions], [1, 1])
+
+  def test_read_quantized_proposals(self):
+    output_path = os.path.join(self.get_temp_dir(), 'quantized.record')
+    synthetic_data.write_synthetic_tf_records(
+        output_path,
+        num_examples=4,
+        num_files=1,
+        seed=0,
+        min_image_size=32,
+        max_image_size=96,
+        num_proposals=50,
+        num_captions=3,
+        quantize_proposals=True)
+
+    values = self._read_batch(output_path, reader_pb2.Reader.QUANTIZED_UINT16)
+    self.assertAllEqual(values[InputDataFields.num_proposals], [50, 50])
+    self.assertAllEqual(values[InputDataFields.num_captions], [3, 3])
+    self.assertTrue((values[InputDataFields.proposals] >= 0.0).all())
+    self.assertTrue((values[InputDataFields.proposals] <= 1.0).all())
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,99 @@
+r"""Benchmarks the NumPy box utilities.
+
+Compares `box_utils.py_evaluate_precision_and_recall` against the reference
+double loop implementation, on random detections and ground-truth boxes.
+
+Example usage:
+    python tools/benchmark_box_utils.py --logtostderr
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+import numpy as np
+import tensorflow as tf
+
+from core import box_utils
+
+flags = tf.app.flags
+
+flags.DEFINE_string('sizes', '300x50,2000x100',
+                    'Comma-separated `num_dt_boxes x num_gt_boxes` sizes.')
+flags.DEFINE_integer('num_classes', 20, 'Number of classes.')
+flags.DEFINE_integer('num_iterations', 5, 'Number of timed iterations.')
+
+FLAGS = flags.FLAGS
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+
+def _py_evaluate_precision_and_recall_loop(num_gt_boxes,
+                                           gt_boxes,
+                                           gt_labels,
+                                           num_dt_boxes,
+                                           dt_boxes,
+                                           dt_labels,
+                                           iou_threshold=0.5):
+  """The reference double loop implementation."""
+  recall_mask = np.zeros((len(gt_boxes)), dtype=bool)
+  precision_mask = np.zeros((len(dt_boxes)), dtype=bool)
+
+  for i in range(num_dt_boxes):
+    for j in range(num_gt_boxes):
+      iou_v = box_utils.py_iou(
+          np.expand_dims(dt_boxes[i], 0), np.expand_dims(gt_boxes[j], 0))
+      if not recall_mask[j] and (
+          dt_labels[i] == gt_labels[j]) and iou_v[0] > iou_threshold:
+        recall_mask[j] = True
+        precision_mask[i] = True
+
+  return recall_mask, precision_mask
+
+
+def _random_boxes(num_boxes, random_state):
+  """Generates random boxes, many of them overlap each other."""
+  center = random_state.uniform(0.3, 0.7, size=[num_boxes, 2])
+  size = random_state.uniform(0.1, 0.6, size=[num_boxes, 2])
+  return np.concatenate([center - size / 2, center + size / 2], axis=-1)
+
+
+def _time_fn(fn, num_iterations):
+  """Returns the average seconds of calling fn, and its result."""
+  start_time = time.time()
+  for _ in range(num_iterations):
+    result = fn()
+  return (time.time() - start_time) / num_iterations, result
+
+
+def main(_):
+  random_state = np.random.RandomState(0)
+
+  for size in FLAGS.sizes.split(','):
+    num_dt_boxes, num_gt_boxes = [int(x) for x in size.split('x')]
+
+    dt_boxes = _random_boxes(num_dt_boxes, random_state)
+    gt_boxes = _random_boxes(num_gt_boxes, random_state)
+    dt_labels = random_state.randint(FLAGS.num_classes, size=num_dt_boxes)
+    gt_labels = random_state.randint(FLAGS.num_classes, size=num_gt_boxes)
+    args = (num_gt_boxes, gt_boxes, gt_labels, num_dt_boxes, dt_boxes,
+            dt_labels)
+
+    loop_time, loop_result = _time_fn(
+        lambda: _py_evaluate_precision_and_recall_loop(*args), 1)
+    vectorized_time, vectorized_result = _time_fn(
+        lambda: box_utils.py_evaluate_precision_and_recall(*args),
+        FLAGS.num_iterations)
+
+    for expected, actual in zip(loop_result, vectorized_result):
+      assert (expected == actual).all(), 'The results are different.'
+
+    tf.logging.info(
+        '%i detections x %i ground-truths: loop %.2lf ms, vectorized %.2lf '
+        'ms, %.1lfx speedup, %i matches.', num_dt_boxes, num_gt_boxes,
+        loop_time * 1000, vectorized_time * 1000,
+        loop_time / max(vectorized_time, 1e-9), loop_result[1].sum())
+
+
+if __name__ == '__main__':
+  tf.app.run()
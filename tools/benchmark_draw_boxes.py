@@ -0,0 +1,116 @@
+r"""Benchmarks drawing boxes with `core/plotlib.py`.
+
+Compares the bulk renderer against drawing the boxes one by one, with a
+`cv2.getTextSize`, two `cv2.rectangle` and a `cv2.putText` call per box.
+
+Example usage:
+    python tools/benchmark_draw_boxes.py --logtostderr \
+      --num_boxes=2000 \
+      --image_size=500
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from core import plotlib
+
+flags = tf.app.flags
+
+flags.DEFINE_integer('num_boxes', 2000, 'Number of boxes to draw.')
+flags.DEFINE_integer('image_size', 500, 'Height and width of the image.')
+flags.DEFINE_integer('num_iterations', 20, 'Number of timed iterations.')
+
+FLAGS = flags.FLAGS
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+
+def _draw_rectangles_per_box(image, boxes, scores, labels, color, thickness,
+                             fontscale):
+  """Draws the boxes one by one, the baseline."""
+  height, width, _ = image.shape
+
+  canvas = image.copy()
+  for box, score, label in zip(boxes, scores, labels):
+    text = '%s: %.3lf' % (label.decode('UTF8'), score)
+    (text_w, text_h), _ = cv2.getTextSize(text, plotlib._FONTFACE, fontscale,
+                                          thickness)
+
+    ymin, xmin, ymax, xmax = box
+    ymin, xmin, ymax, xmax = (int(height * ymin + 0.5), int(width * xmin + 0.5),
+                              int(height * ymax + 0.5), int(width * xmax + 0.5))
+    cv2.rectangle(
+        canvas,
+        pt1=(xmin, ymin),
+        pt2=(xmax, ymax),
+        color=color,
+        thickness=thickness)
+    cv2.rectangle(
+        canvas,
+        pt1=(xmin + thickness, ymin + thickness),
+        pt2=(xmin + thickness + text_w, ymin + thickness + text_h),
+        color=color,
+        thickness=-1)
+    cv2.putText(
+        canvas,
+        text,
+        org=(xmin, ymin + text_h),
+        fontFace=plotlib._FONTFACE,
+        fontScale=fontscale,
+        color=plotlib.BLACK,
+        thickness=thickness)
+  return canvas
+
+
+def _time_fn(fn):
+  """Returns the average seconds of running the function."""
+  fn()  # Warm up.
+  start_time = time.time()
+  for _ in range(FLAGS.num_iterations):
+    fn()
+  return (time.time() - start_time) / FLAGS.num_iterations
+
+
+def main(_):
+  random_state = np.random.RandomState(0)
+
+  image = random_state.randint(
+      256, size=(FLAGS.image_size, FLAGS.image_size, 3)).astype(np.uint8)
+  center = random_state.uniform(0.2, 0.8, size=[FLAGS.num_boxes, 2])
+  size = random_state.uniform(0.05, 0.4, size=[FLAGS.num_boxes, 2])
+  boxes = np.concatenate([center - size / 2, center + size / 2], axis=-1)
+  scores = random_state.uniform(size=[FLAGS.num_boxes]).astype(np.float32)
+  labels = np.array([b'person', b'dog', b'car',
+                     b'bicycle'])[random_state.randint(4, size=FLAGS.num_boxes)]
+
+  kwargs = {'color': plotlib.RED, 'thickness': 1, 'fontscale': 1.0}
+  baseline_time = _time_fn(
+      lambda: _draw_rectangles_per_box(image, boxes, scores, labels, **kwargs))
+  tf.logging.info('%i boxes, per-box drawing: %.2lf ms.', FLAGS.num_boxes,
+                  baseline_time * 1000)
+
+  for max_text_boxes in [FLAGS.num_boxes, plotlib._MAX_TEXT_BOXES, 0]:
+    bulk_time = _time_fn(lambda: plotlib._py_draw_rectangles(
+        image, boxes, scores, labels, max_text_boxes=max_text_boxes, **kwargs))
+    tf.logging.info(
+        '%i boxes, bulk drawing (max_text_boxes=%i): %.2lf ms, %.1lfx speedup.',
+        FLAGS.num_boxes, max_text_boxes, bulk_time * 1000,
+        baseline_time / max(bulk_time, 1e-9))
+
+  # The proposals are visualized without scores nor labels.
+
+  no_scores = np.full([FLAGS.num_boxes], -9999.0, dtype=np.float32)
+  no_labels = np.array([b''] * FLAGS.num_boxes)
+  bulk_time = _time_fn(lambda: plotlib._py_draw_rectangles(
+      image, boxes, no_scores, no_labels, **kwargs))
+  tf.logging.info('%i boxes, bulk drawing without texts: %.2lf ms.',
+                  FLAGS.num_boxes, bulk_time * 1000)
+
+
+if __name__ == '__main__':
+  tf.app.run()
@@ -0,0 +1,105 @@
+r"""Benchmarks the post-processors on CPU.
+
+Compares the vectorized NMS in `core/nms.py` against the object_detection
+API's `batch_multiclass_non_max_suppression`, on random proposals and scores.
+
+Example usage:
+    python tools/benchmark_nms.py --logtostderr \
+      --sizes="2000x20,2000x80" \
+      --max_candidates_per_class=100,200,500
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+import numpy as np
+import tensorflow as tf
+
+from core import builder
+from protos import post_process_pb2
+
+flags = tf.app.flags
+
+flags.DEFINE_string('sizes', '2000x20,2000x80',
+                    'Comma-separated `num_proposals x num_classes` sizes.')
+flags.DEFINE_string('max_candidates_per_class', '100,200,500',
+                    'Comma-separated max_candidates_per_class values of the '
+                    'vectorized NMS.')
+flags.DEFINE_integer('batch_size', 1, 'Batch size.')
+flags.DEFINE_float('score_thresh', 1e-6, 'Score threshold.')
+flags.DEFINE_float('iou_thresh', 0.4, 'IoU threshold.')
+flags.DEFINE_integer('max_size_per_class', 100,
+                     'Maximum number of detections per class.')
+flags.DEFINE_integer('max_total_size', 300,
+                     'Maximum number of detections per image.')
+flags.DEFINE_integer('num_iterations', 5, 'Number of timed iterations.')
+
+FLAGS = flags.FLAGS
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+
+def _random_inputs(num_proposals, num_classes, random_state):
+  """Generates random proposals and softmax scores."""
+  center = random_state.uniform(
+      0.2, 0.8, size=[FLAGS.batch_size, num_proposals, 2])
+  size = random_state.uniform(
+      0.05, 0.6, size=[FLAGS.batch_size, num_proposals, 2])
+  boxes = np.concatenate([center - size / 2, center + size / 2], axis=-1)
+
+  logits = random_state.normal(
+      scale=3.0, size=[FLAGS.batch_size, num_proposals, num_classes])
+  scores = np.exp(logits) / np.exp(logits).sum(axis=-1, keepdims=True)
+  return boxes.astype(np.float32), scores.astype(np.float32)
+
+
+def _time_post_processor(options, boxes, scores):
+  """Returns the average seconds of running the post-processor, on CPU."""
+  tf.reset_default_graph()
+  post_process_fn = builder.build_post_processor(options)
+  outputs = post_process_fn(tf.constant(boxes), tf.constant(scores))[:4]
+
+  config = tf.ConfigProto(device_count={'GPU': 0})
+  with tf.Session(config=config) as sess:
+    results = sess.run(outputs)  # Warm up.
+    start_time = time.time()
+    for _ in range(FLAGS.num_iterations):
+      sess.run(outputs)
+  return (time.time() - start_time) / FLAGS.num_iterations, results
+
+
+def main(_):
+  random_state = np.random.RandomState(0)
+
+  for size in FLAGS.sizes.split(','):
+    num_proposals, num_classes = [int(x) for x in size.split('x')]
+    boxes, scores = _random_inputs(num_proposals, num_classes, random_state)
+
+    options = post_process_pb2.PostProcess(
+        score_thresh=FLAGS.score_thresh,
+        iou_thresh=FLAGS.iou_thresh,
+        max_size_per_class=FLAGS.max_size_per_class,
+        max_total_size=FLAGS.max_total_size)
+    baseline_time, baseline_results = _time_post_processor(
+        options, boxes, scores)
+    tf.logging.info('%i proposals x %i classes: batch_multiclass_nms %.2lf ms.',
+                    num_proposals, num_classes, baseline_time * 1000)
+
+    options.nms_type = post_process_pb2.PostProcess.VECTORIZED_NMS
+    for max_candidates in FLAGS.max_candidates_per_class.split(','):
+      options.max_candidates_per_class = int(max_candidates)
+      vectorized_time, results = _time_post_processor(options, boxes, scores)
+
+      same_outputs = all(
+          np.allclose(x, y) for x, y in zip(baseline_results, results))
+      tf.logging.info(
+          '%i proposals x %i classes: vectorized_nms (max_candidates=%i) '
+          '%.2lf ms, %.1lfx speedup, same outputs: %s.', num_proposals,
+          num_classes, options.max_candidates_per_class,
+          vectorized_time * 1000,
+          baseline_time / max(vectorized_time, 1e-9), same_outputs)
+
+
+if __name__ == '__main__':
+  tf.app.run()
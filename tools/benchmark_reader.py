@@ -0,0 +1,260 @@
+r"""Benchmarks the throughput of the reader, independently of the model.
+
+The benchmark builds `reader.get_input_fn` from a pipeline config, drains a
+number of batches on CPU and reports examples/sec, bytes/sec, the latency of
+the reader stages and the prefetch buffer occupancy. The parallelism options
+of the reader can be swept to tune the configs.
+
+Example usage:
+    python tools/benchmark_reader.py --logtostderr \
+      --pipeline_proto="configs/per_class_ssquality_07_v6.pbtxt" \
+      --reader="train" \
+      --num_batches=100 \
+      --map_num_parallel_calls="1,4,10" \
+      --prefetch_buffer_size="10,200"
+
+Unless `--input_pattern` is set, small synthetic TFRecord files are generated
+under `--synthetic_data_dir` and read instead of the files in the config.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import time
+import json
+import itertools
+import tempfile
+
+import tensorflow as tf
+from google.protobuf import text_format
+
+from reader import reader
+from reader import synthetic_data
+from core.standard_fields import InputDataFields
+from protos import pipeline_pb2
+from protos import reader_pb2
+
+flags = tf.app.flags
+
+flags.DEFINE_string('pipeline_proto', '', 'Path to the pipeline proto file.')
+
+flags.DEFINE_enum('reader', 'train', ['train', 'eval'],
+                  'Benchmark the `train_reader` or the `eval_reader`.')
+
+flags.DEFINE_string(
+    'input_pattern', '',
+    'If set, read the files instead of the generated synthetic data.')
+
+flags.DEFINE_string('synthetic_data_dir', '',
+                    'Directory of the synthetic data, defaults to a temp dir.')
+
+flags.DEFINE_integer('num_synthetic_examples', 256,
+                     'Number of synthetic examples.')
+
+flags.DEFINE_integer('num_synthetic_files', 4, 'Number of synthetic files.')
+
+flags.DEFINE_integer('num_synthetic_proposals', 2000,
+                     'Number of proposals of each synthetic example.')
+
+flags.DEFINE_integer('num_batches', 50, 'Number of batches to be measured.')
+
+flags.DEFINE_integer('num_warmup_batches', 5,
+                     'Number of batches to be drained before measuring.')
+
+flags.DEFINE_string('map_num_parallel_calls', '',
+                    'Comma-separated values to sweep.')
+
+flags.DEFINE_string('interleave_cycle_length', '',
+                    'Comma-separated values to sweep.')
+
+flags.DEFINE_string('prefetch_buffer_size', '',
+                    'Comma-separated values to sweep.')
+
+flags.DEFINE_string('output_path', '',
+                    'If set, write the results to the JSON file.')
+
+FLAGS = flags.FLAGS
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+
+def _load_pipeline_proto(filename):
+  """Loads pipeline proto from file.
+
+  Args:
+    filename: path to the pipeline config file.
+
+  Returns:
+    an instance of pipeline_pb2.Pipeline.
+  """
+  pipeline_proto = pipeline_pb2.Pipeline()
+  with tf.gfile.GFile(filename, 'r') as fp:
+    text_format.Merge(fp.read(), pipeline_proto)
+  return pipeline_proto
+
+
+def _get_mean_latency(summary, tag):
+  """Returns the mean value of a histogram summary.
+
+  Args:
+    summary: a tf.Summary proto.
+    tag: tag of the histogram.
+
+  Returns:
+    the mean value, or None if the tag does not exist.
+  """
+  for value in summary.value:
+    if value.tag == tag and value.histo.num > 0:
+      return value.histo.sum / value.histo.num
+  return None
+
+
+def _run_benchmark(options, num_batches, num_warmup_batches):
+  """Drains the batches from the reader.
+
+  Args:
+    options: an instance of reader_pb2.Reader.
+    num_batches: number of batches to be measured.
+    num_warmup_batches: number of batches to be drained before measuring.
+
+  Returns:
+    a dict of the benchmark results.
+  """
+  tf.reset_default_graph()
+
+  options.enable_stats = True
+  dataset = reader.get_input_fn(options)()
+
+  iterator = dataset.make_initializable_iterator()
+  next_element = iterator.get_next()
+  summary = tf.get_collection(reader.STATS_SUMMARY_COLLECTION)[0]
+
+  num_examples, num_bytes, batch_count = 0, 0, 0
+  with tf.Session() as sess:
+    sess.run(iterator.initializer)
+    start_time = time.time()
+    try:
+      for _ in range(num_warmup_batches):
+        sess.run(next_element)
+
+      start_time = time.time()
+      for batch_count in range(1, 1 + num_batches):
+        values = sess.run(next_element)
+        num_examples += len(values[InputDataFields.image_id])
+        num_bytes += sum(v.nbytes for v in values.values())
+    except tf.errors.OutOfRangeError:
+      tf.logging.warn('The reader is exhausted after %i batches.', batch_count)
+    elapsed_time = time.time() - start_time
+    summary = tf.Summary.FromString(sess.run(summary))
+
+  results = {
+      'num_batches': batch_count,
+      'num_examples': num_examples,
+      'elapsed_time': elapsed_time,
+      'examples_per_sec': num_examples / elapsed_time,
+      'bytes_per_sec': num_bytes / elapsed_time,
+  }
+
+  # The latency stats are in microseconds.
+
+  for stage in ['read', 'parse', 'batch', 'prefetch']:
+    latency = _get_mean_latency(
+        summary, '{}/{}_latency'.format(reader.STATS_PREFIX, stage))
+    if latency is not None:
+      results[stage + '_latency_ms'] = latency / 1000.0
+
+  for value in summary.value:
+    if 'buffer_utilization' in value.tag and value.histo.num > 0:
+      results['prefetch_buffer_occupancy'] = value.histo.sum / value.histo.num
+  return results
+
+
+def _parse_sweep_values(flag_value, default_value):
+  """Parses the comma-separated values of a sweep flag.
+
+  Args:
+    flag_value: the flag value.
+    default_value: value used if the flag is not set.
+
+  Returns:
+    a list of int values.
+  """
+  if not flag_value:
+    return [default_value]
+  return [int(x) for x in flag_value.split(',')]
+
+
+def main(_):
+  pipeline_proto = _load_pipeline_proto(FLAGS.pipeline_proto)
+  if FLAGS.reader == 'train':
+    options = pipeline_proto.train_reader
+  else:
+    options = pipeline_proto.eval_reader
+
+  # Use the synthetic data unless the input files are specified.
+
+  input_pattern = FLAGS.input_pattern
+  if not input_pattern:
+    synthetic_data_dir = FLAGS.synthetic_data_dir or tempfile.mkdtemp()
+    tf.gfile.MakeDirs(synthetic_data_dir)
+    output_path = os.path.join(synthetic_data_dir, 'synthetic.record')
+    synthetic_data.write_synthetic_tf_records(
+        output_path,
+        FLAGS.num_synthetic_examples,
+        num_files=FLAGS.num_synthetic_files,
+        seed=0,
+        num_proposals=FLAGS.num_synthetic_proposals,
+        quantize_proposals=(options.proposal_encoding ==
+                            reader_pb2.Reader.QUANTIZED_UINT16))
+    input_pattern = output_path + '-*'
+    tf.logging.info('Wrote synthetic data to %s.', input_pattern)
+
+  while len(options.input_pattern) > 0:
+    options.input_pattern.pop()
+  options.input_pattern.append(input_pattern)
+  options.shard_indicator = ''
+  options.cache_dir = ''
+
+  all_results = []
+  for (map_num_parallel_calls, interleave_cycle_length,
+       prefetch_buffer_size) in itertools.product(
+           _parse_sweep_values(FLAGS.map_num_parallel_calls,
+                               options.map_num_parallel_calls),
+           _parse_sweep_values(FLAGS.interleave_cycle_length,
+                               options.interleave_cycle_length),
+           _parse_sweep_values(FLAGS.prefetch_buffer_size,
+                               options.prefetch_buffer_size)):
+    options.map_num_parallel_calls = map_num_parallel_calls
+    options.interleave_cycle_length = interleave_cycle_length
+    options.prefetch_buffer_size = prefetch_buffer_size
+
+    results = {
+        'map_num_parallel_calls': map_num_parallel_calls,
+        'interleave_cycle_length': interleave_cycle_length,
+        'prefetch_buffer_size': prefetch_buffer_size,
+    }
+    results.update(
+        _run_benchmark(options, FLAGS.num_batches, FLAGS.num_warmup_batches))
+    tf.logging.info('Benchmark results:\n%s',
+                    json.dumps(results, indent=2, sort_keys=True))
+    all_results.append(results)
+
+  # Summarize the sweep, the fastest setting first.
+
+  all_results.sort(key=lambda x: -x['examples_per_sec'])
+  for results in all_results:
+    tf.logging.info(
+        'map_num_parallel_calls=%i, interleave_cycle_length=%i, '
+        'prefetch_buffer_size=%i: %.2lf examples/sec, %.2lf MB/sec.',
+        results['map_num_parallel_calls'], results['interleave_cycle_length'],
+        results['prefetch_buffer_size'], results['examples_per_sec'],
+        results['bytes_per_sec'] / 1e6)
+
+  if FLAGS.output_path:
+    with open(FLAGS.output_path, 'w') as fid:
+      json.dump(all_results, fid, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+  tf.app.run()
@@ -12,136 +12,131 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ==============================================================================
-r"""Convert raw COCO dataset to TFRecord for object_detection.
+r"""Extracts selective search proposals of the COCO dataset.
 
-Please note that this tool creates sharded output files.
+Images are processed by a pool of worker processes, finished images are
+recorded in a manifest file so that a crashed run can be resumed.
 
 Example usage:
-    python create_coco_tf_record.py --logtostderr \
+    python tools/create_coco_selective_search_data.py --logtostderr \
       --train_image_file="${TRAIN_IMAGE_FILE}" \
       --val_image_file="${VAL_IMAGE_FILE}" \
       --test_image_file="${TEST_IMAGE_FILE}" \
       --train_annotations_file="${TRAIN_ANNOTATIONS_FILE}" \
-      --train_caption_annotations_file="${TRAIN_CAPTION_ANNOTATIONS_FILE}" \
       --val_annotations_file="${VAL_ANNOTATIONS_FILE}" \
-      --val_caption_annotations_file="${VAL_CAPTION_ANNOTATIONS_FILE}" \
       --testdev_annotations_file="${TESTDEV_ANNOTATIONS_FILE}" \
-      --output_dir="${OUTPUT_DIR}"
+      --output_dir="${OUTPUT_DIR}" \
+      --num_workers=32
 """
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import hashlib
-import io
+import functools
 import json
 import os
-import contextlib2
-import nltk.tokenize
-import numpy as np
-import PIL.Image
 import zipfile
-import cv2
 
-from pycocotools import mask
 import tensorflow as tf
 
-from object_detection.dataset_tools import tf_record_creation_util
-from object_detection.utils import dataset_util
-from object_detection.utils import label_map_util
+from core import selective_search
 
 flags = tf.app.flags
-tf.flags.DEFINE_boolean(
-    'include_masks', False, 'Whether to include instance segmentations masks '
-    '(PNG encoded) in the result. default: False.')
 tf.flags.DEFINE_string('train_image_file', '', 'Training image zip file.')
 tf.flags.DEFINE_string('val_image_file', '', 'Validation image zip file.')
 tf.flags.DEFINE_string('test_image_file', '', 'Test image zip file.')
 tf.flags.DEFINE_string('train_annotations_file', '',
                        'Training annotations JSON file.')
-tf.flags.DEFINE_string('train_caption_annotations_file', '',
-                       'Training annotations JSON file.')
 tf.flags.DEFINE_string('val_annotations_file', '',
                        'Validation annotations JSON file.')
-tf.flags.DEFINE_string('val_caption_annotations_file', '',
-                       'Validation annotations JSON file.')
 tf.flags.DEFINE_string('testdev_annotations_file', '',
                        'Test-dev annotations JSON file.')
 tf.flags.DEFINE_string('output_dir', 'output/', 'Output data directory.')
+tf.flags.DEFINE_boolean('include_masks', False,
+                        'Deprecated, unused by the proposal extraction.')
+tf.flags.DEFINE_string('train_caption_annotations_file', '',
+                       'Deprecated, unused by the proposal extraction.')
+tf.flags.DEFINE_string('val_caption_annotations_file', '',
+                       'Deprecated, unused by the proposal extraction.')
 tf.flags.DEFINE_string('structured_edge_detection_model',
-                       'zoo/ximgproc/model.yml', '')
+                       'zoo/ximgproc/model.yml',
+                       'Deprecated, unused by the proposal extraction.')
+tf.flags.DEFINE_string('manifest_file', '',
+                       'Path to the manifest recording the finished images, '
+                       'defaults to `output_dir`/manifest.txt. With `parts`, '
+                       'each part writes its own suffixed manifest.')
+tf.flags.DEFINE_integer('num_workers', 0,
+                        'Number of worker processes, 0 to use all cores.')
+tf.flags.DEFINE_integer('num_threads', 1,
+                        'Number of OpenCV threads of each worker process.')
+tf.flags.DEFINE_integer(
+    'queue_size', 0, 'Maximum number of images in flight, 0 for the default.')
+tf.flags.DEFINE_string(
+    'proposal_store', '',
+    'If set, write to this consolidated proposal store instead of .npy files. '
+    'With `parts`, each part writes its own suffixed store.')
+tf.flags.DEFINE_string('proposal_store_dtype', 'float32',
+                       'Dtype of the proposal store, `float16` or `float32`.')
 tf.flags.DEFINE_string('parts', '', '')
 
 FLAGS = flags.FLAGS
 
 tf.logging.set_verbosity(tf.logging.INFO)
 
-cv2.setUseOptimized(True)
-cv2.setNumThreads(4)
-ss = cv2.ximgproc.segmentation.createSelectiveSearchSegmentation()
 
+def _read_image(zip_handler, filename):
+  """Reads the encoded image from the ZIP file.
 
-def _create_ssbox_data_from_coco_annotations(annotations_file, zip_file,
-                                             output_path):
-  """Loads COCO annotation json files and converts to tf.Record format.
+  Args:
+    zip_handler: class for reading and writing ZIP files.
+    filename: name of the image in the ZIP file.
+
+  Returns:
+    encoded_jpg: the encoded image bytes.
+  """
+  with zip_handler.open(filename, "r") as fid:
+    return fid.read()
+
+
+def _iterate_coco_images(annotations_file, zip_file, part_at_i, part_total):
+  """Yields the COCO images to be processed.
 
   Args:
     annotations_file: JSON file containing bounding box annotations.
     zip_file: ZIP file containing the image files.
-    output_path: Path to output tf.Record file.
-  """
-  part_at_i, part_total = 0, 1
-  if FLAGS.parts:
-    part_at_i, part_total = [int(x) for x in FLAGS.parts.split('/')]
-
-  with tf.gfile.GFile(annotations_file, 'r') as fid, \
-      zipfile.ZipFile(zip_file) as zip_handler:
-    groundtruth_data = json.load(fid)
-    images = groundtruth_data['images']
+    part_at_i: index of the part to be processed.
+    part_total: total number of parts.
 
-    for index, image in enumerate(images):
-      if index % 100 == 0:
-        tf.logging.info('On image %d of %d', index, len(images))
+  Yields:
+    image_id: the COCO image id.
+    read_fn: a callable returning the encoded image bytes.
+  """
+  with tf.gfile.GFile(annotations_file, 'r') as fid:
+    images = json.load(fid)['images']
+  tf.logging.info('Found %d images in %s.', len(images), annotations_file)
 
+  with zipfile.ZipFile(zip_file) as zip_handler:
+    for image in images:
       image_id = image['id']
       filename = image['file_name']
 
       if image_id % part_total == part_at_i:
         sub_dir = filename.split('_')[1]
-        with zip_handler.open(sub_dir + '/' + filename, "r") as fid:
-          encoded_jpg = fid.read()
-
-        # OpenCV EdgeBoxes.
-
-        file_bytes = np.fromstring(encoded_jpg, dtype=np.uint8)
-        bgr = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
+        yield image_id, functools.partial(_read_image, zip_handler,
+                                          sub_dir + '/' + filename)
 
-        # Resize image if neccessary.
-        height, width = bgr.shape[0], bgr.shape[1]
-        if height / width >= 2.2:
-          width = int(height / 2.2)
-          bgr = cv2.resize(bgr, (width, height))
-        elif width / height >= 2.2:
-          height = int(width / 2.2)
-          bgr = cv2.resize(bgr, (width, height))
-        height, width = bgr.shape[0], bgr.shape[1]
 
-        ss.setBaseImage(bgr)
-        #ss.switchToSelectiveSearchFast()
-        ss.switchToSelectiveSearchQuality()
-        rects = ss.process()
+def _get_npy_path(image_id):
+  """Returns the path `output_dir`/{image_id % 10}/{image_id}.npy.
 
-        rects = np.stack([rect for rect in rects if rect[2] >= 20 and rect[3] >= 20],
-                         axis=0)
-
-        x, y, w, h = [rects[:, i] for i in range(4)]
-        proposals = np.stack(
-            [y / height, x / width, (y + h) / height, (x + w) / width], axis=-1)
+  Args:
+    image_id: the COCO image id.
 
-        output_name = os.path.join(output_path, '{}/{}.npy'.format(
-            image_id % 10, image_id))
-        with open(output_name, 'wb') as out_fid:
-          np.save(out_fid, proposals)
+  Returns:
+    path to the .npy file.
+  """
+  return os.path.join(FLAGS.output_dir, '{}/{}.npy'.format(
+      image_id % 10, image_id))
 
 
 def main(_):
@@ -152,15 +147,38 @@ def main(_):
   assert FLAGS.val_annotations_file, '`val_annotations_file` missing.'
   assert FLAGS.testdev_annotations_file, '`testdev_annotations_file` missing.'
 
-  if not tf.gfile.IsDirectory(FLAGS.output_dir):
-    tf.gfile.MakeDirs(FLAGS.output_dir)
+  part_at_i, part_total = 0, 1
+  if FLAGS.parts:
+    part_at_i, part_total = [int(x) for x in FLAGS.parts.split('/')]
 
-  _create_ssbox_data_from_coco_annotations(
-      FLAGS.train_annotations_file, FLAGS.train_image_file, FLAGS.output_dir)
-  _create_ssbox_data_from_coco_annotations(
-      FLAGS.val_annotations_file, FLAGS.val_image_file, FLAGS.output_dir)
-  _create_ssbox_data_from_coco_annotations(
-      FLAGS.testdev_annotations_file, FLAGS.test_image_file, FLAGS.output_dir)
+  if not FLAGS.proposal_store:
+    for i in range(10):
+      sub_dir = os.path.join(FLAGS.output_dir, str(i))
+      if not tf.gfile.IsDirectory(sub_dir):
+        tf.gfile.MakeDirs(sub_dir)
+
+  manifest_file = selective_search.get_manifest_file(
+      FLAGS.output_dir, FLAGS.manifest_file, part_at_i, part_total)
+  writer = selective_search.create_proposal_writer(
+      _get_npy_path,
+      manifest_file,
+      store_path=selective_search.get_proposal_store_path(
+          FLAGS.proposal_store, part_at_i, part_total),
+      store_dtype=FLAGS.proposal_store_dtype)
+  try:
+    for annotations_file, zip_file in [
+        (FLAGS.train_annotations_file, FLAGS.train_image_file),
+        (FLAGS.val_annotations_file, FLAGS.val_image_file),
+        (FLAGS.testdev_annotations_file, FLAGS.test_image_file)]:
+      selective_search.run_selective_search(
+          _iterate_coco_images(annotations_file, zip_file, part_at_i,
+                               part_total),
+          writer,
+          num_workers=FLAGS.num_workers,
+          queue_size=FLAGS.queue_size,
+          num_threads=FLAGS.num_threads)
+  finally:
+    writer.close()
 
 
 if __name__ == '__main__':
@@ -14,7 +14,9 @@
 # ==============================================================================
 r"""Convert raw COCO dataset to TFRecord for object_detection.
 
-Please note that this tool creates sharded output files.
+Please note that this tool creates sharded output files. With
+`--num_workers`, each worker process owns a disjoint set of the shards and
+writes them directly; the per-stage throughput is logged at the end.
 
 Example usage:
     python create_coco_tf_record.py --logtostderr \
@@ -26,7 +28,8 @@ Example usage:
       --val_annotations_file="${VAL_ANNOTATIONS_FILE}" \
       --val_caption_annotations_file="${VAL_CAPTION_ANNOTATIONS_FILE}" \
       --testdev_annotations_file="${TESTDEV_ANNOTATIONS_FILE}" \
-      --output_dir="${OUTPUT_DIR}"
+      --output_dir="${OUTPUT_DIR}" \
+      --num_workers=8
 """
 from __future__ import absolute_import
 from __future__ import division
@@ -36,6 +39,9 @@ import hashlib
 import io
 import json
 import os
+import time
+import multiprocessing
+import contextlib
 import contextlib2
 import nltk.tokenize
 import numpy as np
@@ -46,10 +52,11 @@ from pycocotools import mask
 import tensorflow as tf
 import collections
 
-from object_detection.dataset_tools import tf_record_creation_util
 from object_detection.utils import dataset_util
 from object_detection.utils import label_map_util
 
+from core import proposal_store
+
 flags = tf.app.flags
 tf.flags.DEFINE_boolean(
     'include_masks', False, 'Whether to include instance segmentations masks '
@@ -70,6 +77,19 @@ tf.flags.DEFINE_string('testdev_annotations_file', '',
 tf.flags.DEFINE_string('output_dir', 'output/', 'Output data directory.')
 tf.flags.DEFINE_string('proposal_data', 'raw_data/coco_ssbox_quality',
                        'Directory to the proposal data.')
+tf.flags.DEFINE_string(
+    'proposal_store', '',
+    'Comma-separated paths to the consolidated proposal stores, if set, the '
+    'proposals are read from the stores instead of the .npy files.')
+tf.flags.DEFINE_boolean(
+    'quantize_proposals', False,
+    'If true, store the proposals as one bytes feature of uint16 normalized '
+    'coordinates, set the `proposal_encoding` of the reader to '
+    'QUANTIZED_UINT16 to read them.')
+tf.flags.DEFINE_integer(
+    'num_workers', 1,
+    'Number of worker processes, each of them owns a disjoint set of the '
+    'output shards. Set to 0 to use all the cores.')
 flags.DEFINE_boolean('normalize_oicr', False, 'Whether to normalize_oicr boxes')
 flags.DEFINE_boolean('filter_pascal', False, 'Whether to normalize_oicr boxes')
 
@@ -79,6 +99,25 @@ tf.logging.set_verbosity(tf.logging.INFO)
 
 counter = collections.defaultdict(int)
 
+# Stages of building a tf.Example, in the order they are reported.
+
+_STAGES = ['read', 'hash', 'pil', 'proposal', 'caption', 'serialize', 'write']
+
+
+@contextlib.contextmanager
+def _timed(timer, stage):
+  """Accumulates the elapsed time of a stage into `timer`.
+
+  Args:
+    timer: a dict mapping from stage name to seconds, or None to disable.
+    stage: name of the stage.
+  """
+  start_time = time.time()
+  yield
+  if timer is not None:
+    timer[stage] += time.time() - start_time
+
+
 def _process_caption(caption):
   """Processes a caption string into a list of tonenized words.
 
@@ -90,13 +129,23 @@ def _process_caption(caption):
   return nltk.tokenize.word_tokenize(caption.lower())
 
 
+# The proposal loader, created in main().
+
+_proposal_loader = None
+
+# The proposal feature encoder of the worker, created in _write_shards().
+
+_proposal_encoder = None
+
+
 def create_tf_example(image,
                       annotations_list,
                       caption_annotations_list,
                       zip_handler,
                       category_index,
                       include_masks=False,
-                      sub_dir=None):
+                      sub_dir=None,
+                      timer=None):
   """Converts image and annotations to a tf.Example proto.
 
   Args:
@@ -122,6 +171,8 @@ def create_tf_example(image,
       label_map_util.create_category_index function.
     include_masks: Whether to include instance segmentations masks
       (PNG encoded) in the result. default: False.
+    sub_dir: sub directory of the images in the ZIP file.
+    timer: if set, a dict to which the seconds spent on each stage are added.
   Returns:
     example: The converted tf.Example
     num_annotations_skipped: Number of (invalid) annotations that were ignored.
@@ -146,18 +197,18 @@ def create_tf_example(image,
   # Read from ZIP file.
   # Add sub_dir of 'train2017' for '000000467840.jpg'.
 
-  with zip_handler.open(sub_dir + '/' + filename, "r") as fid:
-    encoded_jpg = fid.read()
+  with _timed(timer, 'read'):
+    with zip_handler.open(sub_dir + '/' + filename, "r") as fid:
+      encoded_jpg = fid.read()
 
-  encoded_jpg_io = io.BytesIO(encoded_jpg)
-  image = PIL.Image.open(encoded_jpg_io)
-  key = hashlib.sha256(encoded_jpg).hexdigest()
+  with _timed(timer, 'pil'):
+    encoded_jpg_io = io.BytesIO(encoded_jpg)
+    image = PIL.Image.open(encoded_jpg_io)
+  with _timed(timer, 'hash'):
+    key = hashlib.sha256(encoded_jpg).hexdigest()
 
-  npy_path= os.path.join(FLAGS.proposal_data, '{}/{}.npy'.format(image_id % 10, image_id))
-
-  with open(npy_path, 'rb') as fid:
-    #proposals = np.load(fid)[:2000, :]
-    proposals = np.load(fid)
+  with _timed(timer, 'proposal'):
+    proposals = _proposal_loader.get(image_id)
 
   if FLAGS.normalize_oicr:
     ymin, xmin, ymax, xmax = [proposals[:, i] for i in range(4)]
@@ -247,12 +298,13 @@ def create_tf_example(image,
     caption_string = []
     caption_offset = []
     caption_length = []
-    for caption_annotations in caption_annotations_list:
-      caption = _process_caption(caption_annotations['caption'])
-      caption_offset.append(len(caption_string))
-      caption_length.append(len(caption))
-      caption_string.extend(caption)
-    caption_string = [caption.encode('utf8') for caption in caption_string]
+    with _timed(timer, 'caption'):
+      for caption_annotations in caption_annotations_list:
+        caption = _process_caption(caption_annotations['caption'])
+        caption_offset.append(len(caption_string))
+        caption_length.append(len(caption))
+        caption_string.extend(caption)
+      caption_string = [caption.encode('utf8') for caption in caption_string]
 
   feature_dict = {
       'image/height':
@@ -291,15 +343,8 @@ def create_tf_example(image,
       dataset_util.int64_list_feature(caption_offset),
       'image/caption/length':
       dataset_util.int64_list_feature(caption_length),
-      'image/proposal/bbox/ymin':
-      dataset_util.float_list_feature(proposals[:, 0].tolist()),
-      'image/proposal/bbox/xmin':
-      dataset_util.float_list_feature(proposals[:, 1].tolist()),
-      'image/proposal/bbox/ymax':
-      dataset_util.float_list_feature(proposals[:, 2].tolist()),
-      'image/proposal/bbox/xmax':
-      dataset_util.float_list_feature(proposals[:, 3].tolist()),
   }
+  feature_dict.update(_proposal_encoder.encode(proposals))
   if include_masks:
     feature_dict['image/object/mask'] = (
         dataset_util.bytes_list_feature(encoded_mask_png))
@@ -307,9 +352,101 @@ def create_tf_example(image,
   return key, example, num_annotations_skipped
 
 
+def _write_shards(worker_index, num_workers, images, annotations_index,
+                  caption_annotations_index, category_index, zip_file,
+                  output_path, include_masks, num_shards, subdir, stats_queue):
+  """Writes the output shards owned by a worker.
+
+  The i-th shard is owned by the (i % num_workers)-th worker, and the idx-th
+  image goes to the (idx % num_shards)-th shard. Each worker opens its own ZIP
+  handle and its own TFRecord writers, so no data is exchanged between them.
+
+  Args:
+    worker_index: index of the worker.
+    num_workers: total number of workers.
+    images: list of COCO image dicts.
+    annotations_index: a dict mapping from image id to annotations.
+    caption_annotations_index: a dict mapping from image id to captions.
+    category_index: a dict containing COCO category information.
+    zip_file: ZIP file containing the image files.
+    output_path: Path to output tf.Record file.
+    include_masks: Whether to include instance segmentations masks.
+    num_shards: number of output file shards.
+    subdir: sub directory of the images in the ZIP file.
+    stats_queue: if set, a multiprocessing.Queue to which the stats are put.
+
+  Returns:
+    a tuple of (num_images, num_annotations_skipped, timer,
+      quantization_error).
+  """
+  global _proposal_encoder
+  _proposal_encoder = proposal_store.ProposalFeatureEncoder(
+      quantize=FLAGS.quantize_proposals)
+
+  timer = collections.defaultdict(float)
+  num_images, total_num_annotations_skipped = 0, 0
+
+  with contextlib2.ExitStack() as tf_record_close_stack, \
+      zipfile.ZipFile(zip_file) as zip_handler:
+    output_tfrecords = {}
+    for shard_idx in range(worker_index, num_shards, num_workers):
+      output_tfrecords[shard_idx] = tf_record_close_stack.enter_context(
+          tf.python_io.TFRecordWriter('{}-{:05d}-of-{:05d}'.format(
+              output_path, shard_idx, num_shards)))
+
+    for idx, image in enumerate(images):
+      shard_idx = idx % num_shards
+      if shard_idx not in output_tfrecords:
+        continue
+      if num_images % 100 == 0:
+        tf.logging.info('Worker %d: on image %d of %d', worker_index, idx,
+                        len(images))
+      annotations_list = annotations_index[image['id']]
+      caption_annotations_list = caption_annotations_index[image['id']]
+      _, tf_example, num_annotations_skipped = create_tf_example(
+          image, annotations_list, caption_annotations_list, zip_handler,
+          category_index, include_masks, subdir, timer)
+      num_images += 1
+      if tf_example is not None:
+        total_num_annotations_skipped += num_annotations_skipped
+        with _timed(timer, 'serialize'):
+          serialized_example = tf_example.SerializeToString()
+        with _timed(timer, 'write'):
+          output_tfrecords[shard_idx].write(serialized_example)
+      else:
+        tf.logging.info('Filtered by pascal classes.')
+
+  stats = (num_images, total_num_annotations_skipped, dict(timer),
+           _proposal_encoder.quantization_error)
+  if stats_queue is not None:
+    stats_queue.put(stats)
+  return stats
+
+
+def _log_stage_throughput(num_images, timer, elapsed_time, num_workers):
+  """Logs the per-stage throughput.
+
+  Args:
+    num_images: total number of images processed.
+    timer: a dict mapping from stage name to seconds summed over workers.
+    elapsed_time: wall-clock seconds of the job.
+    num_workers: number of workers.
+  """
+  total_time = sum(timer.values())
+  for stage in _STAGES:
+    secs = timer.get(stage, 0.0)
+    tf.logging.info(
+        'Stage %-10s %10.2lf secs (%5.1lf%%), %10.2lf images/sec per worker.',
+        stage, secs, 100.0 * secs / max(total_time, 1e-8),
+        num_images / max(secs, 1e-8))
+  tf.logging.info('Processed %d images in %.2lf secs using %d workers, '
+                  '%.2lf images/sec.', num_images, elapsed_time, num_workers,
+                  num_images / max(elapsed_time, 1e-8))
+
+
 def _create_tf_record_from_coco_annotations(
     annotations_file, caption_annotations_file, zip_file, output_path,
-    include_masks, num_shards, subdir=None):
+    include_masks, num_shards, subdir=None, num_workers=1):
   """Loads COCO annotation json files and converts to tf.Record format.
 
   Args:
@@ -320,11 +457,10 @@ def _create_tf_record_from_coco_annotations(
     include_masks: Whether to include instance segmentations masks
       (PNG encoded) in the result. default: False.
     num_shards: number of output file shards.
+    subdir: sub directory of the images in the ZIP file.
+    num_workers: number of worker processes, 0 to use all the cores.
   """
-  with contextlib2.ExitStack() as tf_record_close_stack, \
-      tf.gfile.GFile(annotations_file, 'r') as fid:
-    output_tfrecords = tf_record_creation_util.open_sharded_output_tfrecords(
-        tf_record_close_stack, output_path, num_shards)
+  with tf.gfile.GFile(annotations_file, 'r') as fid:
     groundtruth_data = json.load(fid)
     images = groundtruth_data['images']
     category_index = label_map_util.create_category_index(
@@ -373,27 +509,67 @@ def _create_tf_record_from_coco_annotations(
     tf.logging.info('%d images are missing caption annotations.',
                     missing_caption_annotation_count)
 
-    with zipfile.ZipFile(zip_file) as zip_handler:
-      total_num_annotations_skipped = 0
-      for idx, image in enumerate(images):
-        if idx % 100 == 0:
-          tf.logging.info('On image %d of %d', idx, len(images))
-        annotations_list = annotations_index[image['id']]
-        caption_annotations_list = caption_annotations_index[image['id']]
-        _, tf_example, num_annotations_skipped = create_tf_example(
-            image, annotations_list, caption_annotations_list, zip_handler,
-            category_index, include_masks, subdir)
-        if tf_example is not None:
-          total_num_annotations_skipped += num_annotations_skipped
-          shard_idx = idx % num_shards
-          output_tfrecords[shard_idx].write(tf_example.SerializeToString())
-        else:
-          tf.logging.info('Filtered by pascal classes.')
-      tf.logging.info('Finished writing, skipped %d annotations.',
-                      total_num_annotations_skipped)
+  num_workers = min(num_workers or multiprocessing.cpu_count(), num_shards)
+  args = (images, annotations_index, caption_annotations_index, category_index,
+          zip_file, output_path, include_masks, num_shards, subdir)
+
+  start_time = time.time()
+  if num_workers <= 1:
+    stats = [_write_shards(0, 1, *(args + (None,)))]
+  else:
+    # The workers are forked, so that the annotation indices are shared instead
+    # of being pickled.
+
+    stats_queue = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=_write_shards, args=(i, num_workers) + args + (stats_queue,))
+        for i in range(num_workers)
+    ]
+    for worker in workers:
+      worker.start()
+
+    # Poll the queue so that a crashed worker does not hang the job.
+
+    stats = []
+    while len(stats) < num_workers:
+      if not stats_queue.empty():
+        stats.append(stats_queue.get())
+        continue
+      for worker in workers:
+        if worker.exitcode not in (None, 0):
+          for other in workers:
+            other.terminate()
+          raise ValueError('Worker exited with code {}.'.format(
+              worker.exitcode))
+      time.sleep(1)
+    for worker in workers:
+      worker.join()
+
+  num_images = sum(x[0] for x in stats)
+  total_num_annotations_skipped = sum(x[1] for x in stats)
+  timer = collections.defaultdict(float)
+  proposal_encoder = proposal_store.ProposalFeatureEncoder(
+      quantize=FLAGS.quantize_proposals)
+  for _, _, worker_timer, quantization_error in stats:
+    for stage, secs in worker_timer.items():
+      timer[stage] += secs
+    proposal_encoder.merge_quantization_error(quantization_error)
+
+  tf.logging.info('Finished writing, skipped %d annotations.',
+                  total_num_annotations_skipped)
+  _log_stage_throughput(num_images, timer, time.time() - start_time,
+                        num_workers)
+  proposal_encoder.log_quantization_error()
 
 
 def main(_):
+  global _proposal_loader
+  _proposal_loader = proposal_store.ProposalLoader(
+      store_paths=[x for x in FLAGS.proposal_store.split(',') if x],
+      npy_path_fn=lambda image_id: os.path.join(
+          FLAGS.proposal_data, '{}/{}.npy'.format(image_id % 10, image_id)))
+
   assert FLAGS.train_image_file, '`train_image_file` missing.'
   assert FLAGS.val_image_file, '`val_image_file` missing.'
   assert FLAGS.test_image_file, '`test_image_file` missing.'
@@ -414,6 +590,7 @@ def main(_):
   #    train_output_path,
   #    FLAGS.include_masks,
   #    num_shards=100,
+  #    num_workers=FLAGS.num_workers,
   #    subdir='train2017')
   #_create_tf_record_from_coco_annotations(
   #    FLAGS.val_annotations_file,
@@ -422,6 +599,7 @@ def main(_):
   #    val_output_path,
   #    FLAGS.include_masks,
   #    num_shards=5,
+  #    num_workers=FLAGS.num_workers,
   #    subdir='val2017')
   _create_tf_record_from_coco_annotations(
       FLAGS.testdev_annotations_file,
@@ -430,7 +608,8 @@ def main(_):
       testdev_output_path,
       FLAGS.include_masks,
       num_shards=50,
-      subdir='test2017')
+      subdir='test2017',
+      num_workers=FLAGS.num_workers)
 
 
 if __name__ == '__main__':
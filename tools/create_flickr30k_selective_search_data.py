@@ -12,100 +12,76 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ==============================================================================
-r"""Convert raw PASCAL dataset to TFRecord for object_detection.
+r"""Extracts selective search proposals of the Flickr30K dataset.
+
+Images are processed by a pool of worker processes, finished images are
+recorded in a manifest file so that a crashed run can be resumed.
 
 Example usage:
-    python object_detection/dataset_tools/create_pascal_tf_record.py \
-        --data_dir=/home/user/VOCdevkit \
-        --year=VOC2012 \
-        --output_path=/home/user/pascal.record
+    python tools/create_flickr30k_selective_search_data.py \
+        --image_tar_file=raw_data/flickr30k-images.tar \
+        --output_path=raw_data/flickr30k_ssbox_quality \
+        --num_workers=16
 """
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
 import os
-import cv2
 import tarfile
-import numpy as np
 
 import tensorflow as tf
 
+from core import selective_search
+
 flags = tf.app.flags
 flags.DEFINE_string('image_tar_file', '', '')
 flags.DEFINE_string('output_path', '', '')
+flags.DEFINE_string('manifest_file', '',
+                    'Path to the manifest recording the finished images, '
+                    'defaults to `output_path`/manifest.txt. With `parts`, '
+                    'each part writes its own suffixed manifest.')
+flags.DEFINE_integer('num_workers', 0,
+                     'Number of worker processes, 0 to use all cores.')
+flags.DEFINE_integer('num_threads', 1,
+                     'Number of OpenCV threads of each worker process.')
+flags.DEFINE_integer('queue_size', 0,
+                     'Maximum number of images in flight, 0 for the default.')
+flags.DEFINE_string(
+    'proposal_store', '',
+    'If set, write to this consolidated proposal store instead of .npy files. '
+    'With `parts`, each part writes its own suffixed store.')
+flags.DEFINE_string('proposal_store_dtype', 'float32',
+                    'Dtype of the proposal store, `float16` or `float32`.')
 tf.flags.DEFINE_string('parts', '', '')
 
 FLAGS = flags.FLAGS
 
 tf.logging.set_verbosity(tf.logging.DEBUG)
 
-cv2.setUseOptimized(True)
-cv2.setNumThreads(8)
-ss = cv2.ximgproc.segmentation.createSelectiveSearchSegmentation()
-
-
-def selective_search(data,
-                     dataset_directory,
-                     label_map_dict,
-                     ignore_difficult_instances=False,
-                     image_subdirectory='JPEGImages'):
-  """Convert XML derived dict to tf.Example proto.
 
-  Notice that this function normalizes the bounding box coordinates provided
-  by the raw data.
+def _iterate_images(image_tar_file, part_at_i, part_total):
+  """Yields the Flickr30K images to be processed.
 
   Args:
-    data: dict holding PASCAL XML fields for a single image (obtained by
-      running dataset_util.recursive_parse_xml_to_dict)
-    dataset_directory: Path to root directory holding PASCAL dataset
-    label_map_dict: A map from string label names to integers ids.
-    ignore_difficult_instances: Whether to skip difficult instances in the
-      dataset  (default: False).
-    image_subdirectory: String specifying subdirectory within the
-      PASCAL dataset directory holding the actual image data.
-
-  Returns:
-    example: The converted tf.Example.
-
-  Raises:
-    ValueError: if the image pointed to by data['filename'] is not a valid JPEG
-  """
-  img_path = os.path.join(data['folder'], image_subdirectory, data['filename'])
-  full_path = os.path.join(dataset_directory, img_path)
-  with tf.gfile.GFile(full_path, 'rb') as fid:
-    encoded_jpg = fid.read()
-
-  width = int(data['size']['width'])
-  height = int(data['size']['height'])
-
-  # Use SelectiveSearch to get the proposals.
+    image_tar_file: TAR file containing the image files.
+    part_at_i: index of the part to be processed.
+    part_total: total number of parts.
 
-  file_bytes = np.fromstring(encoded_jpg, dtype=np.uint8)
-
-  bgr = cv2.imdecode(file_bytes, cv2.IMREAD_UNCHANGED)
-  assert bgr.shape[0] == height and bgr.shape[1] == width
-
-  if height / width >= 2.2:
-    width = int(height / 2.2)
-    bgr = cv2.resize(bgr, (width, height))
-  elif width / height >= 2.2:
-    height = int(width / 2.2)
-    bgr = cv2.resize(bgr, (width, height))
-
-  ss.setBaseImage(bgr)
-  #ss.switchToSelectiveSearchFast()
-  ss.switchToSelectiveSearchQuality()
-  rects = ss.process()
+  Yields:
+    image_id: the Flickr30K image id.
+    read_fn: a callable returning the encoded image bytes.
+  """
+  with tarfile.open(image_tar_file, "r:tar") as tar:
+    for tarinfo in tar:
+      if not tarinfo.isreg(): continue
 
-  rects = np.stack([rect for rect in rects if rect[2] >= 20 and rect[3] >= 20],
-                   axis=0)
+      image_id = tarinfo.name.split('/')[1].split('.')[0]
+      if not image_id.isdigit(): continue
+      image_id = int(image_id)
 
-  height, width = bgr.shape[0], bgr.shape[1]
-  x, y, w, h = [rects[:, i] for i in range(4)]
-  proposals = np.stack(
-      [y / height, x / width, (y + h) / height, (x + w) / width], axis=-1)
-  return proposals
+      if image_id % part_total == part_at_i:
+        yield image_id, lambda tarinfo=tarinfo: tar.extractfile(tarinfo).read()
 
 
 def main(_):
@@ -113,53 +89,24 @@ def main(_):
   if FLAGS.parts:
     part_at_i, part_total = [int(x) for x in FLAGS.parts.split('/')]
 
-  count = 0
-  with tarfile.open(FLAGS.image_tar_file, "r:tar") as tar:
-    for tarinfo in tar:
-      if not tarinfo.isreg(): continue
-
-      image_id = tarinfo.name.split('/')[1].split('.')[0]
-      if not image_id.isdigit(): continue
-      image_id = int(image_id)
-
-      output_name = os.path.join(FLAGS.output_path, '{}.npy'.format(image_id))
-      if os.path.isfile(output_name):
-        tf.logging.info('%s is there.', output_name)
-        continue
-
-      if image_id % part_total == part_at_i:
-        count += 1
-        if count % 1 == 0:
-          tf.logging.info('On %i: %i', count, image_id)
-        fid = tar.extractfile(tarinfo)
-        file_bytes = np.fromstring(fid.read(), dtype=np.uint8)
-        bgr = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-
-        # Resize image if neccessary.
-        height, width = bgr.shape[0], bgr.shape[1]
-        if height / width >= 2.2:
-          width = int(height / 2.2)
-          bgr = cv2.resize(bgr, (width, height))
-        elif width / height >= 2.2:
-          height = int(width / 2.2)
-          bgr = cv2.resize(bgr, (width, height))
-        height, width = bgr.shape[0], bgr.shape[1]
-
-        ss.setBaseImage(bgr)
-        #ss.switchToSelectiveSearchFast()
-        ss.switchToSelectiveSearchQuality()
-        rects = ss.process()
-
-        rects = np.stack(
-            [rect for rect in rects if rect[2] >= 20 and rect[3] >= 20], axis=0)
-
-        x, y, w, h = [rects[:, i] for i in range(4)]
-        proposals = np.stack(
-            [y / height, x / width, (y + h) / height, (x + w) / width], axis=-1)
-
-        # Write output file.
-        with open(output_name, 'wb') as out_fid:
-          np.save(out_fid, proposals)
+  manifest_file = selective_search.get_manifest_file(
+      FLAGS.output_path, FLAGS.manifest_file, part_at_i, part_total)
+  writer = selective_search.create_proposal_writer(
+      lambda image_id: os.path.join(FLAGS.output_path,
+                                    '{}.npy'.format(image_id)),
+      manifest_file,
+      store_path=selective_search.get_proposal_store_path(
+          FLAGS.proposal_store, part_at_i, part_total),
+      store_dtype=FLAGS.proposal_store_dtype)
+  try:
+    selective_search.run_selective_search(
+        _iterate_images(FLAGS.image_tar_file, part_at_i, part_total),
+        writer,
+        num_workers=FLAGS.num_workers,
+        queue_size=FLAGS.queue_size,
+        num_threads=FLAGS.num_threads)
+  finally:
+    writer.close()
 
 
 if __name__ == '__main__':
@@ -50,10 +50,21 @@ from object_detection.dataset_tools import tf_record_creation_util
 from object_detection.utils import dataset_util
 from object_detection.utils import label_map_util
 
+from core import proposal_store
+
 flags = tf.app.flags
 
 flags.DEFINE_string('image_tar_file', '', '')
 flags.DEFINE_string('proposal_data', '', '')
+flags.DEFINE_string(
+    'proposal_store', '',
+    'Comma-separated paths to the consolidated proposal stores, if set, the '
+    'proposals are read from the stores instead of the .npy files.')
+flags.DEFINE_boolean(
+    'quantize_proposals', False,
+    'If true, store the proposals as one bytes feature of uint16 normalized '
+    'coordinates, set the `proposal_encoding` of the reader to '
+    'QUANTIZED_UINT16 to read them.')
 flags.DEFINE_string('annotation_path', '', '')
 flags.DEFINE_string('output_path', '', '')
 flags.DEFINE_integer('number_of_parts', 20, 'Number of output parts.')
@@ -76,16 +87,19 @@ def _process_caption(caption):
   return nltk.tokenize.word_tokenize(caption.lower())
 
 
+# The proposal loader and the proposal feature encoder, created in main().
+
+_proposal_loader = None
+_proposal_encoder = None
+
+
 def _create_tf_example(image_id, annotation, encoded_jpg):
   encoded_jpg_io = io.BytesIO(encoded_jpg)
   image = PIL.Image.open(encoded_jpg_io)
   height, width = image.height, image.width
   key = hashlib.sha256(encoded_jpg).hexdigest()
 
-  npy_path = os.path.join(FLAGS.proposal_data, '{}.npy'.format(image_id))
-
-  with open(npy_path, 'rb') as fid:
-    proposals = np.load(fid)
+  proposals = _proposal_loader.get(image_id)
 
   xmin = []
   ymin = []
@@ -107,56 +121,48 @@ def _create_tf_example(image_id, annotation, encoded_jpg):
     caption_string.extend(caption)
   caption_string = [caption.encode('utf8') for caption in caption_string]
 
-  example = tf.train.Example(
-      features=tf.train.Features(
-          feature={
-              'image/height':
-              dataset_util.int64_feature(height),
-              'image/width':
-              dataset_util.int64_feature(width),
-              'image/filename':
-              dataset_util.bytes_feature(str(image_id).encode('utf8')),
-              'image/source_id':
-              dataset_util.bytes_feature(str(image_id).encode('utf8')),
-              'image/key/sha256':
-              dataset_util.bytes_feature(key.encode('utf8')),
-              'image/encoded':
-              dataset_util.bytes_feature(encoded_jpg),
-              'image/format':
-              dataset_util.bytes_feature('jpeg'.encode('utf8')),
-              'image/object/bbox/xmin':
-              dataset_util.float_list_feature(xmin),
-              'image/object/bbox/xmax':
-              dataset_util.float_list_feature(xmax),
-              'image/object/bbox/ymin':
-              dataset_util.float_list_feature(ymin),
-              'image/object/bbox/ymax':
-              dataset_util.float_list_feature(ymax),
-              'image/object/class/text':
-              dataset_util.bytes_list_feature(classes_text),
-              'image/object/class/label':
-              dataset_util.int64_list_feature(classes),
-              'image/object/difficult':
-              dataset_util.int64_list_feature(difficult_obj),
-              'image/object/truncated':
-              dataset_util.int64_list_feature(truncated),
-              'image/object/view':
-              dataset_util.bytes_list_feature(poses),
-              'image/caption/string':
-              dataset_util.bytes_list_feature(caption_string),
-              'image/caption/offset':
-              dataset_util.int64_list_feature(caption_offset),
-              'image/caption/length':
-              dataset_util.int64_list_feature(caption_length),
-              'image/proposal/bbox/ymin':
-              dataset_util.float_list_feature(proposals[:, 0].tolist()),
-              'image/proposal/bbox/xmin':
-              dataset_util.float_list_feature(proposals[:, 1].tolist()),
-              'image/proposal/bbox/ymax':
-              dataset_util.float_list_feature(proposals[:, 2].tolist()),
-              'image/proposal/bbox/xmax':
-              dataset_util.float_list_feature(proposals[:, 3].tolist()),
-          }))
+  feature_dict = {
+      'image/height':
+      dataset_util.int64_feature(height),
+      'image/width':
+      dataset_util.int64_feature(width),
+      'image/filename':
+      dataset_util.bytes_feature(str(image_id).encode('utf8')),
+      'image/source_id':
+      dataset_util.bytes_feature(str(image_id).encode('utf8')),
+      'image/key/sha256':
+      dataset_util.bytes_feature(key.encode('utf8')),
+      'image/encoded':
+      dataset_util.bytes_feature(encoded_jpg),
+      'image/format':
+      dataset_util.bytes_feature('jpeg'.encode('utf8')),
+      'image/object/bbox/xmin':
+      dataset_util.float_list_feature(xmin),
+      'image/object/bbox/xmax':
+      dataset_util.float_list_feature(xmax),
+      'image/object/bbox/ymin':
+      dataset_util.float_list_feature(ymin),
+      'image/object/bbox/ymax':
+      dataset_util.float_list_feature(ymax),
+      'image/object/class/text':
+      dataset_util.bytes_list_feature(classes_text),
+      'image/object/class/label':
+      dataset_util.int64_list_feature(classes),
+      'image/object/difficult':
+      dataset_util.int64_list_feature(difficult_obj),
+      'image/object/truncated':
+      dataset_util.int64_list_feature(truncated),
+      'image/object/view':
+      dataset_util.bytes_list_feature(poses),
+      'image/caption/string':
+      dataset_util.bytes_list_feature(caption_string),
+      'image/caption/offset':
+      dataset_util.int64_list_feature(caption_offset),
+      'image/caption/length':
+      dataset_util.int64_list_feature(caption_length),
+  }
+  feature_dict.update(_proposal_encoder.encode(proposals))
+  example = tf.train.Example(features=tf.train.Features(feature=feature_dict))
   return example
 
 
@@ -172,6 +178,14 @@ def _load_annotations(filepath):
 
 
 def main(_):
+  global _proposal_loader, _proposal_encoder
+  _proposal_encoder = proposal_store.ProposalFeatureEncoder(
+      quantize=FLAGS.quantize_proposals)
+  _proposal_loader = proposal_store.ProposalLoader(
+      store_paths=[x for x in FLAGS.proposal_store.split(',') if x],
+      npy_path_fn=lambda image_id: os.path.join(
+          FLAGS.proposal_data, '{}.npy'.format(image_id)))
+
   annotations = _load_annotations(FLAGS.annotation_path)
 
   writers = []
@@ -200,6 +214,7 @@ def main(_):
 
   for writer in writers:
     writer.close()
+  _proposal_encoder.log_quantization_error()
 
 
 if __name__ == '__main__':
@@ -12,32 +12,32 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ==============================================================================
-r"""Convert raw PASCAL dataset to TFRecord for object_detection.
+r"""Extracts selective search proposals of the PASCAL dataset.
+
+Images are processed by a pool of worker processes, finished images are
+recorded in a manifest file so that a crashed run can be resumed.
 
 Example usage:
-    python object_detection/dataset_tools/create_pascal_tf_record.py \
+    python tools/create_pascal_selective_search_data.py \
         --data_dir=/home/user/VOCdevkit \
-        --year=VOC2012 \
-        --output_path=/home/user/pascal.record
+        --year=VOC2007 \
+        --set=trainval \
+        --output_data_path=raw_data/selective_search_data \
+        --num_workers=16
 """
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import hashlib
-import io
+import functools
 import os
 
-import cv2
-import numpy as np
 from lxml import etree
-import PIL.Image
 import tensorflow as tf
 
 from object_detection.utils import dataset_util
-from object_detection.utils import label_map_util
 
-from core import imgproc
+from core import selective_search
 
 flags = tf.app.flags
 flags.DEFINE_string('data_dir', '', 'Root directory to raw PASCAL VOC dataset.')
@@ -47,11 +47,27 @@ flags.DEFINE_string('annotations_dir', 'Annotations',
                     '(Relative) path to annotations directory.')
 flags.DEFINE_string('year', 'VOC2007', 'Desired challenge year.')
 flags.DEFINE_string('label_map_path', 'data/pascal_label_map.pbtxt',
-                    'Path to label map proto')
-flags.DEFINE_boolean('ignore_difficult_instances', False, 'Whether to ignore '
-                     'difficult instances')
+                    'Deprecated, unused by the proposal extraction.')
+flags.DEFINE_boolean('ignore_difficult_instances', False,
+                     'Deprecated, unused by the proposal extraction.')
 flags.DEFINE_string('output_data_path', 'raw_data/selective_search_data',
-                    'Path to label map proto')
+                    'Path to the output proposal data.')
+flags.DEFINE_string('manifest_file', '',
+                    'Path to the manifest recording the finished images, '
+                    'defaults to `output_data_path`/manifest.txt. With '
+                    '`parts`, each part writes its own suffixed manifest.')
+flags.DEFINE_integer('num_workers', 0,
+                     'Number of worker processes, 0 to use all cores.')
+flags.DEFINE_integer('num_threads', 1,
+                     'Number of OpenCV threads of each worker process.')
+flags.DEFINE_integer('queue_size', 0,
+                     'Maximum number of images in flight, 0 for the default.')
+flags.DEFINE_string(
+    'proposal_store', '',
+    'If set, write to this consolidated proposal store instead of .npy files. '
+    'With `parts`, each part writes its own suffixed store.')
+flags.DEFINE_string('proposal_store_dtype', 'float32',
+                    'Dtype of the proposal store, `float16` or `float32`.')
 tf.flags.DEFINE_string('parts', '', '')
 
 FLAGS = flags.FLAGS
@@ -61,101 +77,48 @@ tf.logging.set_verbosity(tf.logging.INFO)
 SETS = ['train', 'val', 'trainval', 'test']
 YEARS = ['VOC2007', 'VOC2012', 'merged']
 
-cv2.setUseOptimized(True)
-cv2.setNumThreads(4)
-ss = cv2.ximgproc.segmentation.createSelectiveSearchSegmentation()
-
 
-def selective_search(data,
-                     dataset_directory,
-                     label_map_dict,
-                     ignore_difficult_instances=False,
-                     image_subdirectory='JPEGImages'):
-  """Convert XML derived dict to tf.Example proto.
-
-  Notice that this function normalizes the bounding box coordinates provided
-  by the raw data.
+def _read_image(filename):
+  """Reads the encoded image.
 
   Args:
-    data: dict holding PASCAL XML fields for a single image (obtained by
-      running dataset_util.recursive_parse_xml_to_dict)
-    dataset_directory: Path to root directory holding PASCAL dataset
-    label_map_dict: A map from string label names to integers ids.
-    ignore_difficult_instances: Whether to skip difficult instances in the
-      dataset  (default: False).
-    image_subdirectory: String specifying subdirectory within the
-      PASCAL dataset directory holding the actual image data.
+    filename: path to the image file.
 
   Returns:
-    example: The converted tf.Example.
-
-  Raises:
-    ValueError: if the image pointed to by data['filename'] is not a valid JPEG
+    encoded_jpg: the encoded image bytes.
   """
-  img_path = os.path.join(data['folder'], image_subdirectory, data['filename'])
-  full_path = os.path.join(dataset_directory, img_path)
-  with tf.gfile.GFile(full_path, 'rb') as fid:
-    encoded_jpg = fid.read()
-
-  width = int(data['size']['width'])
-  height = int(data['size']['height'])
-
-  # Use SelectiveSearch to get the proposals.
-
-  file_bytes = np.fromstring(encoded_jpg, dtype=np.uint8)
-
-  bgr = cv2.imdecode(file_bytes, cv2.IMREAD_UNCHANGED)
-  height, width, _ = bgr.shape
-  assert bgr.shape[0] == height and bgr.shape[1] == width
-
-  if height / width >= 2.2:
-    width = int(height / 2.2)
-    bgr = cv2.resize(bgr, (width, height))
-  elif width / height >= 2.2:
-    height = int(width / 2.2)
-    bgr = cv2.resize(bgr, (width, height))
-
-  ss.setBaseImage(bgr)
-  #ss.switchToSelectiveSearchFast()
-  ss.switchToSelectiveSearchQuality()
-  rects = ss.process()
-
-  rects = np.stack([rect for rect in rects if rect[2] >= 20 and rect[3] >= 20],
-                   axis=0)
+  with tf.gfile.GFile(filename, 'rb') as fid:
+    return fid.read()
 
-  height, width = bgr.shape[0], bgr.shape[1]
-  x, y, w, h = [rects[:, i] for i in range(4)]
-  proposals = np.stack(
-      [y / height, x / width, (y + h) / height, (x + w) / width], axis=-1)
-  return proposals
 
+def _iterate_images(data_dir, years, part_at_i, part_total,
+                    image_subdirectory='JPEGImages'):
+  """Yields the PASCAL images to be processed.
 
-def main(_):
-  part_at_i, part_total = 0, 1
-  if FLAGS.parts:
-    part_at_i, part_total = [int(x) for x in FLAGS.parts.split('/')]
-
-  if FLAGS.set not in SETS:
-    raise ValueError('set must be in : {}'.format(SETS))
-  if FLAGS.year not in YEARS:
-    raise ValueError('year must be in : {}'.format(YEARS))
-
-  data_dir = FLAGS.data_dir
-  years = ['VOC2007', 'VOC2012']
-  if FLAGS.year != 'merged':
-    years = [FLAGS.year]
-
-  label_map_dict = label_map_util.get_label_map_dict(FLAGS.label_map_path)
+  Args:
+    data_dir: Path to root directory holding PASCAL dataset.
+    years: a list of PASCAL challenge years.
+    part_at_i: index of the part to be processed.
+    part_total: total number of parts.
+    image_subdirectory: String specifying subdirectory within the
+      PASCAL dataset directory holding the actual image data.
 
+  Yields:
+    image_id: the PASCAL image id.
+    read_fn: a callable returning the encoded image bytes.
+  """
   for year in years:
     tf.logging.info('Reading from PASCAL %s dataset.', year)
     examples_path = os.path.join(data_dir, year, 'ImageSets', 'Main',
                                  'aeroplane_' + FLAGS.set + '.txt')
     annotations_dir = os.path.join(data_dir, year, FLAGS.annotations_dir)
     examples_list = dataset_util.read_examples_list(examples_path)
-    count = 0
-    for idx, example in enumerate(examples_list):
-      count += 1
+    tf.logging.info("Total: %i", len(examples_list))
+
+    for example in examples_list:
+      image_id = example
+      if int(image_id) % part_total != part_at_i:
+        continue
 
       path = os.path.join(annotations_dir, example + '.xml')
 
@@ -167,45 +130,50 @@ def main(_):
           xml_str = fid.read()
         xml = etree.fromstring(xml_str)
         data = dataset_util.recursive_parse_xml_to_dict(xml)['annotation']
+        folder, filename = data['folder'], data['filename']
 
       else:
 
         # For test example.
 
-        filename = example + '.jpg'
-
-        data = {
-            'folder': 'VOC2012',
-            'filename': filename,
-            'source': {
-                'database': 'The VOC2008 Database',
-                'annotation': 'PASCAL VOC2008',
-                'image': 'flickr'
-            },
-            'size': {
-                'width': '99999',
-                'height': '99999',
-                'depth': '3'
-            },
-            'segmented': '0',
-            'object': []
-        }
+        folder, filename = 'VOC2012', example + '.jpg'
 
-      image_id = example
-      if int(image_id) % part_total == part_at_i:
-        filename = os.path.join(FLAGS.output_data_path,
-                                '{}.npy'.format(image_id))
-        if not os.path.isfile(filename):
-          rects = selective_search(data, FLAGS.data_dir, label_map_dict,
-                                   FLAGS.ignore_difficult_instances)
-          with open(filename, 'wb') as fid:
-            np.save(fid, rects)
-          tf.logging.info('On image %d of %d, %s', idx, len(examples_list),
-                          image_id)
-        else:
-          tf.logging.info('%s is there', filename)
-
-    tf.logging.info("Total: %i", count)
+      full_path = os.path.join(data_dir, folder, image_subdirectory, filename)
+      yield image_id, functools.partial(_read_image, full_path)
+
+
+def main(_):
+  part_at_i, part_total = 0, 1
+  if FLAGS.parts:
+    part_at_i, part_total = [int(x) for x in FLAGS.parts.split('/')]
+
+  if FLAGS.set not in SETS:
+    raise ValueError('set must be in : {}'.format(SETS))
+  if FLAGS.year not in YEARS:
+    raise ValueError('year must be in : {}'.format(YEARS))
+
+  years = ['VOC2007', 'VOC2012']
+  if FLAGS.year != 'merged':
+    years = [FLAGS.year]
+
+  manifest_file = selective_search.get_manifest_file(
+      FLAGS.output_data_path, FLAGS.manifest_file, part_at_i, part_total)
+  writer = selective_search.create_proposal_writer(
+      lambda image_id: os.path.join(FLAGS.output_data_path,
+                                    '{}.npy'.format(image_id)),
+      manifest_file,
+      store_path=selective_search.get_proposal_store_path(
+          FLAGS.proposal_store, part_at_i, part_total),
+      store_dtype=FLAGS.proposal_store_dtype)
+  try:
+    selective_search.run_selective_search(
+        _iterate_images(FLAGS.data_dir, years, part_at_i, part_total),
+        writer,
+        num_workers=FLAGS.num_workers,
+        queue_size=FLAGS.queue_size,
+        num_threads=FLAGS.num_threads)
+  finally:
+    writer.close()
 
 
 if __name__ == '__main__':
@@ -38,6 +38,7 @@ from object_detection.utils import dataset_util
 from object_detection.utils import label_map_util
 
 from core import imgproc
+from core import proposal_store
 
 flags = tf.app.flags
 flags.DEFINE_string('data_dir', '', 'Root directory to raw PASCAL VOC dataset.')
@@ -53,6 +54,15 @@ flags.DEFINE_boolean('ignore_difficult_instances', False, 'Whether to ignore '
                      'difficult instances')
 flags.DEFINE_string('selective_search_data', 'raw_data/selective_search_data',
                     'Path to label map proto')
+flags.DEFINE_string(
+    'proposal_store', '',
+    'Comma-separated paths to the consolidated proposal stores, if set, the '
+    'proposals are read from the stores instead of the .npy files.')
+flags.DEFINE_boolean(
+    'quantize_proposals', False,
+    'If true, store the proposals as one bytes feature of uint16 normalized '
+    'coordinates, set the `proposal_encoding` of the reader to '
+    'QUANTIZED_UINT16 to read them.')
 flags.DEFINE_integer('number_of_parts', 20, 'Number of output parts.')
 flags.DEFINE_boolean('normalize_oicr', False, 'Whether to normalize_oicr boxes')
 
@@ -68,6 +78,12 @@ cv2.setNumThreads(4)
 ss = cv2.ximgproc.segmentation.createSelectiveSearchSegmentation()
 
 
+# The proposal loader and the proposal feature encoder, created in main().
+
+_proposal_loader = None
+_proposal_encoder = None
+
+
 def dict_to_tf_example(data,
                        dataset_directory,
                        label_map_dict,
@@ -111,11 +127,7 @@ def dict_to_tf_example(data,
   # Read SelectiveSearch to get the proposals.
 
   image_id = data['filename'].split('.')[0]
-  filename = os.path.join(FLAGS.selective_search_data,
-                          '{}.npy'.format(image_id))
-  with open(filename, 'rb') as fid:
-    #proposals = np.load(fid)[:2000, :]
-    proposals = np.load(fid)
+  proposals = _proposal_loader.get(image_id)
 
   if FLAGS.normalize_oicr:
     ymin, xmin, ymax, xmax = [proposals[:, i] for i in range(4)]
@@ -154,60 +166,60 @@ def dict_to_tf_example(data,
       truncated.append(int(obj['truncated']))
       poses.append(obj['pose'].encode('utf8'))
 
-  example = tf.train.Example(
-      features=tf.train.Features(
-          feature={
-              'image/height':
-              dataset_util.int64_feature(height),
-              'image/width':
-              dataset_util.int64_feature(width),
-              'image/filename':
-              dataset_util.bytes_feature(data['filename'].encode('utf8')),
-              'image/source_id':
-              dataset_util.bytes_feature(data['filename'].encode('utf8')),
-              'image/key/sha256':
-              dataset_util.bytes_feature(key.encode('utf8')),
-              'image/encoded':
-              dataset_util.bytes_feature(encoded_jpg),
-              'image/format':
-              dataset_util.bytes_feature('jpeg'.encode('utf8')),
-              'image/object/bbox/xmin':
-              dataset_util.float_list_feature(xmin),
-              'image/object/bbox/xmax':
-              dataset_util.float_list_feature(xmax),
-              'image/object/bbox/ymin':
-              dataset_util.float_list_feature(ymin),
-              'image/object/bbox/ymax':
-              dataset_util.float_list_feature(ymax),
-              'image/object/class/text':
-              dataset_util.bytes_list_feature(classes_text),
-              'image/object/class/label':
-              dataset_util.int64_list_feature(classes),
-              'image/object/difficult':
-              dataset_util.int64_list_feature(difficult_obj),
-              'image/object/truncated':
-              dataset_util.int64_list_feature(truncated),
-              'image/object/view':
-              dataset_util.bytes_list_feature(poses),
-              'image/caption/string':
-              dataset_util.bytes_list_feature(classes_text),
-              'image/caption/offset':
-              dataset_util.int64_list_feature([0]),
-              'image/caption/length':
-              dataset_util.int64_list_feature([len(classes_text)]),
-              'image/proposal/bbox/ymin':
-              dataset_util.float_list_feature(proposals[:, 0].tolist()),
-              'image/proposal/bbox/xmin':
-              dataset_util.float_list_feature(proposals[:, 1].tolist()),
-              'image/proposal/bbox/ymax':
-              dataset_util.float_list_feature(proposals[:, 2].tolist()),
-              'image/proposal/bbox/xmax':
-              dataset_util.float_list_feature(proposals[:, 3].tolist()),
-          }))
+  feature_dict = {
+      'image/height':
+      dataset_util.int64_feature(height),
+      'image/width':
+      dataset_util.int64_feature(width),
+      'image/filename':
+      dataset_util.bytes_feature(data['filename'].encode('utf8')),
+      'image/source_id':
+      dataset_util.bytes_feature(data['filename'].encode('utf8')),
+      'image/key/sha256':
+      dataset_util.bytes_feature(key.encode('utf8')),
+      'image/encoded':
+      dataset_util.bytes_feature(encoded_jpg),
+      'image/format':
+      dataset_util.bytes_feature('jpeg'.encode('utf8')),
+      'image/object/bbox/xmin':
+      dataset_util.float_list_feature(xmin),
+      'image/object/bbox/xmax':
+      dataset_util.float_list_feature(xmax),
+      'image/object/bbox/ymin':
+      dataset_util.float_list_feature(ymin),
+      'image/object/bbox/ymax':
+      dataset_util.float_list_feature(ymax),
+      'image/object/class/text':
+      dataset_util.bytes_list_feature(classes_text),
+      'image/object/class/label':
+      dataset_util.int64_list_feature(classes),
+      'image/object/difficult':
+      dataset_util.int64_list_feature(difficult_obj),
+      'image/object/truncated':
+      dataset_util.int64_list_feature(truncated),
+      'image/object/view':
+      dataset_util.bytes_list_feature(poses),
+      'image/caption/string':
+      dataset_util.bytes_list_feature(classes_text),
+      'image/caption/offset':
+      dataset_util.int64_list_feature([0]),
+      'image/caption/length':
+      dataset_util.int64_list_feature([len(classes_text)]),
+  }
+  feature_dict.update(_proposal_encoder.encode(proposals))
+  example = tf.train.Example(features=tf.train.Features(feature=feature_dict))
   return example
 
 
 def main(_):
+  global _proposal_loader, _proposal_encoder
+  _proposal_encoder = proposal_store.ProposalFeatureEncoder(
+      quantize=FLAGS.quantize_proposals)
+  _proposal_loader = proposal_store.ProposalLoader(
+      store_paths=[x for x in FLAGS.proposal_store.split(',') if x],
+      npy_path_fn=lambda image_id: os.path.join(
+          FLAGS.selective_search_data, '{}.npy'.format(image_id)))
+
   if FLAGS.set not in SETS:
     raise ValueError('set must be in : {}'.format(SETS))
   if FLAGS.year not in YEARS:
@@ -274,6 +286,7 @@ def main(_):
 
   for writer in writers:
     writer.close()
+  _proposal_encoder.log_quantization_error()
 
 
 if __name__ == '__main__':
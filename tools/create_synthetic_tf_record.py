@@ -0,0 +1,77 @@
+r"""Creates small synthetic TFRecord files and the matching vocabulary file.
+
+The records follow the schema the reader parses: random JPEG images, object
+boxes and class texts, captions and region proposals. They are meant for the
+benchmarks and tests which cannot access the real COCO/VOC data.
+
+Example usage:
+    python tools/create_synthetic_tf_record.py --logtostderr \
+      --output_path="output/synthetic.record" \
+      --vocabulary_file="output/synthetic_vocab.txt" \
+      --num_examples=256 \
+      --num_files=4
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+
+from reader import synthetic_data
+
+flags = tf.app.flags
+
+flags.DEFINE_string('output_path', '', 'Prefix of the output TFRecord files.')
+flags.DEFINE_string('vocabulary_file', '',
+                    'If set, write the vocabulary file to the path.')
+flags.DEFINE_integer('num_examples', 256, 'Number of examples.')
+flags.DEFINE_integer('num_files', 4, 'Number of output files.')
+flags.DEFINE_integer('num_classes', 20,
+                     'Number of classes, at most 20 PASCAL classes are named, '
+                     'the others are named `class_{id}`.')
+flags.DEFINE_integer('min_image_size', 300, 'Minimum image height and width.')
+flags.DEFINE_integer('max_image_size', 500, 'Maximum image height and width.')
+flags.DEFINE_integer('num_proposals', 2000, 'Number of proposals per image.')
+flags.DEFINE_integer('max_num_objects', 4, 'Maximum objects per image.')
+flags.DEFINE_integer('num_captions', 1, 'Number of captions per image.')
+flags.DEFINE_integer('max_caption_length', 8, 'Maximum caption length.')
+flags.DEFINE_boolean('quantize_proposals', False,
+                     'If true, encode the proposals as quantized uint16.')
+flags.DEFINE_integer('seed', 0, 'Random seed.')
+
+FLAGS = flags.FLAGS
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+
+def main(_):
+  assert FLAGS.output_path, '`output_path` missing.'
+
+  vocabulary = synthetic_data.DEFAULT_VOCABULARY[:FLAGS.num_classes]
+  vocabulary += [
+      'class_{}'.format(i) for i in range(len(vocabulary), FLAGS.num_classes)
+  ]
+
+  if FLAGS.vocabulary_file:
+    synthetic_data.write_vocabulary(FLAGS.vocabulary_file, vocabulary)
+    tf.logging.info('Wrote vocabulary to %s.', FLAGS.vocabulary_file)
+
+  filenames = synthetic_data.write_synthetic_tf_records(
+      FLAGS.output_path,
+      FLAGS.num_examples,
+      num_files=FLAGS.num_files,
+      seed=FLAGS.seed,
+      vocabulary=vocabulary,
+      min_image_size=FLAGS.min_image_size,
+      max_image_size=FLAGS.max_image_size,
+      num_proposals=FLAGS.num_proposals,
+      max_num_objects=FLAGS.max_num_objects,
+      num_captions=FLAGS.num_captions,
+      max_caption_length=FLAGS.max_caption_length,
+      quantize_proposals=FLAGS.quantize_proposals)
+  tf.logging.info('Wrote %i examples to %s.', FLAGS.num_examples,
+                  ', '.join(filenames))
+
+
+if __name__ == '__main__':
+  tf.app.run()
@@ -163,6 +163,13 @@ def _run_evaluation(pipeline_proto,
           x.decode('utf8') for x in examples[DetectionResultFields.class_labels]
       ]
 
+      # The models may only post-process some of the OICR stages.
+
+      post_process_stages = range(1 + oicr_iterations)
+      if DetectionResultFields.post_process_stages in examples:
+        post_process_stages = examples[
+            DetectionResultFields.post_process_stages].tolist()
+
     for i in range(batch_size):
       (image_id, image_height, image_width, num_groundtruths, groundtruth_boxes,
        groundtruth_classes) = (examples[InputDataFields.image_id][i],
@@ -174,7 +181,7 @@ def _run_evaluation(pipeline_proto,
 
       # Evaluate each OICR iterations.
 
-      for oicr_iter in range(1 + oicr_iterations):
+      for oicr_iter in post_process_stages:
         num_detections, detection_boxes, detection_scores, detection_classes = (
             examples[DetectionResultFields.num_detections +
                      '_at_{}'.format(oicr_iter)][i],
@@ -0,0 +1,74 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+import time
+import contextlib
+import tensorflow as tf
+
+
+class GraphConstructionReport(object):
+  """Records the cost of each stage of the graph construction."""
+
+  def __init__(self, enabled=False):
+    """Initializes the report.
+
+    Args:
+      enabled: if false, the `stage` context does nothing.
+    """
+    self._enabled = enabled
+    self._stages = []
+
+  @contextlib.contextmanager
+  def stage(self, name):
+    """Measures the time, op count and GraphDef size of a stage.
+
+    Args:
+      name: name of the stage.
+    """
+    if not self._enabled:
+      yield
+      return
+
+    graph = tf.get_default_graph()
+    num_ops = len(graph.get_operations())
+    graph_def_size = graph.as_graph_def().ByteSize()
+    start_time = time.time()
+
+    yield
+
+    elapsed = time.time() - start_time
+    total_num_ops = len(graph.get_operations())
+    total_graph_def_size = graph.as_graph_def().ByteSize()
+    self._stages.append({
+        'stage': name,
+        'seconds': elapsed,
+        'num_ops': total_num_ops - num_ops,
+        'graph_def_bytes': total_graph_def_size - graph_def_size,
+        'total_num_ops': total_num_ops,
+        'total_graph_def_bytes': total_graph_def_size,
+    })
+    tf.logging.info('Graph construction stage %s: %.2lfs, %i ops, %i bytes.',
+                    name, elapsed, total_num_ops - num_ops,
+                    total_graph_def_size - graph_def_size)
+
+  def write(self, filename, **kwargs):
+    """Writes the report to a JSON file.
+
+    Args:
+      filename: path to the output JSON file.
+      **kwargs: additional key-value pairs to be saved in the report.
+    """
+    if not self._enabled:
+      return
+
+    report = dict(kwargs)
+    report['stages'] = self._stages
+    report['total_seconds'] = sum(x['seconds'] for x in self._stages)
+
+    tf.gfile.MakeDirs(os.path.dirname(filename))
+    with tf.gfile.GFile(filename, 'w') as fid:
+      fid.write(json.dumps(report, indent=2))
+    tf.logging.info('Graph construction report is written to %s.', filename)
@@ -0,0 +1,67 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import json
+import time
+import tensorflow as tf
+
+from train.graph_construction_report import GraphConstructionReport
+
+
+class GraphConstructionReportTest(tf.test.TestCase):
+
+  def test_write(self):
+    filename = os.path.join(self.get_temp_dir(), 'report', 'graph.json')
+
+    g = tf.Graph()
+    with g.as_default():
+      report = GraphConstructionReport(enabled=True)
+
+      with report.stage('inputs'):
+        x = tf.placeholder(tf.float32, [None, 4])
+      with report.stage('layers'):
+        tf.add(tf.multiply(x, 2.0), 1.0)
+        time.sleep(0.05)
+      with report.stage('empty'):
+        pass
+      report.write(filename, mode='train')
+
+    with open(filename, 'r') as fid:
+      values = json.load(fid)
+
+    self.assertEqual(values['mode'], 'train')
+    self.assertEqual([x['stage'] for x in values['stages']],
+                     ['inputs', 'layers', 'empty'])
+
+    # The `layers` stage adds the multiply and add ops, and two constants.
+
+    inputs, layers, empty = values['stages']
+    self.assertEqual(inputs['num_ops'], 1)
+    self.assertEqual(layers['num_ops'], 4)
+    self.assertEqual(empty['num_ops'], 0)
+    self.assertEqual(layers['total_num_ops'], 5)
+    self.assertEqual(layers['total_num_ops'], len(g.get_operations()))
+    self.assertGreater(layers['graph_def_bytes'], 0)
+    self.assertEqual(empty['graph_def_bytes'], 0)
+
+    self.assertGreaterEqual(layers['seconds'], 0.05)
+    self.assertLess(inputs['seconds'], layers['seconds'])
+    self.assertAlmostEqual(values['total_seconds'],
+                           sum(x['seconds'] for x in values['stages']))
+
+  def test_disabled(self):
+    filename = os.path.join(self.get_temp_dir(), 'disabled', 'graph.json')
+
+    g = tf.Graph()
+    with g.as_default():
+      report = GraphConstructionReport(enabled=False)
+      with report.stage('inputs'):
+        tf.placeholder(tf.float32, [None, 4])
+      report.write(filename)
+    self.assertFalse(os.path.exists(filename))
+
+
+if __name__ == '__main__':
+  tf.test.main()
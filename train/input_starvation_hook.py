@@ -0,0 +1,117 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+import tensorflow as tf
+
+from reader import reader
+
+
+def _get_latency_sum(summary, tag):
+  """Gets the total latency in seconds from the tf.data stats summary.
+
+  Args:
+    summary: a tf.Summary proto.
+    tag: tag of the latency stats.
+
+  Returns:
+    total latency in seconds, or None if the tag is not found.
+  """
+  for value in summary.value:
+    if value.tag.endswith(tag):
+      return value.histo.sum / 1e6  # The latency stats are in microseconds.
+  return None
+
+
+class InputStarvationHook(tf.train.SessionRunHook):
+  """Warns when the training loop waits on the input for too long.
+
+  The time the training loop waits on the input is the latency of getting the
+  elements out of the prefetch buffer, which is recorded by the reader if
+  `Reader.enable_stats` is set.
+  """
+
+  def __init__(self, output_dir, every_n_steps=100,
+               max_input_wait_fraction=0.2):
+    """Initializes the hook.
+
+    Args:
+      output_dir: `string`, the directory to save the summaries to.
+      every_n_steps: check the input wait time every this many steps.
+      max_input_wait_fraction: warn if the input wait time exceeds this
+        fraction of the wall time.
+    """
+    self._output_dir = output_dir
+    self._max_input_wait_fraction = max_input_wait_fraction
+    self._timer = tf.train.SecondOrStepTimer(every_steps=every_n_steps)
+    self._tag = '{}/prefetch_latency'.format(reader.STATS_PREFIX)
+    self._global_step_tensor = None
+    self._summary_tensor = None
+    self._next_step = None
+    self._request_summary = False
+    self._last_check = None
+
+  def begin(self):
+    self._global_step_tensor = tf.train.get_or_create_global_step()
+    if self._global_step_tensor is None:
+      raise RuntimeError(
+          "Global step should be created to use InputStarvationHook.")
+    summaries = tf.get_collection(reader.STATS_SUMMARY_COLLECTION)
+    if not summaries:
+      raise RuntimeError(
+          "Reader.enable_stats should be set to use InputStarvationHook.")
+    self._summary_tensor = summaries[0]
+    self._next_step = None
+    self._last_check = None
+
+  def before_run(self, run_context):
+    self._request_summary = (
+        self._next_step is None or
+        self._timer.should_trigger_for_step(self._next_step))
+    requests = {"global_step": self._global_step_tensor}
+    if self._request_summary:
+      requests["summary"] = self._summary_tensor
+    return tf.train.SessionRunArgs(requests)
+
+  def after_run(self, run_context, run_values):
+    global_step = run_values.results["global_step"] + 1
+    if self._request_summary:
+      self._timer.update_last_triggered_step(global_step)
+      summary = tf.Summary.FromString(run_values.results["summary"])
+      wait_time = _get_latency_sum(summary, self._tag)
+      if wait_time is not None:
+        self._check(global_step, time.time(), wait_time)
+    self._next_step = global_step + 1
+
+  def _check(self, global_step, wall_time, wait_time):
+    """Compares the input wait time to the wall time since the last check.
+
+    Args:
+      global_step: the current global step.
+      wall_time: the current time in seconds.
+      wait_time: the total input wait time in seconds.
+    """
+    last_check, self._last_check = self._last_check, (wall_time, wait_time)
+    if last_check is None:
+      return
+
+    elapsed = wall_time - last_check[0]
+    if elapsed <= 0:
+      return
+    fraction = (wait_time - last_check[1]) / elapsed
+
+    summary = tf.Summary()
+    summary.value.add(tag='input/wait_fraction', simple_value=fraction)
+    summary_writer = tf.summary.FileWriterCache.get(self._output_dir)
+    summary_writer.add_summary(summary, global_step)
+
+    if fraction > self._max_input_wait_fraction:
+      tf.logging.warn(
+          'The training loop waited on the input for %.1lf%% of the time '
+          'before step %i, consider increasing `map_num_parallel_calls` or '
+          '`prefetch_buffer_size`.', fraction * 100, global_step)
+
+  def end(self, session=None):
+    summary_writer = tf.summary.FileWriterCache.get(self._output_dir)
+    summary_writer.flush()
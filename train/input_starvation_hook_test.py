@@ -0,0 +1,91 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import time
+import numpy as np
+import tensorflow as tf
+
+from reader import reader
+from train import input_starvation_hook
+
+
+class InputStarvationHookTest(tf.test.TestCase):
+
+  def test_check(self):
+    output_dir = os.path.join(self.get_temp_dir(), 'check')
+    hook = input_starvation_hook.InputStarvationHook(
+        output_dir, max_input_wait_fraction=0.2)
+
+    with tf.test.mock.patch.object(tf.logging, 'warn') as mock_warn:
+
+      # The first check only records the times.
+
+      hook._check(global_step=1, wall_time=10.0, wait_time=0.0)
+      hook._check(global_step=2, wall_time=20.0, wait_time=1.0)
+      self.assertFalse(mock_warn.called)
+
+      # 3 seconds out of 10 seconds are spent on waiting.
+
+      hook._check(global_step=3, wall_time=30.0, wait_time=4.0)
+      self.assertTrue(mock_warn.called)
+    hook.end()
+
+  def test_input_starvation(self):
+    output_dir = os.path.join(self.get_temp_dir(), 'starvation')
+
+    def _slow_input(x):
+      time.sleep(0.02)
+      return x
+
+    g = tf.Graph()
+    with g.as_default():
+
+      # The input takes 20ms per element while the step is almost free.
+
+      dataset = tf.data.Dataset.from_tensors(np.float32(1.0)).repeat()
+      dataset = dataset.map(
+          lambda x: tf.py_func(_slow_input, [x], tf.float32, stateful=True))
+      dataset = dataset.prefetch(1)
+      dataset = dataset.apply(
+          tf.contrib.data.latency_stats('{}/prefetch_latency'.format(
+              reader.STATS_PREFIX)))
+      aggregator = tf.contrib.data.StatsAggregator()
+      dataset = dataset.apply(tf.contrib.data.set_stats_aggregator(aggregator))
+      tf.add_to_collection(reader.STATS_SUMMARY_COLLECTION,
+                           aggregator.get_summary())
+
+      value = dataset.make_one_shot_iterator().get_next()
+      train_op = tf.group(value,
+                          tf.assign_add(tf.train.get_or_create_global_step(),
+                                        1))
+
+      hook = input_starvation_hook.InputStarvationHook(
+          output_dir, every_n_steps=2, max_input_wait_fraction=0.2)
+      with tf.test.mock.patch.object(tf.logging, 'warn') as mock_warn:
+        with tf.train.MonitoredSession(hooks=[hook]) as sess:
+          for _ in range(10):
+            sess.run(train_op)
+        self.assertTrue(mock_warn.called)
+
+    fractions = []
+    for filename in tf.gfile.Glob(os.path.join(output_dir, 'events.*')):
+      for event in tf.train.summary_iterator(filename):
+        for value in event.summary.value:
+          if value.tag == 'input/wait_fraction':
+            fractions.append(value.simple_value)
+    self.assertTrue(fractions)
+    self.assertGreater(max(fractions), 0.2)
+
+  def test_requires_reader_stats(self):
+    g = tf.Graph()
+    with g.as_default():
+      tf.train.get_or_create_global_step()
+      hook = input_starvation_hook.InputStarvationHook(self.get_temp_dir())
+      with self.assertRaises(RuntimeError):
+        hook.begin()
+
+
+if __name__ == '__main__':
+  tf.test.main()
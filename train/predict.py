@@ -8,6 +8,7 @@ import json
 import cv2
 import numpy as np
 import collections
+from multiprocessing.pool import ThreadPool
 import tensorflow as tf
 from google.protobuf import text_format
 
@@ -82,6 +83,9 @@ flags.DEFINE_string('visl_file_path', '', '')
 
 flags.DEFINE_float('min_visl_detection_score', 0.01, '')
 
+flags.DEFINE_integer('visl_num_threads', 4,
+                     'Number of threads to render the visualization.')
+
 flags.DEFINE_boolean('run_once', False, '')
 flags.DEFINE_boolean('eval_coco_on_voc', False, '')
 
@@ -89,6 +93,11 @@ flags.DEFINE_string('shard_indicator', '', '')
 
 flags.DEFINE_string('input_pattern', '', '')
 
+flags.DEFINE_string(
+    'eval_cache_dir', '',
+    'If set, cache the parsed and resized eval examples under the directory, '
+    'so that the evaluation of the later checkpoints skips the decoding.')
+
 FLAGS = flags.FLAGS
 
 try:
@@ -112,125 +121,202 @@ def _load_pipeline_proto(filename):
   return pipeline_proto
 
 
-def _visualize(examples, categories, filename):
-  """Visualizes exmaples.
+def _render_example(example, categories, image_dir, example_index):
+  """Renders an example and saves the images as JPEG files.
 
   Args:
-    examples: A list of python dict saving examples to be visualized.
-    filename: Path to the output file.
+    example: A python dict saving the example to be visualized.
+    categories: A list of category names.
+    image_dir: Path to the directory saving the JPEG files.
+    example_index: Index of the example, used to name the JPEG files.
+
+  Returns:
+    A html table row.
+  """
+  (image_id, image, image_height, image_width, num_gt_boxes, gt_boxes,
+   gt_labels, num_dt_boxes, dt_boxes, dt_scores,
+   dt_labels) = (example[InputDataFields.image_id],
+                 example[InputDataFields.image],
+                 example[InputDataFields.image_height],
+                 example[InputDataFields.image_width],
+                 example[InputDataFields.num_objects],
+                 example[InputDataFields.object_boxes],
+                 example[InputDataFields.object_texts],
+                 example[DetectionResultFields.num_detections],
+                 example[DetectionResultFields.detection_boxes],
+                 example[DetectionResultFields.detection_scores],
+                 example[DetectionResultFields.detection_classes])
+
+  # Print captions.
+
+  caption_annot = ''
+  if (InputDataFields.num_captions in example and
+      InputDataFields.caption_strings in example and
+      InputDataFields.caption_lengths in example):
+    (num_captions, caption_strings,
+     caption_lengths) = (example[InputDataFields.num_captions],
+                         example[InputDataFields.caption_strings],
+                         example[InputDataFields.caption_lengths])
+    captions = []
+    for caption_string, caption_length in zip(
+        caption_strings[:num_captions], caption_lengths[:num_captions]):
+      captions.append(' '.join(
+          [x.decode('utf8') for x in caption_string[:caption_length]]))
+    caption_annot = '</br>'.join(captions)
+
+  # Generated image-level ground-truth.
+
+  labels_gt_annot = ''
+  labels_ps_annot = ''
+  if 'debug_groundtruth_labels' in example and 'debug_pseudo_labels' in example:
+    labels_gt = [
+        categories[i]
+        for i, v in enumerate(example['debug_groundtruth_labels'])
+        if v > 0
+    ]
+    labels_ps = [
+        categories[i]
+        for i, v in enumerate(example['debug_pseudo_labels'])
+        if v > 0
+    ]
+    labels_gt_annot = ','.join(labels_gt)
+    labels_ps_annot = ','.join(labels_ps)
+    if labels_ps_annot:
+      labels_ps_annot = 'pseudo:' + labels_ps_annot
+
+  # Image canvas.
+
+  image = cv2.resize(image, (image_width, image_height))
+
+  # Image with ground-truth boxes.
+
+  image_with_gt = plotlib._py_draw_rectangles_v2(
+      image,
+      num_gt_boxes,
+      gt_boxes,
+      np.zeros_like(gt_labels, dtype=np.float32),
+      gt_labels,
+      color=plotlib.BLUE,
+      show_score=False)
+  gt_filename = '{}_gt.jpg'.format(example_index)
+  cv2.imwrite(
+      os.path.join(image_dir, gt_filename),
+      cv2.cvtColor(image_with_gt, cv2.COLOR_RGB2BGR))
+
+  # Image with predicted boxes.
+
+  for i, dt_score in enumerate(dt_scores):
+    if dt_score < FLAGS.min_visl_detection_score:
+      break
+
+  num_dt_boxes = min(i, num_dt_boxes)
+  dt_labels = np.array(
+      [categories[int(x) - 1].encode('utf8') for x in dt_labels])
+
+  recall_mask, precision_mask = box_utils.py_evaluate_precision_and_recall(
+      num_gt_boxes, gt_boxes, gt_labels, num_dt_boxes, dt_boxes, dt_labels)
+  image_with_dt = plotlib._py_draw_rectangles_v2(
+      image,
+      num_dt_boxes,
+      dt_boxes,
+      dt_scores,
+      dt_labels,
+      color=plotlib.RED,
+      show_score=True)
+  image_with_dt = plotlib._py_draw_rectangles_v2(
+      image_with_dt,
+      precision_mask.astype(np.int32).sum(),
+      dt_boxes[precision_mask],
+      dt_scores[precision_mask],
+      dt_labels[precision_mask],
+      color=plotlib.GREEN,
+      show_score=True)
+  dt_filename = '{}_dt.jpg'.format(example_index)
+  cv2.imwrite(
+      os.path.join(image_dir, dt_filename),
+      cv2.cvtColor(image_with_dt, cv2.COLOR_RGB2BGR))
+
+  # Html table row, the images are referred by the relative paths.
+
+  dirname = os.path.basename(image_dir)
+  return ('<tr><td><img src="%s/%s"></br>%s</br>%s</br>%s</td>'
+          '<td><img src="%s/%s"></td></tr>\n' %
+          (dirname, gt_filename, caption_annot, labels_gt_annot,
+           labels_ps_annot, dirname, dt_filename))
+
+
+class _HtmlVisualizer(object):
+  """Streams the visualization of the examples to a html file.
+
+  The examples are rendered in a thread pool as soon as they are added, and
+  the images are saved as JPEG files in the `{filename}_images` directory
+  next to the html file. The rows are written in the order the examples are
+  added, and at most `2 * num_threads` examples are kept in memory.
   """
-  with open(filename, 'w') as fid:
-    fid.write('<table border=1>')
-    for example_index, example in enumerate(examples):
-      (image_id, image, image_height, image_width, num_gt_boxes, gt_boxes,
-       gt_labels, num_dt_boxes, dt_boxes, dt_scores,
-       dt_labels) = (example[InputDataFields.image_id],
-                     example[InputDataFields.image],
-                     example[InputDataFields.image_height],
-                     example[InputDataFields.image_width],
-                     example[InputDataFields.num_objects],
-                     example[InputDataFields.object_boxes],
-                     example[InputDataFields.object_texts],
-                     example[DetectionResultFields.num_detections],
-                     example[DetectionResultFields.detection_boxes],
-                     example[DetectionResultFields.detection_scores],
-                     example[DetectionResultFields.detection_classes])
-
-      # Print captions.
-
-      caption_annot = ''
-      if (InputDataFields.num_captions in example and
-          InputDataFields.caption_strings in example and
-          InputDataFields.caption_lengths in example):
-        (num_captions, caption_strings,
-         caption_lengths) = (example[InputDataFields.num_captions],
-                             example[InputDataFields.caption_strings],
-                             example[InputDataFields.caption_lengths])
-        captions = []
-        for caption_string, caption_length in zip(
-            caption_strings[:num_captions], caption_lengths[:num_captions]):
-          captions.append(' '.join(
-              [x.decode('utf8') for x in caption_string[:caption_length]]))
-        caption_annot = '</br>'.join(captions)
-
-      # Generated image-level ground-truth.
-
-      labels_gt_annot = ''
-      labels_ps_annot = ''
-      if 'debug_groundtruth_labels' in example and 'debug_pseudo_labels' in example:
-        labels_gt = [
-            categories[i]
-            for i, v in enumerate(example['debug_groundtruth_labels'])
-            if v > 0
-        ]
-        labels_ps = [
-            categories[i]
-            for i, v in enumerate(example['debug_pseudo_labels'])
-            if v > 0
-        ]
-        labels_gt_annot = ','.join(labels_gt)
-        labels_ps_annot = ','.join(labels_ps)
-        if labels_ps_annot:
-          labels_ps_annot = 'pseudo:' + labels_ps_annot
-
-      # Image canvas.
-
-      image = cv2.resize(image, (image_width, image_height))
-
-      # Image with ground-truth boxes.
-
-      image_with_gt = plotlib._py_draw_rectangles_v2(
-          image,
-          num_gt_boxes,
-          gt_boxes,
-          np.zeros_like(gt_labels, dtype=np.float32),
-          gt_labels,
-          color=plotlib.BLUE,
-          show_score=False)
-      image_with_gt = cv2.cvtColor(image_with_gt, cv2.COLOR_RGB2BGR)
-      gt_base64 = plotlib._py_convert_to_base64(image_with_gt)
-
-      # Image with predicted boxes.
-
-      for i, dt_score in enumerate(dt_scores):
-        if dt_score < FLAGS.min_visl_detection_score:
-          break
-
-      num_dt_boxes = min(i, num_dt_boxes)
-      dt_labels = np.array(
-          [categories[int(x) - 1].encode('utf8') for x in dt_labels])
-
-      recall_mask, precision_mask = box_utils.py_evaluate_precision_and_recall(
-          num_gt_boxes, gt_boxes, gt_labels, num_dt_boxes, dt_boxes, dt_labels)
-      image_with_dt = plotlib._py_draw_rectangles_v2(
-          image,
-          num_dt_boxes,
-          dt_boxes,
-          dt_scores,
-          dt_labels,
-          color=plotlib.RED,
-          show_score=True)
-      image_with_dt = plotlib._py_draw_rectangles_v2(
-          image_with_dt,
-          precision_mask.astype(np.int32).sum(),
-          dt_boxes[precision_mask],
-          dt_scores[precision_mask],
-          dt_labels[precision_mask],
-          color=plotlib.GREEN,
-          show_score=True)
-      image_with_dt = cv2.cvtColor(image_with_dt, cv2.COLOR_RGB2BGR)
-      dt_base64 = plotlib._py_convert_to_base64(image_with_dt)
-
-      # Write html file.
-
-      fid.write('<tr>')
-      fid.write(
-          '<td><img src="data:image/jpg;base64,%s"></br>%s</br>%s</br>%s</td>' %
-          (gt_base64, caption_annot, labels_gt_annot, labels_ps_annot))
-      fid.write('<td><img src="data:image/jpg;base64,%s"></td>' % (dt_base64))
-      fid.write('</tr>')
-    fid.write('</table>')
-  tf.logging.info('File is written to %s, #images=%i', filename, example_index)
+
+  def __init__(self, filename, categories, max_examples, num_threads=4):
+    """Initializes the visualizer.
+
+    Args:
+      filename: Path to the output html file.
+      categories: A list of category names.
+      max_examples: Maximum number of examples to visualize.
+      num_threads: Number of threads to render the examples.
+    """
+    self._filename = filename
+    self._categories = categories
+    self._max_examples = max_examples
+    self._max_pending = 2 * num_threads
+
+    self._image_dir = os.path.splitext(filename)[0] + '_images'
+    tf.gfile.MakeDirs(self._image_dir)
+
+    self._pool = ThreadPool(num_threads)
+    self._pending = collections.deque()
+    self._num_examples = 0
+
+    self._fid = open(filename, 'w')
+    self._fid.write('<table border=1>\n')
+
+  @property
+  def is_full(self):
+    return self._num_examples >= self._max_examples
+
+  def add(self, example):
+    """Adds an example to be visualized.
+
+    Args:
+      example: A python dict saving the example to be visualized.
+    """
+    if self.is_full:
+      return
+    self._pending.append(
+        self._pool.apply_async(
+            _render_example, (example, self._categories, self._image_dir,
+                              self._num_examples)))
+    self._num_examples += 1
+    self._write_rows(self._max_pending)
+
+  def _write_rows(self, max_pending):
+    """Writes the rendered rows until at most `max_pending` are pending.
+
+    Args:
+      max_pending: Maximum number of pending examples after the call.
+    """
+    while self._pending and (len(self._pending) > max_pending or
+                             self._pending[0].ready()):
+      self._fid.write(self._pending.popleft().get())
+    self._fid.flush()
+
+  def close(self):
+    """Writes the remaining rows and closes the html file."""
+    self._write_rows(0)
+    self._pool.close()
+    self._pool.join()
+    self._fid.write('</table>')
+    self._fid.close()
+    tf.logging.info('File is written to %s, #images=%i', self._filename,
+                    self._num_examples)
 
 
 def _analyze_latent_variables(proba_h_given_c, categories):
@@ -310,12 +396,22 @@ def _run_evaluation(pipeline_proto,
     category_to_id: A python dict maps from the category name to integer id.
   """
   eval_count = 0
-  visl_examples = []
+  visualizer = None
+
+  num_timed_examples, predict_time = 0, 0.0
+  start_time = time.time()
 
   for examples in trainer.predict(pipeline_proto, checkpoint_path):
     batch_size = len(examples[InputDataFields.image_id])
     summary_bytes = examples['summary']
 
+    # The first batch also takes the graph construction and the checkpoint
+    # restoring, so it is excluded from the latency.
+
+    if eval_count > 0:
+      predict_time += time.time() - start_time
+      num_timed_examples += batch_size
+
     if eval_count == 0:
       summary = tf.Summary().FromString(summary_bytes)
       if NODPredictions.midn_proba_h_given_c in examples:
@@ -328,6 +424,20 @@ def _run_evaluation(pipeline_proto,
           x.decode('utf8') for x in examples[DetectionResultFields.class_labels]
       ]
 
+      if FLAGS.visl_file_path:
+        visualizer = _HtmlVisualizer(
+            FLAGS.visl_file_path,
+            class_labels,
+            max_examples=FLAGS.max_visl_examples,
+            num_threads=FLAGS.visl_num_threads)
+
+      # The models may only post-process some of the OICR stages.
+
+      post_process_stages = range(len(evaluators))
+      if DetectionResultFields.post_process_stages in examples:
+        post_process_stages = examples[
+            DetectionResultFields.post_process_stages].tolist()
+
     for i in range(batch_size):
       (image_id, image_height, image_width, num_groundtruths, groundtruth_boxes,
        groundtruth_classes) = (examples[InputDataFields.image_id][i],
@@ -339,7 +449,8 @@ def _run_evaluation(pipeline_proto,
 
       # Evaluate each OICR iterations.
 
-      for oicr_iter, evaluator in enumerate(evaluators):
+      for oicr_iter in post_process_stages:
+        evaluator = evaluators[oicr_iter]
         num_detections, detection_boxes, detection_scores, detection_classes = (
             examples[DetectionResultFields.num_detections +
                      '_at_{}'.format(oicr_iter)][i],
@@ -393,9 +504,9 @@ def _run_evaluation(pipeline_proto,
       if eval_count % 50 == 0:
         tf.logging.info('On image %i.', eval_count)
 
-      # Add to visualization list.
+      # Render the visualization.
 
-      if len(visl_examples) < FLAGS.max_visl_examples:
+      if visualizer is not None and not visualizer.is_full:
         visl_example = {
             InputDataFields.image_id: examples[InputDataFields.image_id][i],
             InputDataFields.image: examples[InputDataFields.image][i],
@@ -429,7 +540,7 @@ def _run_evaluation(pipeline_proto,
         if 'debug_pseudo_labels' in examples:
           visl_example['debug_pseudo_labels'] = examples['debug_pseudo_labels'][
               i]
-        visl_examples.append(visl_example)
+        visualizer.add(visl_example)
 
       # Write to detection result file.
 
@@ -458,13 +569,15 @@ def _run_evaluation(pipeline_proto,
 
     if eval_count > FLAGS.max_eval_examples:
       break
+    start_time = time.time()
 
-  # Visualize the results.
+  # Finish the visualization.
 
-  if FLAGS.visl_file_path:
-    _visualize(visl_examples, class_labels, FLAGS.visl_file_path)
+  if visualizer is not None:
+    visualizer.close()
 
-  for oicr_iter, evaluator in enumerate(evaluators):
+  for oicr_iter in post_process_stages:
+    evaluator = evaluators[oicr_iter]
     metrics = evaluator.evaluate()
     evaluator.clear()
     for k, v in metrics.items():
@@ -517,6 +630,11 @@ def _run_evaluation(pipeline_proto,
       #    fid.write(line2.replace(',', '&') + '\n')
       #    fid.write('\n')
 
+  if num_timed_examples > 0:
+    latency = predict_time * 1000 / num_timed_examples
+    summary.value.add(tag='latency/predict_ms_per_image', simple_value=latency)
+    tf.logging.info('Prediction latency: %.2lf ms per image.', latency)
+
   if 'PascalBoxes_Precision/mAP@0.5IOU' in metrics:
     return summary, metrics['PascalBoxes_Precision/mAP@0.5IOU']
   return summary, metrics['DetectionBoxes_Precision/mAP']
@@ -539,6 +657,14 @@ def main(_):
     pipeline_proto.eval_reader.input_pattern.append(FLAGS.input_pattern)
     tf.logging.info("Override input_pattern: %s", FLAGS.input_pattern)
 
+  # The cache is only written after a full pass, so limit the eval set instead
+  # of stopping early.
+
+  if FLAGS.eval_cache_dir:
+    pipeline_proto.eval_reader.cache_dir = FLAGS.eval_cache_dir
+    pipeline_proto.eval_reader.max_num_examples = FLAGS.max_eval_examples
+    tf.logging.info("Override cache_dir: %s", FLAGS.eval_cache_dir)
+
   tf.logging.info("Pipeline configure: %s", '=' * 128)
   tf.logging.info(pipeline_proto)
 
@@ -0,0 +1,167 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import time
+import tensorflow as tf
+
+from tensorflow.python.client import timeline
+
+PHASES = ['input_wait', 'forward', 'backward', 'optimizer']
+
+_INPUT_OP_TYPES = ['IteratorGetNext', 'IteratorGetNextSync']
+_OPTIMIZER_OP_TYPE_PREFIXES = [
+    'Apply', 'ResourceApply', 'SparseApply', 'ResourceSparseApply'
+]
+
+
+def _get_phase(op):
+  """Classifies the op into one of the PHASES.
+
+  Args:
+    op: a tf.Operation instance.
+
+  Returns:
+    phase: a string in PHASES.
+  """
+  if op.type in _INPUT_OP_TYPES:
+    return 'input_wait'
+  if any(op.type.startswith(x) for x in _OPTIMIZER_OP_TYPE_PREFIXES):
+    return 'optimizer'
+  if op.name.startswith('gradients/') or '/gradients/' in op.name:
+    return 'backward'
+  return 'forward'
+
+
+def _union_length(intervals):
+  """Computes the total length covered by the intervals.
+
+  Ops of the same phase run in parallel on several devices and streams, so
+  their execution intervals are merged instead of summed.
+
+  Args:
+    intervals: a list of (start, end) tuples.
+
+  Returns:
+    length: the total length of the union of the intervals.
+  """
+  length, current_start, current_end = 0, None, None
+  for start, end in sorted(intervals):
+    if current_end is None or start > current_end:
+      if current_end is not None:
+        length += current_end - current_start
+      current_start, current_end = start, end
+    else:
+      current_end = max(current_end, end)
+  if current_end is not None:
+    length += current_end - current_start
+  return length
+
+
+class StepPhaseTimingHook(tf.train.SessionRunHook):
+  """Periodically traces a training step and splits it into phases."""
+
+  def __init__(self, output_dir, every_n_steps=1000, save_timeline=True):
+    """Initializes the hook.
+
+    Args:
+      output_dir: `string`, the directory to save the summaries and the
+        Chrome-trace files to.
+      every_n_steps: trace one step every this many steps.
+      save_timeline: if true, save `timeline-{global_step}.json` in the
+        Chrome-trace format for each traced step.
+    """
+    self._output_dir = output_dir
+    self._save_timeline = save_timeline
+    self._timer = tf.train.SecondOrStepTimer(every_steps=every_n_steps)
+    self._global_step_tensor = None
+    self._op_phases = None
+    self._next_step = None
+    self._request_trace = False
+    self._start_time = None
+
+  def begin(self):
+    self._global_step_tensor = tf.train.get_or_create_global_step()
+    if self._global_step_tensor is None:
+      raise RuntimeError(
+          "Global step should be created to use StepPhaseTimingHook.")
+    self._op_phases = dict((op.name, _get_phase(op))
+                           for op in tf.get_default_graph().get_operations())
+    self._next_step = None
+
+  def before_run(self, run_context):
+    self._request_trace = (
+        self._next_step is not None and
+        self._timer.should_trigger_for_step(self._next_step))
+    options = None
+    if self._request_trace:
+      options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+    self._start_time = time.time()
+    return tf.train.SessionRunArgs(
+        {"global_step": self._global_step_tensor}, options=options)
+
+  def after_run(self, run_context, run_values):
+    step_time = time.time() - self._start_time
+
+    stale_global_step = run_values.results["global_step"]
+    if self._next_step is None:
+      self._timer.update_last_triggered_step(stale_global_step)
+    global_step = stale_global_step + 1
+
+    if self._request_trace:
+      self._timer.update_last_triggered_step(global_step)
+      step_stats = run_values.run_metadata.step_stats
+      self._write_phase_summaries(global_step, step_time, step_stats)
+      if self._save_timeline:
+        self._write_timeline(global_step, step_stats)
+    self._next_step = global_step + 1
+
+  def _write_phase_summaries(self, global_step, step_time, step_stats):
+    """Writes the time of each phase of the traced step as summaries.
+
+    Args:
+      global_step: the global step of the traced step.
+      step_time: wall time of the traced step, in seconds.
+      step_stats: a StepStats proto of the traced step.
+    """
+    intervals = dict((phase, []) for phase in PHASES)
+    for dev_stats in step_stats.dev_stats:
+      for node_stats in dev_stats.node_stats:
+        phase = self._op_phases.get(node_stats.node_name.split(':')[0])
+        if phase is not None:
+          start = node_stats.all_start_micros
+          intervals[phase].append(
+              (start, start + max(node_stats.all_end_rel_micros, 1)))
+
+    summary = tf.Summary()
+    summary.value.add(tag='step_phase/step_ms', simple_value=step_time * 1e3)
+    phase_ms = {}
+    for phase in PHASES:
+      phase_ms[phase] = _union_length(intervals[phase]) / 1e3
+      summary.value.add(
+          tag='step_phase/{}_ms'.format(phase), simple_value=phase_ms[phase])
+
+    summary_writer = tf.summary.FileWriterCache.get(self._output_dir)
+    summary_writer.add_summary(summary, global_step)
+    tf.logging.info(
+        'Step %i took %.2lf ms: %s.', global_step, step_time * 1e3,
+        ', '.join('%s %.2lf ms' % (phase, phase_ms[phase]) for phase in PHASES))
+
+  def _write_timeline(self, global_step, step_stats):
+    """Writes the Chrome-trace file of the traced step.
+
+    Args:
+      global_step: the global step of the traced step.
+      step_stats: a StepStats proto of the traced step.
+    """
+    filename = os.path.join(self._output_dir,
+                            'timeline-{}.json'.format(global_step))
+    trace = timeline.Timeline(step_stats)
+    with tf.gfile.GFile(filename, 'w') as fid:
+      fid.write(trace.generate_chrome_trace_format())
+    tf.logging.info('Saved the Chrome-trace file to %s.', filename)
+
+  def end(self, session=None):
+    summary_writer = tf.summary.FileWriterCache.get(self._output_dir)
+    summary_writer.flush()
@@ -0,0 +1,70 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import tensorflow as tf
+
+from train import step_phase_timing_hook
+
+
+class StepPhaseTimingHookTest(tf.test.TestCase):
+
+  def test_union_length(self):
+    self.assertEqual(step_phase_timing_hook._union_length([]), 0)
+    self.assertEqual(
+        step_phase_timing_hook._union_length([(0, 10), (5, 15), (20, 25)]),
+        20)
+    self.assertEqual(
+        step_phase_timing_hook._union_length([(20, 25), (0, 30)]), 30)
+
+  def test_phase_fractions(self):
+    output_dir = os.path.join(self.get_temp_dir(), 'step_phase')
+
+    g = tf.Graph()
+    with g.as_default():
+      dataset = tf.data.Dataset.from_tensors(tf.ones([8, 16])).repeat()
+      features = dataset.make_one_shot_iterator().get_next()
+      weights = tf.get_variable('weights', shape=[16, 4])
+      loss = tf.reduce_mean(tf.square(tf.matmul(features, weights)))
+      train_op = tf.train.GradientDescentOptimizer(0.1).minimize(
+          loss, global_step=tf.train.get_or_create_global_step())
+
+      # Every op is classified into one of the phases.
+
+      phases = dict((op.name, step_phase_timing_hook._get_phase(op))
+                    for op in g.get_operations())
+      self.assertEqual(phases[features.op.name], 'input_wait')
+      self.assertEqual(phases[loss.op.name], 'forward')
+      self.assertIn('backward', phases.values())
+      self.assertIn('optimizer', phases.values())
+
+      hook = step_phase_timing_hook.StepPhaseTimingHook(
+          output_dir, every_n_steps=2)
+      with tf.train.MonitoredSession(hooks=[hook]) as sess:
+        for _ in range(5):
+          sess.run(train_op)
+
+    # The phases of the traced steps are written as summaries, each phase
+    # takes a fraction of the step.
+
+    values = {}
+    for filename in tf.gfile.Glob(os.path.join(output_dir, 'events.*')):
+      for event in tf.train.summary_iterator(filename):
+        for value in event.summary.value:
+          values.setdefault(event.step, {})[value.tag] = value.simple_value
+    self.assertTrue(values)
+
+    for step, step_values in values.items():
+      step_ms = step_values['step_phase/step_ms']
+      for phase in step_phase_timing_hook.PHASES:
+        fraction = step_values['step_phase/{}_ms'.format(phase)] / step_ms
+        self.assertGreater(fraction, 0.0)
+        self.assertLessEqual(fraction, 1.0)
+      self.assertTrue(
+          os.path.isfile(
+              os.path.join(output_dir, 'timeline-{}.json'.format(step))))
+
+
+if __name__ == '__main__':
+  tf.test.main()
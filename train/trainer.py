@@ -2,6 +2,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
 import json
 import tensorflow as tf
 
@@ -12,7 +13,11 @@ from protos import model_pb2
 from protos import pipeline_pb2
 
 from core import training_utils
+from core.standard_fields import InputDataFields
 from train.eval_summary_saver_hook import EvalSummarySaverHook
+from train.step_phase_timing_hook import StepPhaseTimingHook
+from train.input_starvation_hook import InputStarvationHook
+from train.graph_construction_report import GraphConstructionReport
 
 
 def _create_model_fn(pipeline_proto, is_chief=True):
@@ -41,8 +46,22 @@ def _create_model_fn(pipeline_proto, is_chief=True):
     is_training = (tf.estimator.ModeKeys.TRAIN == mode)
     tf.logging.info("Current mode is %s, is_training=%s", mode, is_training)
 
-    model = builder.build(pipeline_proto.model, is_training)
-    predictions = model.build_prediction(features)
+    # Monitor the fraction of the batched pixels that are not padding.
+
+    if (InputDataFields.image in features and
+        InputDataFields.image_shape in features):
+      tf.summary.scalar(
+          'input/padding_efficiency',
+          reader.calc_padding_efficiency(features[InputDataFields.image],
+                                         features[InputDataFields.image_shape]))
+
+    report = GraphConstructionReport(
+        pipeline_proto.train_config.graph_construction_report)
+
+    with report.stage('builder.build'):
+      model = builder.build(pipeline_proto.model, is_training)
+    with report.stage('build_prediction'):
+      predictions = model.build_prediction(features)
 
     # Get scaffold and variables_to_train.
 
@@ -51,14 +70,16 @@ def _create_model_fn(pipeline_proto, is_chief=True):
 
     # Compute losses. Note: variables created in build_loss are not trainable.
 
-    losses = model.build_loss(predictions, examples=features)
-    for name, loss in losses.items():
-      tf.losses.add_loss(loss)
-      tf.summary.scalar('loss/' + name, loss)
-    for loss in tf.losses.get_regularization_losses():
-      tf.summary.scalar(
-          "loss/regularization/" + '/'.join(loss.op.name.split('/')[:2]), loss)
-    total_loss = tf.losses.get_total_loss(add_regularization_losses=True)
+    with report.stage('build_loss'):
+      losses = model.build_loss(predictions, examples=features)
+      for name, loss in losses.items():
+        tf.losses.add_loss(loss)
+        tf.summary.scalar('loss/' + name, loss)
+      for loss in tf.losses.get_regularization_losses():
+        tf.summary.scalar(
+            "loss/regularization/" + '/'.join(loss.op.name.split('/')[:2]),
+            loss)
+      total_loss = tf.losses.get_total_loss(add_regularization_losses=True)
 
     train_op = None
     eval_metric_ops = None
@@ -73,78 +94,100 @@ def _create_model_fn(pipeline_proto, is_chief=True):
 
     if tf.estimator.ModeKeys.TRAIN == mode:
 
-      train_config = pipeline_proto.train_config
-
-      # Create the optimizer.
-
-      learning_rate = train_config.learning_rate
-      global_step = tf.train.get_or_create_global_step()
-
-      if train_config.HasField('learning_rate_decay'):
-        learning_rate = tf.train.exponential_decay(
-            learning_rate,
-            global_step,
-            train_config.learning_rate_decay.decay_steps,
-            train_config.learning_rate_decay.decay_rate,
-            staircase=train_config.learning_rate_decay.staircase)
-      tf.summary.scalar('loss/learning_rate', learning_rate)
-
-      optimizer = training_utils.build_optimizer(
-          train_config.optimizer, learning_rate=learning_rate)
-
-      # Setup the replicas_hook for the SyncReplicasOptimizer.
-
-      if train_config.sync_replicas:
-        optimizer = tf.train.SyncReplicasOptimizer(
-            optimizer, replicas_to_aggregate=4)
-        sync_replicas_hook = optimizer.make_session_run_hook(is_chief)
-        training_hooks.append(sync_replicas_hook)
-
-      # Enable MovingAverageOptimizer if specified.
-
-      if train_config.HasField('moving_average_decay'):
-        optimizer = tf.contrib.opt.MovingAverageOptimizer(
-            optimizer, average_decay=train_config.moving_average_decay)
-
-      # Apply gradient multipliers.
-
-      gradient_multipliers = {}
-      for var in variables_to_train:
-        for multiplier in train_config.gradient_multiplier:
-          if var.op.name.startswith(multiplier.scope):
-            if var.op.name in gradient_multipliers:
-              tf.logging.warn('Override gradient multiplier: %s', var.op.name)
-            gradient_multipliers[var.op.name] = multiplier.multiplier
-            tf.logging.info('Set gradient multiplier for %s', var.op.name)
-        tf.logging.info('Variable to train: %s, %s', var.op.name,
-                        var.get_shape())
-      tf.logging.info('Apply gradient multipliers: \n%s',
-                      json.dumps(gradient_multipliers, indent=2))
-
-      def transform_grads_fn(grads):
-        if not gradient_multipliers: 
-          return grads
-        return tf.contrib.training.multiply_gradients(grads,
-                                                      gradient_multipliers)
-
-      # The train_op is required for mode `TRAIN`.
-
-      train_op = tf.contrib.training.create_train_op(
-          total_loss,
-          optimizer,
-          variables_to_train=variables_to_train,
-          transform_grads_fn=transform_grads_fn,
-          summarize_gradients=True)
-
-      if train_config.HasField('moving_average_decay'):
-        scaffold = tf.train.Scaffold(
-            saver=optimizer.swapping_saver(), copy_from_scaffold=scaffold)
+      with report.stage('optimizer'):
+        train_config = pipeline_proto.train_config
+
+        # Create the optimizer.
+
+        learning_rate = train_config.learning_rate
+        global_step = tf.train.get_or_create_global_step()
+
+        if train_config.HasField('learning_rate_decay'):
+          learning_rate = tf.train.exponential_decay(
+              learning_rate,
+              global_step,
+              train_config.learning_rate_decay.decay_steps,
+              train_config.learning_rate_decay.decay_rate,
+              staircase=train_config.learning_rate_decay.staircase)
+        tf.summary.scalar('loss/learning_rate', learning_rate)
+
+        optimizer = training_utils.build_optimizer(
+            train_config.optimizer, learning_rate=learning_rate)
+
+        # Setup the replicas_hook for the SyncReplicasOptimizer.
+
+        if train_config.sync_replicas:
+          optimizer = tf.train.SyncReplicasOptimizer(
+              optimizer, replicas_to_aggregate=4)
+          sync_replicas_hook = optimizer.make_session_run_hook(is_chief)
+          training_hooks.append(sync_replicas_hook)
+
+        # Enable MovingAverageOptimizer if specified.
+
+        if train_config.HasField('moving_average_decay'):
+          optimizer = tf.contrib.opt.MovingAverageOptimizer(
+              optimizer, average_decay=train_config.moving_average_decay)
+
+        # Apply gradient multipliers.
+
+        gradient_multipliers = {}
+        for var in variables_to_train:
+          for multiplier in train_config.gradient_multiplier:
+            if var.op.name.startswith(multiplier.scope):
+              if var.op.name in gradient_multipliers:
+                tf.logging.warn('Override gradient multiplier: %s', var.op.name)
+              gradient_multipliers[var.op.name] = multiplier.multiplier
+              tf.logging.info('Set gradient multiplier for %s', var.op.name)
+          tf.logging.info('Variable to train: %s, %s', var.op.name,
+                          var.get_shape())
+        tf.logging.info('Apply gradient multipliers: \n%s',
+                        json.dumps(gradient_multipliers, indent=2))
+
+        def transform_grads_fn(grads):
+          if not gradient_multipliers: 
+            return grads
+          return tf.contrib.training.multiply_gradients(grads,
+                                                        gradient_multipliers)
+
+        # The train_op is required for mode `TRAIN`.
+
+        train_op = tf.contrib.training.create_train_op(
+            total_loss,
+            optimizer,
+            variables_to_train=variables_to_train,
+            transform_grads_fn=transform_grads_fn,
+            summarize_gradients=True)
+
+        if train_config.HasField('moving_average_decay'):
+          scaffold = tf.train.Scaffold(
+              saver=optimizer.swapping_saver(), copy_from_scaffold=scaffold)
+
+      # Trace the steps periodically to tell the input-bound from the
+      # compute-bound.
+
+      if is_chief and train_config.step_phase_timing_steps > 0:
+        training_hooks.append(
+            StepPhaseTimingHook(
+                output_dir=pipeline_proto.model_dir,
+                every_n_steps=train_config.step_phase_timing_steps,
+                save_timeline=train_config.save_step_phase_timeline))
+
+      # Warn when the training loop waits on the input for too long.
+
+      if is_chief and train_config.max_input_wait_fraction > 0:
+        training_hooks.append(
+            InputStarvationHook(
+                output_dir=pipeline_proto.model_dir,
+                every_n_steps=train_config.input_starvation_check_steps,
+                max_input_wait_fraction=train_config.max_input_wait_fraction))
 
     elif tf.estimator.ModeKeys.EVAL == mode:
 
       # The eval_metric_ops is optional for mode `EVAL`.
 
-      eval_metric_ops = model.build_evaluation(predictions, examples=features)
+      with report.stage('build_evaluation'):
+        eval_metric_ops = model.build_evaluation(
+            predictions, examples=features)
 
     elif tf.estimator.ModeKeys.PREDICT == mode:
 
@@ -153,6 +196,12 @@ def _create_model_fn(pipeline_proto, is_chief=True):
       predictions.update(features)
       predictions.update({'summary': tf.summary.merge_all()})
 
+    report.write(
+        os.path.join(pipeline_proto.model_dir,
+                     'graph_report_{}.json'.format(mode)),
+        mode=mode,
+        model_type=type(model).__module__)
+
     return tf.estimator.EstimatorSpec(
         mode=mode,
         predictions=predictions,
@@ -180,6 +229,10 @@ def create_train_and_evaluate(pipeline_proto):
   # Create train_spec.
 
   train_config = pipeline_proto.train_config
+  if (train_config.max_input_wait_fraction > 0 and
+      not pipeline_proto.train_reader.enable_stats):
+    raise ValueError('max_input_wait_fraction requires '
+                     'train_reader.enable_stats.')
   train_input_fn = reader.get_input_fn(pipeline_proto.train_reader)
 
   train_spec = tf.estimator.TrainSpec(